@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Freecloud 续费脚本的性能基准。
+
+    python freecloud_bench.py startup    # 导入耗时与首个请求发出前的启动耗时
+    python freecloud_bench.py e2e        # 针对本地模拟站点的端到端基准（登录 → 查询 → 续费）
+    python freecloud_bench.py extract    # 页面解析微基准（大页面上与旧的多次扫描方式对比）
+    python freecloud_bench.py replay --cassette run.jsonl.gz  # 离线回放录制的运行，并解析其中的全部页面
+"""
+
+import io
+import os
+import re
+import sys
+import tempfile
+import contextlib
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RENEWER_SCRIPT = os.path.join(SCRIPT_DIR, "freecloud_renewer.py")
+
+# ===================== 启动耗时 =====================
+_IMPORTTIME_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+def measure_import_time(module="freecloud_renewer"):
+    """
+    用 python -X importtime 测量导入模块的累计耗时（毫秒），
+    返回 (总耗时, [(自身耗时, 模块名), ...] 按自身耗时降序)。
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SCRIPT_DIR, capture_output=True, text=True, check=True
+    )
+    parsed = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            parsed.append((int(self_us), int(cumulative_us), len(indent), name))
+
+    # 输出为后序：目标模块之前、缩进更深的连续行都是它导入的子模块（解释器启动时的 site 导入不计入）
+    index = max(i for i, entry in enumerate(parsed) if entry[3] == module)
+    total_us, depth = parsed[index][1], parsed[index][2]
+    entries = [(parsed[index][0] / 1000, module)]
+    for self_us, _, indent, name in reversed(parsed[:index]):
+        if indent <= depth:
+            break
+        entries.append((self_us / 1000, name))
+    entries.sort(reverse=True)
+    return total_us / 1000, entries
+
+class _FirstRequestHandler(BaseHTTPRequestHandler):
+    """记录第一个请求到达的时间，并返回一个空页面"""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            if server.first_request_at is None:
+                server.first_request_at = time.perf_counter()
+        body = b"<html></html>"
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 测到首个请求后进程已被结束
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+def measure_first_request(timeout=30):
+    """
+    启动一次完整的续费脚本进程（指向本地 HTTP 服务），测量从进程启动到第一个请求到达的耗时（毫秒）。
+    测到后立即结束进程，不会访问真实站点。
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FirstRequestHandler)
+    server.lock = threading.Lock()
+    server.first_request_at = None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    env = dict(os.environ)
+    env.update({
+        "FC_BASE_URL": f"http://127.0.0.1:{server.server_port}",
+        "FC_USERNAME": "bench",
+        "FC_PASSWORD": "bench",
+        "FC_MACHINE_ID": "bench",
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "bench",
+        "FC_PACING_PROFILE": "fast",
+        "FC_SESSION_CACHE": "false",
+        "FC_HISTORY": "false",
+        "FC_STATE_DIR": os.path.join(SCRIPT_DIR, ".freecloud_state", "bench"),
+    })
+    env.pop("FC_ACCOUNTS", None)
+    env.pop("FC_ACCOUNTS_FILE", None)
+
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, RENEWER_SCRIPT], cwd=SCRIPT_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = started + timeout
+        while server.first_request_at is None and time.perf_counter() < deadline:
+            if process.poll() is not None:
+                break
+            time.sleep(0.002)
+    finally:
+        process.kill()
+        process.wait()
+        server.shutdown()
+    if server.first_request_at is None:
+        raise RuntimeError("续费脚本没有发出任何请求")
+    return (server.first_request_at - started) * 1000
+
+def run_startup(args):
+    """启动耗时基准，超出预算时返回非零退出码"""
+    import_times = []
+    slowest = []
+    for _ in range(args.runs):
+        total, entries = measure_import_time()
+        import_times.append(total)
+        slowest = entries
+    first_request_times = [measure_first_request() for _ in range(args.runs)]
+
+    report = {
+        "import_ms": round(statistics.median(import_times), 1),
+        "first_request_ms": round(statistics.median(first_request_times), 1),
+        "runs": args.runs,
+    }
+    print(f"导入 freecloud_renewer:   中位数 {report['import_ms']:.1f} ms (预算 {args.max_import_ms} ms)")
+    print(f"启动到首个请求:           中位数 {report['first_request_ms']:.1f} ms (预算 {args.max_first_request_ms} ms)")
+    print("导入自身耗时最多的模块:")
+    for self_ms, name in slowest[:args.top]:
+        print(f"  {self_ms:8.2f} ms  {name}")
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+
+    failed = False
+    if report["import_ms"] > args.max_import_ms:
+        print(f"❌ 导入耗时超出预算: {report['import_ms']} ms > {args.max_import_ms} ms")
+        failed = True
+    if report["first_request_ms"] > args.max_first_request_ms:
+        print(f"❌ 首个请求耗时超出预算: {report['first_request_ms']} ms > {args.max_first_request_ms} ms")
+        failed = True
+    return 1 if failed else 0
+
+# ===================== 端到端基准 =====================
+def _load_renewer(base_url, state_dir, pacing_profile):
+    """
+    按基准所需的环境变量导入续费脚本模块。
+    续费脚本在导入时读取配置，因此必须先启动模拟站点再导入。
+    """
+    os.environ.update({
+        "FC_BASE_URL": base_url,
+        "FC_TELEGRAM_API": base_url,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "bench",
+        "FC_PACING_PROFILE": pacing_profile,
+        "FC_SESSION_CACHE": "false",
+        "FC_HISTORY": "false",  # 每次运行都要真正走完网络流程
+        "FC_RENEW_LEDGER_MINUTES": "0",  # 每次运行前模拟站点都会重置，不能沿用上一次运行的续费结果
+        "FC_STATE_DIR": state_dir,
+    })
+    sys.path.insert(0, SCRIPT_DIR)
+    import freecloud_renewer
+    return freecloud_renewer
+
+def _parse_int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def run_e2e(args):
+    """
+    在本地模拟站点上按"账户数 × 每账户服务器数"的组合运行完整流程
+    （login_session → get_server_info → renew_server_instance，经由批量模式），
+    统计每次运行的耗时、请求数和传输字节数。
+    """
+    from freecloud_mock_server import MockFreecloudServer, make_accounts
+
+    server = MockFreecloudServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    renewer = _load_renewer(server.base_url, tempfile.mkdtemp(prefix="fc-bench-"), args.pacing)
+
+    results = []
+    for account_count in _parse_int_list(args.accounts):
+        for machine_count in _parse_int_list(args.machines):
+            runs = []
+            for _ in range(args.repeat):
+                accounts = make_accounts(account_count, machine_count)
+                server.configure(accounts, args.latency_ms, args.latency_jitter_ms, args.error_rate, args.page_size)
+                fleet = [{"username": u, "password": a["password"], "machine_ids": list(a["machines"])}
+                         for u, a in accounts.items()]
+                started = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    fleet_results = renewer.run_fleet(fleet)
+                    elapsed = time.perf_counter() - started
+                    # 通知在后台发送且受 Telegram 限速约束，不计入续费流程耗时
+                    renewer.flush_notifications(wait_for_delivery=True)
+                stats = server.snapshot_stats()
+                telegram = stats["paths"].get("telegram", 0)
+                runs.append({
+                    "wall_s": elapsed,
+                    "requests": stats["requests"] - telegram,
+                    "telegram": telegram,
+                    "bytes_out": stats["bytes_out"],
+                    "bytes_in": stats["bytes_in"],
+                    "renewed": sum(1 for r in fleet_results.values() for item in r if item["renewed"]),
+                    "failed": sum(1 for r in fleet_results.values() for item in r if not item["ok"]),
+                })
+            median = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+            median.update({"accounts": account_count, "machines": machine_count})
+            results.append(median)
+
+    server.shutdown()
+    print(f"{'账户':>4} {'服务器/账户':>10} {'耗时(s)':>8} {'请求数':>6} {'请求/服务器':>10} "
+          f"{'下行KB':>8} {'上行KB':>7} {'续费':>4} {'失败':>4} {'TG消息':>6}")
+    for r in results:
+        total_machines = r["accounts"] * r["machines"]
+        print(f"{r['accounts']:>4} {r['machines']:>10} {r['wall_s']:>8.3f} {r['requests']:>6.0f} "
+              f"{r['requests'] / total_machines:>10.2f} {r['bytes_out'] / 1024:>8.1f} {r['bytes_in'] / 1024:>7.1f} "
+              f"{r['renewed']:>4.0f} {r['failed']:>4.0f} {r['telegram']:>6.0f}")
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False))
+    return 0
+
+# ===================== 页面解析微基准 =====================
+# 以下是引入 extract_page() 之前 freecloud_renewer.py 中的实现，原样保留（去掉日志）作为对照
+_BASELINE_ROW_RE = re.compile(r'<tr\b.*?</tr>', re.S | re.I)
+_BASELINE_DETAIL_LINK_RE = re.compile(r'/server/detail/([A-Za-z0-9_-]+)')
+_BASELINE_DAYS_LEFT_RE = re.compile(r'(\d+)天后')
+_BASELINE_STATUS_RE = re.compile(r'(运行中|已停止|已关机|已暂停|已过期|已到期|创建中|running|stopped|suspended|expired)', re.I)
+_BASELINE_PAGE_LINK_RE = re.compile(r'[?&]page=(\d+)')
+
+def _baseline_captcha(page_content):
+    """get_math_captcha_solution() 中的验证码匹配"""
+    match = re.search(r'placeholder="([0-9]+)\s*([+\-*/])\s*([0-9]+)\s*=\s*\?"', page_content)
+    if not match:
+        match = re.search(r'placeholder=["\']([0-9]+)\s*([+*/\-])\s*([0-9]+)\s*=\s*\?["\']', page_content)
+    return match.groups() if match else None
+
+def _baseline_login_state(html, username=None):
+    """console_login_state()"""
+    lowered = html.lower()
+    if username and username.lower() in lowered:
+        return "user"
+    if "logout" in lowered or "退出登录" in html:
+        return "logout"
+    if "验证码" in html or "重新登录" in html:
+        return "failed"
+    return None
+
+def _baseline_inventory(html, machine_ids=None):
+    """parse_server_inventory()"""
+    inventory = {}
+    for row in _BASELINE_ROW_RE.finditer(html):
+        row_html = row.group(0)
+        link = _BASELINE_DETAIL_LINK_RE.search(row_html)
+        if not link:
+            continue
+        id_sn = link.group(1)
+        if id_sn in inventory:
+            continue
+        days = _BASELINE_DAYS_LEFT_RE.search(row_html)
+        status = _BASELINE_STATUS_RE.search(row_html)
+        inventory[id_sn] = {
+            "id_sn": id_sn,
+            "remaining_days": int(days.group(1)) if days else None,
+            "status": status.group(1) if status else None,
+            "detail_url": f"/server/detail/{id_sn}",
+        }
+
+    for machine_id in machine_ids or []:
+        machine_id = str(machine_id)
+        if machine_id in inventory:
+            continue
+        idx = html.find(machine_id)
+        if idx == -1:
+            continue
+        days = _BASELINE_DAYS_LEFT_RE.search(html, max(0, idx - 500), idx + 500)
+        if days:
+            inventory[machine_id] = {"id_sn": machine_id, "remaining_days": int(days.group(1)),
+                                     "status": None, "detail_url": f"/server/detail/{machine_id}"}
+    return inventory
+
+def _baseline_last_page(html):
+    """fetch_server_inventory() 中的分页页码"""
+    return max((int(p) for p in _BASELINE_PAGE_LINK_RE.findall(html)), default=1)
+
+def make_synthetic_pages(rows, padding_kb):
+    """生成带大量无关内容的登录页和服务器列表页"""
+    filler = "".join(f'<div class="news"><p>公告 {i}: 维护通知与说明文字 lorem ipsum</p></div>'
+                     for i in range(padding_kb * 1024 // 60))
+    login = (f'<html><head><meta name="csrf-token" content="tok"></head><body>{filler}'
+             '<form method="post"><input type="hidden" name="_token" value="abc123">'
+             '<input name="username"><input name="password" type="password">'
+             '<input name="math_captcha" placeholder="17 * 23 = ?"><label>验证码</label></form>'
+             f'{filler}</body></html>')
+    table = "".join(f'<tr><td>bench{i:05d}</td><td>运行中</td><td>到期: {i % 30}天后</td>'
+                    f'<td><a href="/server/detail/bench{i:05d}">管理</a></td></tr>' for i in range(rows))
+    console = (f'<html><body><nav><span class="user">BenchUser</span><a href="/logout">退出登录</a></nav>'
+               f'{filler}<table>{table}</table><div class="pager"><a href="/server/lxc?page=2">2</a></div>'
+               f'{filler}</body></html>')
+    return login, console, [f"bench{i:05d}" for i in range(rows)]
+
+def _best_of(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def run_extract(args):
+    """
+    在大页面上比较 extract_page() 与引入它之前的实现（_baseline_*）完成同一件事的耗时。
+    登录页另外列出新增的表单字段提取，旧实现没有这一步。
+    """
+    sys.path.insert(0, SCRIPT_DIR)
+    import freecloud_renewer
+
+    login, console, machine_ids = make_synthetic_pages(args.rows, args.padding_kb)
+    targets = machine_ids[::max(1, len(machine_ids) // args.targets)][:args.targets]
+
+    new = freecloud_renewer.extract_page(console, "benchuser")
+    assert new.login_state == _baseline_login_state(console, "benchuser")
+    assert new.last_page == _baseline_last_page(console)
+    baseline = _baseline_inventory(console, targets)
+    assert all(new.servers[m]["remaining_days"] == baseline[m]["remaining_days"] == i % 30
+               for i, m in enumerate(machine_ids))
+    assert freecloud_renewer.extract_page(login).captcha[1] == 17 * 23
+
+    def single_console():
+        page = freecloud_renewer.extract_page(console, "benchuser")
+        return page.login_state, page.servers, page.last_page
+
+    cases = [
+        ("登录页：验证码", len(login),
+         lambda: _baseline_captcha(login),
+         lambda: freecloud_renewer.extract_page(login).captcha),
+        ("登录页：验证码 + 表单字段（新增）", len(login),
+         None,
+         lambda: (lambda page: (page.captcha, page.form_tokens))(freecloud_renewer.extract_page(login))),
+        (f"列表页：登录状态 + 服务器列表（{len(targets)} 台目标）", len(console),
+         lambda: (_baseline_login_state(console, "benchuser"), _baseline_inventory(console, targets),
+                  _baseline_last_page(console)),
+         single_console),
+    ]
+    report = []
+    print(f"{'场景':<36} {'大小KB':>8} {'旧实现(ms)':>11} {'extract_page(ms)':>17}")
+    for name, size, legacy, single in cases:
+        legacy_ms = _best_of(legacy, args.repeat) if legacy else None
+        single_ms = _best_of(single, args.repeat)
+        report.append({"page": name, "kb": round(size / 1024, 1),
+                       "legacy_ms": round(legacy_ms, 3) if legacy else None,
+                       "single_pass_ms": round(single_ms, 3)})
+        legacy_text = f"{legacy_ms:.3f}" if legacy else "-"
+        print(f"{name:<36} {size / 1024:>8.1f} {legacy_text:>11} {single_ms:>17.3f}")
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    return 0
+
+# ===================== 录制回放基准 =====================
+def run_replay(args):
+    """
+    用录制的请求与响应代替网络，重复运行完整流程（main），与录制时的网络耗时对比；
+    再对记录中的每个页面做一次解析，得到真实页面上的解析耗时。
+    账户与服务器沿用环境变量（FC_USERNAME / FC_MACHINE_ID 或 FC_ACCOUNTS），须与录制时一致。
+    """
+    os.environ.update({
+        "FC_CASSETTE_MODE": "replay",
+        "FC_CASSETTE": os.path.abspath(args.cassette),
+        "FC_STATE_DIR": tempfile.mkdtemp(prefix="fc-bench-"),
+        "FC_TRACE_SUMMARY": "false",
+        "FC_RUN_DEADLINE": "0",
+    })
+    if args.username:
+        os.environ["FC_USERNAME"] = args.username
+    if args.machines:
+        os.environ["FC_MACHINE_ID"] = args.machines
+    os.environ.setdefault("FC_PASSWORD", "replay")  # 记录中的密码已被遮盖，回放不需要真实密码
+    sys.path.insert(0, SCRIPT_DIR)
+    import freecloud_renewer
+
+    entries = freecloud_renewer.load_cassette(args.cassette)
+    runs = []
+    for _ in range(args.repeat):
+        # 每次运行重新读入记录，并丢弃上一次运行的会话
+        freecloud_renewer._cassette = None
+        freecloud_renewer._transports.clear()
+        freecloud_renewer.TRACER.reset()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            freecloud_renewer.main()
+        cassette = freecloud_renewer._cassette
+        runs.append({"wall_s": time.perf_counter() - started,
+                     "played": cassette.played if cassette else 0,
+                     "misses": cassette.misses if cassette else 0})
+
+    pages = [e["response"]["text"] for e in entries
+             if "text" in e.get("response", {}) and "<" in e["response"]["text"][:200]]
+
+    def parse_all():
+        for html in pages:
+            page = freecloud_renewer.extract_page(html, os.environ.get("FC_USERNAME"))
+            page.login_state, page.servers, page.captcha, page.form_tokens, page.days_left
+
+    report = {
+        "exchanges": len(entries),
+        "recorded_network_s": round(sum(e.get("elapsed", 0) for e in entries), 3),
+        "replay_wall_s": round(statistics.median(run["wall_s"] for run in runs), 4),
+        "played": statistics.median(run["played"] for run in runs),
+        "misses": max(run["misses"] for run in runs),
+        "pages": len(pages),
+        "pages_kb": round(sum(len(html.encode("utf-8")) for html in pages) / 1024, 1),
+        "parse_ms": round(_best_of(parse_all, args.repeat), 3),
+    }
+    print(f"记录中的请求: {report['exchanges']}（录制时网络耗时合计 {report['recorded_network_s']:.3f} 秒）")
+    print(f"回放完整流程: {report['replay_wall_s'] * 1000:.1f} ms（中位数，{args.repeat} 次），"
+          f"回放 {report['played']:.0f} 条，未命中 {report['misses']} 次")
+    print(f"解析全部 {report['pages']} 个页面（{report['pages_kb']} KB）: {report['parse_ms']:.3f} ms（最快一次）")
+    if report["misses"]:
+        print("⚠️ 回放过程中有请求在记录中找不到，流程与录制时不一致（配置不同或代码行为已改变）")
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    return 1 if report["misses"] and args.strict else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Freecloud 续费脚本性能基准")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    startup = subparsers.add_parser("startup", help="导入耗时与首个请求前的启动耗时")
+    startup.add_argument("--runs", type=int, default=5, help="重复次数，取中位数")
+    startup.add_argument("--max-import-ms", type=float, default=60, help="导入耗时预算")
+    startup.add_argument("--max-first-request-ms", type=float, default=800, help="启动到首个请求的耗时预算")
+    startup.add_argument("--top", type=int, default=10, help="列出自身耗时最多的模块数量")
+    startup.add_argument("--json", action="store_true", help="额外输出一行JSON结果")
+    startup.set_defaults(func=run_startup)
+
+    e2e = subparsers.add_parser("e2e", help="针对本地模拟站点的端到端基准")
+    e2e.add_argument("--accounts", default="1,4", help="账户数列表，逗号分隔")
+    e2e.add_argument("--machines", default="1,10,100", help="每个账户的服务器数列表，逗号分隔")
+    e2e.add_argument("--repeat", type=int, default=3, help="每个组合的重复次数，取中位数")
+    e2e.add_argument("--latency-ms", type=float, default=20, help="模拟站点每个请求的固定延迟")
+    e2e.add_argument("--latency-jitter-ms", type=float, default=10, help="模拟站点每个请求额外的随机延迟上限")
+    e2e.add_argument("--error-rate", type=float, default=0.0, help="模拟站点返回 503 的概率")
+    e2e.add_argument("--page-size", type=int, default=50, help="服务器列表每页行数")
+    e2e.add_argument("--pacing", default="fast", help="续费脚本使用的节奏方案")
+    e2e.add_argument("--json", action="store_true", help="额外输出一行JSON结果")
+    e2e.set_defaults(func=run_e2e)
+
+    extract = subparsers.add_parser("extract", help="页面解析微基准")
+    extract.add_argument("--rows", type=int, default=2000, help="服务器列表页的行数")
+    extract.add_argument("--padding-kb", type=int, default=512, help="页面中无关内容的大小（KB，前后各一份）")
+    extract.add_argument("--targets", type=int, default=10, help="旧实现在列表行之外额外查找的目标服务器数量")
+    extract.add_argument("--repeat", type=int, default=5, help="重复次数，取最快一次")
+    extract.add_argument("--json", action="store_true", help="额外输出一行JSON结果")
+    extract.set_defaults(func=run_extract)
+
+    replay = subparsers.add_parser("replay", help="离线回放录制的运行与页面解析")
+    replay.add_argument("--cassette", required=True, help="FC_CASSETTE_MODE=record 时写出的记录文件")
+    replay.add_argument("--username", help="录制时的账户（默认取 FC_USERNAME）")
+    replay.add_argument("--machines", help="录制时的服务器 ID，逗号分隔（默认取 FC_MACHINE_ID）")
+    replay.add_argument("--repeat", type=int, default=5, help="重复次数")
+    replay.add_argument("--strict", action="store_true", help="有请求未命中记录时以非零状态退出")
+    replay.add_argument("--json", action="store_true", help="额外输出一行JSON结果")
+    replay.set_defaults(func=run_replay)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
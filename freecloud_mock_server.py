@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟的 Freecloud 站点，用于离线压测和端到端基准，不会访问真实网站。
+
+模拟的页面：/、/login（含数学验证码 placeholder）、/server/lxc（支持分页和 ETag 条件请求）、
+/server/detail/{id}、/server/detail/{id}/renew，以及 Telegram 的 /bot{token}/sendMessage。
+
+    python freecloud_mock_server.py --port 8080 --accounts 2 --machines 20 --latency-ms 50 --error-rate 0.05
+
+启动后把 FC_BASE_URL 和 FC_TELEGRAM_API 指向 http://127.0.0.1:8080 即可运行续费脚本。
+"""
+
+import re
+import sys
+import json
+import time
+import hashlib
+import random
+import secrets
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_DETAIL_RE = re.compile(r'^/server/detail/([A-Za-z0-9_-]+)(/renew)?$')
+_TELEGRAM_RE = re.compile(r'^/bot[^/]+/sendMessage$')
+
+def make_accounts(account_count, machines_per_account, password="mock-pass"):
+    """
+    生成模拟账户：{用户名: {"password", "machines": {id_sn: 剩余天数}}}。
+    剩余天数在 0~29 之间循环分布，约有十分之一的服务器低于默认续费阈值。
+    """
+    accounts = {}
+    for a in range(account_count):
+        machines = {f"mock{a:03d}x{m:04d}": (m * 7 + a) % 30 for m in range(machines_per_account)}
+        accounts[f"mockuser{a:03d}"] = {"password": password, "machines": machines}
+    return accounts
+
+class MockFreecloudServer(ThreadingHTTPServer):
+    """
+    模拟站点的服务端状态：账户与服务器、登录会话、延迟/错误率配置以及请求统计。
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), accounts=None, latency_ms=0, latency_jitter_ms=0,
+                 error_rate=0.0, page_size=50):
+        super().__init__(address, MockFreecloudHandler)
+        self.lock = threading.Lock()
+        self.configure(accounts or {}, latency_ms, latency_jitter_ms, error_rate, page_size)
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def configure(self, accounts, latency_ms=0, latency_jitter_ms=0, error_rate=0.0, page_size=50):
+        """重新设置模拟数据并清空会话和统计"""
+        with self.lock:
+            self.accounts = accounts
+            self.latency_ms = latency_ms
+            self.latency_jitter_ms = latency_jitter_ms
+            self.error_rate = error_rate
+            self.page_size = page_size
+            self.sessions = {}  # 会话ID -> {"captcha": 答案, "user": 已登录用户名}
+            self.telegram_messages = []
+            self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"requests": 0, "bytes_in": 0, "bytes_out": 0, "errors": 0, "paths": {}}
+
+    def record(self, path_key, bytes_in, bytes_out, error=False):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes_in"] += bytes_in
+            self.stats["bytes_out"] += bytes_out
+            self.stats["errors"] += int(error)
+            self.stats["paths"][path_key] = self.stats["paths"].get(path_key, 0) + 1
+
+    def snapshot_stats(self):
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+class MockFreecloudHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    # ---------- 工具方法 ----------
+    def _session(self):
+        """读取或创建模拟会话，返回 (会话ID, 会话数据, 是否新建)"""
+        cookies = dict(
+            part.strip().split("=", 1) for part in (self.headers.get("Cookie") or "").split(";") if "=" in part
+        )
+        sid = cookies.get("mock_session")
+        with self.server.lock:
+            if sid and sid in self.server.sessions:
+                return sid, self.server.sessions[sid], False
+            sid = secrets.token_hex(16)
+            self.server.sessions[sid] = {"captcha": None, "user": None}
+            return sid, self.server.sessions[sid], True
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8", headers=None, path_key=None,
+              bytes_in=0):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端流式读取时可能提前断开
+        self.server.record(path_key or self.path, bytes_in, len(data), error=status >= 500)
+
+    def _delay_and_maybe_fail(self, path_key, bytes_in):
+        """模拟网络延迟与服务端错误，返回 True 表示已经返回了错误响应"""
+        server = self.server
+        delay = server.latency_ms + random.uniform(0, server.latency_jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if server.error_rate and random.random() < server.error_rate:
+            self._send(503, "<html>Service Unavailable</html>", path_key=path_key, bytes_in=bytes_in)
+            return True
+        return False
+
+    def _read_form(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length).decode("utf-8") if length else ""
+        return {k: v[0] for k, v in parse_qs(raw, keep_blank_values=True).items()}, length
+
+    # ---------- 路由 ----------
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path
+        path_key = "detail" if _DETAIL_RE.match(path) else path
+        if self._delay_and_maybe_fail(path_key, 0):
+            return
+        sid, session, created = self._session()
+        cookie = {"Set-Cookie": f"mock_session={sid}; Path=/; HttpOnly"} if created else {}
+
+        if path == "/":
+            self._send(200, self._page("首页", '<a href="/login">登录</a>'), headers=cookie, path_key=path_key)
+        elif path == "/login":
+            num1, num2 = random.randint(1, 20), random.randint(1, 20)
+            operator = random.choice("+-*")
+            session["captcha"] = {"+": num1 + num2, "-": num1 - num2, "*": num1 * num2}[operator]
+            form = (
+                '<form method="post" action="/login">'
+                f'<input type="hidden" name="_token" value="{secrets.token_hex(8)}">'
+                '<input name="username"><input name="password" type="password">'
+                f'<input name="math_captcha" placeholder="{num1} {operator} {num2} = ?">'
+                '<label>验证码</label><input type="checkbox" name="agree" value="1">'
+                '<button type="submit">登录</button></form>'
+            )
+            self._send(200, self._page("登录", form), headers=cookie, path_key=path_key)
+        elif path == "/server/lxc":
+            if not session["user"]:
+                self._send(302, "", headers={**cookie, "Location": "/login"}, path_key=path_key)
+                return
+            page = int(parse_qs(url.query).get("page", ["1"])[0])
+            body = self._listing(session["user"], page)
+            # 列表页支持条件请求：内容未变化时返回 304
+            etag = f'"{hashlib.md5(body.encode("utf-8")).hexdigest()[:16]}"'
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, "", headers={**cookie, "ETag": etag}, path_key=path_key)
+                return
+            self._send(200, body, headers={**cookie, "ETag": etag}, path_key=path_key)
+        elif _DETAIL_RE.match(path) and not _DETAIL_RE.match(path).group(2):
+            id_sn = _DETAIL_RE.match(path).group(1)
+            days = self._machine_days(session["user"], id_sn)
+            if days is None:
+                self._send(404, self._page("未找到", "服务器不存在"), headers=cookie, path_key=path_key)
+                return
+            body = (
+                f'<div class="server" data-id="{id_sn}">编号: {id_sn} 状态: 运行中 到期: {days}天后</div>'
+                '<form id="renew"><select name="month">'
+                '<option value="1">1个月</option><option value="3">3个月</option>'
+                '<option value="6">6个月</option><option value="12">12个月</option>'
+                '</select><button>续费</button></form>'
+            )
+            self._send(200, self._page("服务器详情", body, session["user"]), headers=cookie, path_key=path_key)
+        else:
+            self._send(404, self._page("未找到", path), headers=cookie, path_key=path_key)
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        form, bytes_in = self._read_form()
+        if _TELEGRAM_RE.match(path):
+            with self.server.lock:
+                self.server.telegram_messages.append(form.get("text", ""))
+            self._send(200, '{"ok":true}', "application/json", path_key="telegram", bytes_in=bytes_in)
+            return
+        match = _DETAIL_RE.match(path)
+        path_key = "renew" if match else path
+        if self._delay_and_maybe_fail(path_key, bytes_in):
+            return
+        sid, session, created = self._session()
+        cookie = {"Set-Cookie": f"mock_session={sid}; Path=/; HttpOnly"} if created else {}
+
+        if path == "/login":
+            account = self.server.accounts.get(form.get("username"))
+            answer = session.get("captcha")
+            if (account and account["password"] == form.get("password")
+                    and answer is not None and form.get("math_captcha") == str(answer)):
+                session["user"] = form["username"]
+                self._send(200, self._page("欢迎回来", "登录成功", session["user"]), headers=cookie,
+                           path_key=path_key, bytes_in=bytes_in)
+            else:
+                self._send(200, self._page("登录", "验证码错误，请重新登录"), headers=cookie,
+                           path_key=path_key, bytes_in=bytes_in)
+        elif match and match.group(2):
+            id_sn = match.group(1)
+            if self._machine_days(session["user"], id_sn) is None:
+                body = {"code": 1, "msg": "服务器不存在或未登录"}
+            else:
+                months = int(form.get("month") or 1)
+                with self.server.lock:
+                    self.server.accounts[session["user"]]["machines"][id_sn] += 30 * months
+                body = {"code": 0, "msg": f"续费成功，已续费 {months} 个月"}
+            self._send(200, json.dumps(body, ensure_ascii=False), "application/json", headers=cookie,
+                       path_key=path_key, bytes_in=bytes_in)
+        else:
+            self._send(404, self._page("未找到", path), headers=cookie, path_key=path_key, bytes_in=bytes_in)
+
+    # ---------- 页面 ----------
+    def _machine_days(self, username, id_sn):
+        if not username:
+            return None
+        return self.server.accounts.get(username, {}).get("machines", {}).get(id_sn)
+
+    def _page(self, title, content, username=None):
+        nav = (f'<span class="user">{username}</span> <a href="/logout">退出登录</a>' if username
+               else '<a href="/login">登录</a>')
+        return f'<html><head><title>{title}</title></head><body><nav>{nav}</nav>{content}</body></html>'
+
+    def _listing(self, username, page):
+        machines = sorted(self.server.accounts[username]["machines"].items())
+        page_size = self.server.page_size
+        pages = max(1, (len(machines) + page_size - 1) // page_size)
+        rows = "".join(
+            f'<tr><td>{id_sn}</td><td>运行中</td><td>到期: {days}天后</td>'
+            f'<td><a href="/server/detail/{id_sn}">管理</a></td></tr>'
+            for id_sn, days in machines[(page - 1) * page_size:page * page_size]
+        )
+        pager = "".join(f'<a href="/server/lxc?page={p}">{p}</a>' for p in range(1, pages + 1)) if pages > 1 else ""
+        return self._page("服务器列表", f'<table>{rows}</table><div class="pager">{pager}</div>', username)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地模拟 Freecloud 站点")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--accounts", type=int, default=1, help="模拟账户数")
+    parser.add_argument("--machines", type=int, default=5, help="每个账户的服务器数")
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个请求的固定延迟")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0, help="每个请求额外的随机延迟上限")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的概率")
+    parser.add_argument("--page-size", type=int, default=50, help="服务器列表每页行数")
+    args = parser.parse_args(argv)
+
+    accounts = make_accounts(args.accounts, args.machines)
+    server = MockFreecloudServer((args.host, args.port), accounts, args.latency_ms, args.latency_jitter_ms,
+                                 args.error_rate, args.page_size)
+    fleet = [{"username": u, "password": a["password"], "machine_ids": list(a["machines"])}
+             for u, a in accounts.items()]
+    print(f"模拟站点已启动: {server.base_url}")
+    print(f"FC_BASE_URL={server.base_url}")
+    print(f"FC_TELEGRAM_API={server.base_url}")
+    print(f"FC_ACCOUNTS='{json.dumps(fleet)}'")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.snapshot_stats(), ensure_ascii=False))
+
+if __name__ == "__main__":
+    sys.exit(main())
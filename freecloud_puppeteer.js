@@ -8,6 +8,22 @@ const FC_PASSWORD = process.env.FC_PASSWORD;
 const FC_MACHINE_ID = process.env.FC_MACHINE_ID;
 const TELEGRAM_BOT_TOKEN = process.env.TELEGRAM_BOT_TOKEN;
 const TELEGRAM_CHAT_ID = process.env.TELEGRAM_CHAT_ID;
+const BASE_URL = (process.env.FC_BASE_URL || 'https://freecloud.ltd').replace(/\/+$/, '');
+
+// --json：作为 Python 续费脚本的浏览器后端运行，从 stdin 逐行读取 JSON 指令，向 stdout 逐行输出 JSON 结果
+const JSON_MODE = process.argv.includes('--json');
+if (JSON_MODE) {
+  // stdout 只留给协议输出，日志改写到 stderr
+  console.log = (...args) => console.error(...args);
+}
+
+// 精简模式：拦截图片、字体、样式表和媒体，按表单选择器等待而不是等网络空闲，省去调试截图和逐条响应日志。
+// --json 模式默认开启，单独运行时用 --lean 或 FC_BROWSER_LEAN=true 开启
+const LEAN_MODE = process.argv.includes('--lean') ||
+  (process.env.FC_BROWSER_LEAN || (JSON_MODE ? 'true' : 'false')).toLowerCase() === 'true';
+const WAIT_UNTIL = LEAN_MODE ? 'domcontentloaded' : 'networkidle2';
+const NAVIGATION_TIMEOUT = LEAN_MODE ? 30000 : 60000;
+const BLOCKED_RESOURCES = new Set(['image', 'font', 'stylesheet', 'media']);
 
 // 随机延迟函数
 const randomDelay = async (min = 1000, max = 3000) => {
@@ -42,383 +58,473 @@ const sendTelegramMessage = async (message) => {
   }
 };
 
-// 主函数
-(async () => {
-  console.log('启动浏览器...');
-  const browser = await puppeteer.launch({
-    headless: true,
-    args: [
-      '--no-sandbox',
-      '--disable-setuid-sandbox',
-      '--disable-dev-shm-usage',
-      '--disable-accelerated-2d-canvas',
-      '--disable-gpu',
-      '--window-size=1920,1080',
-      '--disable-web-security',
-    ]
-  });
+// 启动浏览器
+const launchBrowser = async () => {
+  console.log(`启动浏览器${LEAN_MODE ? '（精简模式）' : ''}...`);
+  const args = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-accelerated-2d-canvas',
+    '--disable-gpu',
+    LEAN_MODE ? '--window-size=1280,800' : '--window-size=1920,1080',
+    '--disable-web-security',
+  ];
+  if (LEAN_MODE) {
+    args.push(
+      '--blink-settings=imagesEnabled=false',
+      '--disable-extensions',
+      '--disable-background-networking',
+      '--disable-component-update',
+      '--disable-default-apps',
+      '--disable-sync',
+      '--mute-audio',
+      '--no-first-run',
+    );
+  }
+  return puppeteer.launch({ headless: true, args });
+};
+
+// 为每个账户创建独立的浏览器上下文（独立的 cookie 和缓存），共用同一个浏览器进程
+const newContext = async (browser) => {
+  // puppeteer 22 起改名为 createBrowserContext
+  return browser.createBrowserContext ? browser.createBrowserContext() : browser.createIncognitoBrowserContext();
+};
+
+// 调试截图，精简模式下省略
+const debugScreenshot = async (page, path) => {
+  if (!LEAN_MODE) {
+    await page.screenshot({ path });
+  }
+};
+
+// 跳转到页面；精简模式下只等到 DOM 就绪，再等待后续要用到的元素出现
+const gotoPage = async (page, url, selector) => {
+  await page.goto(url, { waitUntil: WAIT_UNTIL, timeout: NAVIGATION_TIMEOUT });
+  if (LEAN_MODE && selector) {
+    await page.waitForSelector(selector, { timeout: 10000 }).catch(() => {});
+  }
+};
+
+// 打开并设置新页面，target 为浏览器或浏览器上下文
+const newPage = async (target) => {
+  const page = await target.newPage();
   
-  try {
-    const page = await browser.newPage();
-    
-    // 设置视窗大小
-    await page.setViewport({ width: 1920, height: 1080 });
+  // 设置视窗大小
+  await page.setViewport(LEAN_MODE ? { width: 1280, height: 800 } : { width: 1920, height: 1080 });
+  
+  if (LEAN_MODE) {
+    // 拦截流程中用不到的资源
+    await page.setRequestInterception(true);
+    page.on('request', (request) => {
+      if (request.isInterceptResolutionHandled && request.isInterceptResolutionHandled()) return;
+      if (BLOCKED_RESOURCES.has(request.resourceType())) {
+        request.abort();
+      } else {
+        request.continue();
+      }
+    });
+  }
+  
+  // 设置用户代理
+  await page.setUserAgent('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36');
+  
+  // 绕过WebDriver检测
+  await page.evaluateOnNewDocument(() => {
+    delete navigator.__proto__.webdriver;
     
-    // 设置用户代理
-    await page.setUserAgent('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36');
+    // 添加Chrome浏览器特性
+    window.chrome = {
+      runtime: {},
+      loadTimes: function() {},
+      csi: function() {},
+      app: {
+        isInstalled: false,
+      },
+    };
     
-    // 绕过WebDriver检测
-    await page.evaluateOnNewDocument(() => {
-      delete navigator.__proto__.webdriver;
-      
-      // 添加Chrome浏览器特性
-      window.chrome = {
-        runtime: {},
-        loadTimes: function() {},
-        csi: function() {},
-        app: {
-          isInstalled: false,
-        },
-      };
-      
-      // 添加语言和平台特性
-      Object.defineProperty(navigator, 'languages', {
-        get: () => ['zh-CN', 'zh', 'en-US', 'en'],
-      });
-      
-      Object.defineProperty(navigator, 'plugins', {
-        get: () => [
-          {
-            0: {type: 'application/x-google-chrome-pdf'},
-            description: 'Portable Document Format',
-            filename: 'internal-pdf-viewer',
-            length: 1,
-            name: 'Chrome PDF Plugin'
-          }
-        ],
-      });
+    // 添加语言和平台特性
+    Object.defineProperty(navigator, 'languages', {
+      get: () => ['zh-CN', 'zh', 'en-US', 'en'],
     });
     
-    // 监听请求以便调试
-    page.on('response', async (response) => {
-      const url = response.url();
-      if (url.includes('freecloud.ltd')) {
-        console.log(`响应 ${response.status()} 来自: ${url}`);
-        
-        // 保存页面的额外调试信息
-        if (response.status() === 403) {
-          const headers = response.headers();
-          console.log('收到403状态，响应头:', headers);
-          if (headers['cf-mitigated']) {
-            console.log('cf-mitigated:', headers['cf-mitigated']);
-          }
+    Object.defineProperty(navigator, 'plugins', {
+      get: () => [
+        {
+          0: {type: 'application/x-google-chrome-pdf'},
+          description: 'Portable Document Format',
+          filename: 'internal-pdf-viewer',
+          length: 1,
+          name: 'Chrome PDF Plugin'
         }
-      }
+      ],
     });
-    
-    // 截取控制台日志
+  });
+  
+  // 监听请求以便调试（精简模式下只记录出错的页面请求）
+  page.on('response', async (response) => {
+    const url = response.url();
+    if (LEAN_MODE && (response.status() < 400 || response.request().resourceType() !== 'document')) return;
+    if (url.startsWith(BASE_URL)) {
+      console.log(`响应 ${response.status()} 来自: ${url}`);
+      
+      // 保存页面的额外调试信息
+      if (response.status() === 403) {
+        const headers = response.headers();
+        console.log('收到403状态，响应头:', headers);
+        if (headers['cf-mitigated']) {
+          console.log('cf-mitigated:', headers['cf-mitigated']);
+        }
+      }
+    }
+  });
+  
+  // 截取控制台日志
+  if (!LEAN_MODE) {
     page.on('console', msg => console.log('浏览器控制台:', msg.text()));
-    
-    console.log('访问登录页面...');
+  }
+  
+  return page;
+};
+
+// 登录，返回是否成功；找不到登录表单时抛出 code 为 NO_LOGIN_FORM 的错误
+const login = async (page, username, password) => {
+  console.log('访问登录页面...');
+  try {
+    await page.goto(`${BASE_URL}/login`, { 
+      waitUntil: WAIT_UNTIL,
+      timeout: NAVIGATION_TIMEOUT 
+    });
+  } catch (error) {
+    console.log('访问登录页面超时或错误:', error.message);
+    console.log('尝试继续...');
+  }
+  
+  // 等待页面加载完成，检查是否存在Cloudflare挑战
+  console.log('检查是否存在Cloudflare挑战...');
+  const isChallengePresent = await page.evaluate(() => {
+    return document.body.textContent.includes('Checking your browser') || 
+           document.body.textContent.includes('正在检查您的浏览器') ||
+           document.title.includes('Cloudflare') ||
+           document.querySelector('div[class*="cf-"]') !== null;
+  });
+  
+  if (isChallengePresent) {
+    console.log('检测到Cloudflare挑战，等待挑战完成...');
     try {
-      await page.goto('https://freecloud.ltd/login', { 
-        waitUntil: 'networkidle2',
-        timeout: 60000 
-      });
+      await page.waitForFunction(
+        () => !document.body.textContent.includes('Checking your browser') && 
+              !document.body.textContent.includes('正在检查您的浏览器') && 
+              !document.title.includes('Cloudflare'),
+        { timeout: 30000 }
+      );
+      console.log('Cloudflare挑战已通过');
     } catch (error) {
-      console.log('访问登录页面超时或错误:', error.message);
-      console.log('尝试继续...');
-    }
-    
-    // 等待页面加载完成，检查是否存在Cloudflare挑战
-    console.log('检查是否存在Cloudflare挑战...');
-    const isChallengePresent = await page.evaluate(() => {
-      return document.body.textContent.includes('Checking your browser') || 
-             document.body.textContent.includes('正在检查您的浏览器') ||
-             document.title.includes('Cloudflare') ||
-             document.querySelector('div[class*="cf-"]') !== null;
-    });
-    
-    if (isChallengePresent) {
-      console.log('检测到Cloudflare挑战，等待挑战完成...');
-      try {
-        await page.waitForFunction(
-          () => !document.body.textContent.includes('Checking your browser') && 
-                !document.body.textContent.includes('正在检查您的浏览器') && 
-                !document.title.includes('Cloudflare'),
-          { timeout: 30000 }
-        );
-        console.log('Cloudflare挑战已通过');
-      } catch (error) {
-        console.log('等待Cloudflare挑战通过超时:', error.message);
-        
-        // 保存页面截图和HTML以便调试
-        await page.screenshot({ path: 'cloudflare_challenge.png' });
-        const pageContent = await page.content();
-        console.log('页面内容片段:', pageContent.substring(0, 500) + '...');
-        
-        console.log('尝试继续执行...');
-      }
+      console.log('等待Cloudflare挑战通过超时:', error.message);
+      
+      // 保存页面截图和HTML以便调试
+      await page.screenshot({ path: 'cloudflare_challenge.png' });
+      const pageContent = await page.content();
+      console.log('页面内容片段:', pageContent.substring(0, 500) + '...');
+      
+      console.log('尝试继续执行...');
     }
-    
-    // 确认我们已经在登录页面
-    console.log('确认已进入登录页面...');
+  }
+  
+  // 确认我们已经在登录页面
+  console.log('确认已进入登录页面...');
+  try {
+    await page.waitForSelector('input[name="username"]', { timeout: 10000 });
+  } catch (error) {
+    console.log('未找到登录表单，尝试手动导航到登录页...');
     try {
+      await page.goto(`${BASE_URL}/login`, { waitUntil: WAIT_UNTIL, timeout: NAVIGATION_TIMEOUT });
       await page.waitForSelector('input[name="username"]', { timeout: 10000 });
-    } catch (error) {
-      console.log('未找到登录表单，尝试手动导航到登录页...');
-      try {
-        await page.goto('https://freecloud.ltd/login', { waitUntil: 'networkidle2' });
-        await page.waitForSelector('input[name="username"]', { timeout: 10000 });
-      } catch (retryError) {
-        console.log('二次尝试后仍未找到登录表单:', retryError.message);
-        
-        // 保存页面截图以便调试
-        await page.screenshot({ path: 'login_page_error.png' });
-        
-        // 发送Telegram通知
-        await sendTelegramMessage('❌ 浏览器自动化失败: 无法访问登录页面或找不到登录表单');
-        return;
-      }
+    } catch (retryError) {
+      console.log('二次尝试后仍未找到登录表单:', retryError.message);
+      
+      // 保存页面截图以便调试
+      await page.screenshot({ path: 'login_page_error.png' });
+      
+      const formError = new Error('无法访问登录页面或找不到登录表单');
+      formError.code = 'NO_LOGIN_FORM';
+      throw formError;
     }
+  }
+  
+  // 随机延迟，模拟人类行为
+  await randomDelay();
+  
+  // 查找并处理数学验证码
+  console.log('查找数学验证码...');
+  const mathCaptchaElement = await page.$('input[name="math_captcha"]');
+  let mathAnswer = '';
+  
+  if (mathCaptchaElement) {
+    console.log('找到数学验证码输入框，尝试解析验证码问题...');
+    const placeholder = await page.evaluate(el => el.getAttribute('placeholder'), mathCaptchaElement);
+    console.log(`验证码问题: ${placeholder}`);
     
-    // 随机延迟，模拟人类行为
-    await randomDelay();
-    
-    // 查找并处理数学验证码
-    console.log('查找数学验证码...');
-    const mathCaptchaElement = await page.$('input[name="math_captcha"]');
-    let mathAnswer = '';
-    
-    if (mathCaptchaElement) {
-      console.log('找到数学验证码输入框，尝试解析验证码问题...');
-      const placeholder = await page.evaluate(el => el.getAttribute('placeholder'), mathCaptchaElement);
-      console.log(`验证码问题: ${placeholder}`);
+    // 解析数学问题
+    const match = placeholder.match(/(\d+)\s*([+\-*/])\s*(\d+)\s*=\s*\?/);
+    if (match) {
+      const num1 = parseInt(match[1]);
+      const operator = match[2];
+      const num2 = parseInt(match[3]);
       
-      // 解析数学问题
-      const match = placeholder.match(/(\d+)\s*([+\-*/])\s*(\d+)\s*=\s*\?/);
-      if (match) {
-        const num1 = parseInt(match[1]);
-        const operator = match[2];
-        const num2 = parseInt(match[3]);
-        
-        // 计算答案
-        if (operator === '+') {
-          mathAnswer = num1 + num2;
-        } else if (operator === '-') {
-          mathAnswer = num1 - num2;
-        } else if (operator === '*') {
-          mathAnswer = num1 * num2;
-        } else if (operator === '/') {
-          mathAnswer = Math.floor(num1 / num2);
-        }
-        
-        console.log(`验证码答案: ${mathAnswer}`);
-      } else {
-        console.log('无法解析数学验证码问题');
+      // 计算答案
+      if (operator === '+') {
+        mathAnswer = num1 + num2;
+      } else if (operator === '-') {
+        mathAnswer = num1 - num2;
+      } else if (operator === '*') {
+        mathAnswer = num1 * num2;
+      } else if (operator === '/') {
+        mathAnswer = Math.floor(num1 / num2);
       }
+      
+      console.log(`验证码答案: ${mathAnswer}`);
     } else {
-      console.log('未找到数学验证码输入框');
-    }
-    
-    // 获取CSRF令牌
-    const csrfToken = await page.evaluate(() => {
-      const tokenInput = document.querySelector('input[name="_token"]');
-      return tokenInput ? tokenInput.value : '';
-    });
-    
-    if (csrfToken) {
-      console.log(`找到CSRF令牌: ${csrfToken.substring(0, 10)}...`);
-    } else {
-      console.log('未找到CSRF令牌');
+      console.log('无法解析数学验证码问题');
     }
-    
-    // 填写登录表单
-    console.log('填写登录表单...');
-    await page.type('input[name="username"]', FC_USERNAME);
+  } else {
+    console.log('未找到数学验证码输入框');
+  }
+  
+  // 获取CSRF令牌
+  const csrfToken = await page.evaluate(() => {
+    const tokenInput = document.querySelector('input[name="_token"]');
+    return tokenInput ? tokenInput.value : '';
+  });
+  
+  if (csrfToken) {
+    console.log(`找到CSRF令牌: ${csrfToken.substring(0, 10)}...`);
+  } else {
+    console.log('未找到CSRF令牌');
+  }
+  
+  // 填写登录表单
+  console.log('填写登录表单...');
+  await page.type('input[name="username"]', username);
+  await randomDelay(500, 1500);
+  await page.type('input[name="password"]', password);
+  
+  // 如果找到了数学验证码答案，填入
+  if (mathAnswer) {
     await randomDelay(500, 1500);
-    await page.type('input[name="password"]', FC_PASSWORD);
-    
-    // 如果找到了数学验证码答案，填入
-    if (mathAnswer) {
-      await randomDelay(500, 1500);
-      await page.type('input[name="math_captcha"]', mathAnswer.toString());
+    await page.type('input[name="math_captcha"]', mathAnswer.toString());
+  }
+  
+  // 确保同意条款被选中
+  await randomDelay(500, 1000);
+  const agreeCheckbox = await page.$('input[name="agree"]');
+  if (agreeCheckbox) {
+    const isChecked = await page.evaluate(el => el.checked, agreeCheckbox);
+    if (!isChecked) {
+      await page.click('input[name="agree"]');
     }
-    
-    // 确保同意条款被选中
-    await randomDelay(500, 1000);
-    const agreeCheckbox = await page.$('input[name="agree"]');
-    if (agreeCheckbox) {
-      const isChecked = await page.evaluate(el => el.checked, agreeCheckbox);
-      if (!isChecked) {
-        await page.click('input[name="agree"]');
-      }
+  }
+  
+  // 提交表单
+  console.log('提交登录表单...');
+  await randomDelay(1000, 2000);
+  
+  // 点击登录按钮
+  try {
+    await Promise.all([
+      page.click('button[type="submit"]'),
+      page.waitForNavigation({ waitUntil: WAIT_UNTIL, timeout: NAVIGATION_TIMEOUT })
+    ]);
+  } catch (error) {
+    console.log('等待导航超时，继续执行:', error.message);
+  }
+  
+  // 保存登录后页面的截图
+  await debugScreenshot(page, 'after_login.png');
+  
+  // 检查是否登录成功
+  console.log('检查登录状态...');
+  const isLoggedIn = await page.evaluate(() => {
+    return document.body.textContent.includes('退出登录') || 
+           document.body.textContent.includes('logout') || 
+           document.body.textContent.includes('欢迎回来');
+  });
+  
+  return isLoggedIn;
+};
+
+// 单独运行时处理的账户：FC_ACCOUNTS（与 Python 脚本的格式相同），或 FC_USERNAME / FC_PASSWORD / FC_MACHINE_ID
+const loadAccounts = () => {
+  if (!process.env.FC_ACCOUNTS) {
+    return [{ username: FC_USERNAME, password: FC_PASSWORD, machineIds: [FC_MACHINE_ID] }];
+  }
+  return JSON.parse(process.env.FC_ACCOUNTS).map((entry) => {
+    let machineIds = entry.machine_ids || entry.machine_id || [];
+    if (typeof machineIds === 'string') {
+      machineIds = machineIds.split(',').map(id => id.trim()).filter(Boolean);
     }
-    
-    // 提交表单
-    console.log('提交登录表单...');
-    await randomDelay(1000, 2000);
-    
-    // 点击登录按钮
+    return { username: entry.username, password: entry.password, machineIds: machineIds.map(String) };
+  });
+};
+
+// 检查单台服务器，剩余天数不足时续费
+const checkMachine = async (page, machineId) => {
+    // 访问服务器列表页面
+    console.log('访问服务器列表页面...');
     try {
-      await Promise.all([
-        page.click('button[type="submit"]'),
-        page.waitForNavigation({ waitUntil: 'networkidle2', timeout: 60000 })
-      ]);
+      await gotoPage(page, `${BASE_URL}/server/lxc`, 'a[href*="/server/detail/"]');
     } catch (error) {
-      console.log('等待导航超时，继续执行:', error.message);
+      console.log('访问服务器列表页面超时:', error.message);
     }
     
-    // 保存登录后页面的截图
-    await page.screenshot({ path: 'after_login.png' });
+    // 保存页面内容以便调试
+    await debugScreenshot(page, 'server_list_page.png');
     
-    // 检查是否登录成功
-    console.log('检查登录状态...');
-    const isLoggedIn = await page.evaluate(() => {
-      return document.body.textContent.includes('退出登录') || 
-             document.body.textContent.includes('logout') || 
-             document.body.textContent.includes('欢迎回来');
-    });
+    // 查找服务器信息
+    console.log(`查找服务器ID: ${machineId}...`);
     
-    if (isLoggedIn) {
-      console.log('登录成功！');
+    // 获取页面内容
+    const pageContent = await page.content();
+    
+    // 使用正则表达式查找剩余天数
+    const regex = new RegExp(`${machineId}[\\s\\S]*?([0-9]+)天后`, 'i');
+    const match = pageContent.match(regex);
+    
+    if (match) {
+      const daysLeft = parseInt(match[1]);
+      console.log(`服务器 ${machineId} 剩余 ${daysLeft} 天`);
       
-      // 访问服务器列表页面
-      console.log('访问服务器列表页面...');
-      try {
-        await page.goto('https://freecloud.ltd/server/lxc', { 
-          waitUntil: 'networkidle2',
-          timeout: 30000 
+      // 判断是否需要续费
+      if (daysLeft < 3) {
+        console.log('剩余天数少于3天，需要续费');
+        
+        // 访问服务器详情页
+        console.log('访问服务器详情页...');
+        try {
+          await gotoPage(page, `${BASE_URL}/server/detail/${machineId}`, 'button');
+        } catch (error) {
+          console.log('访问服务器详情页超时:', error.message);
+        }
+        
+        await randomDelay();
+        
+        // 查找并点击续费按钮
+        console.log('查找续费按钮...');
+        const renewButton = await page.evaluateHandle(() => {
+          // 查找包含"续费"文本的按钮
+          const buttons = Array.from(document.querySelectorAll('button'));
+          const renewButton = buttons.find(btn => 
+            btn.textContent.includes('续费') || 
+            btn.textContent.includes('renew')
+          );
+          
+          return renewButton || null;
         });
-      } catch (error) {
-        console.log('访问服务器列表页面超时:', error.message);
-      }
-      
-      // 保存页面内容以便调试
-      await page.screenshot({ path: 'server_list_page.png' });
-      
-      // 查找服务器信息
-      console.log(`查找服务器ID: ${FC_MACHINE_ID}...`);
-      
-      // 获取页面内容
-      const pageContent = await page.content();
-      
-      // 使用正则表达式查找剩余天数
-      const regex = new RegExp(`${FC_MACHINE_ID}[\\s\\S]*?([0-9]+)天后`, 'i');
-      const match = pageContent.match(regex);
-      
-      if (match) {
-        const daysLeft = parseInt(match[1]);
-        console.log(`服务器 ${FC_MACHINE_ID} 剩余 ${daysLeft} 天`);
         
-        // 判断是否需要续费
-        if (daysLeft < 3) {
-          console.log('剩余天数少于3天，需要续费');
+        if (renewButton) {
+          console.log('找到续费按钮，点击...');
+          await renewButton.click();
           
-          // 访问服务器详情页
-          console.log('访问服务器详情页...');
+          // 等待续费对话框出现
           try {
-            await page.goto(`https://freecloud.ltd/server/detail/${FC_MACHINE_ID}`, { 
-              waitUntil: 'networkidle2',
-              timeout: 30000 
-            });
+            await page.waitForFunction(() => {
+              return document.body.textContent.includes('续费时长') || 
+                     document.body.textContent.includes('Renewal Period');
+            }, { timeout: 10000 });
           } catch (error) {
-            console.log('访问服务器详情页超时:', error.message);
+            console.log('等待续费对话框超时:', error.message);
           }
           
           await randomDelay();
           
-          // 查找并点击续费按钮
-          console.log('查找续费按钮...');
-          const renewButton = await page.evaluateHandle(() => {
-            // 查找包含"续费"文本的按钮
+          // 选择1个月的续费时长
+          console.log('选择1个月续费时长...');
+          await page.evaluate(() => {
+            // 查找并选择1个月选项
+            const monthInputs = Array.from(document.querySelectorAll('input[name="month"]'));
+            const oneMonthInput = monthInputs.find(input => input.value === '1');
+            if (oneMonthInput && !oneMonthInput.checked) {
+              oneMonthInput.click();
+            }
+          });
+          
+          await randomDelay();
+          
+          // 查找并点击确认按钮
+          console.log('查找确认按钮...');
+          const confirmButton = await page.evaluateHandle(() => {
+            // 查找包含"确认"或"确定"文本的按钮
             const buttons = Array.from(document.querySelectorAll('button'));
-            const renewButton = buttons.find(btn => 
-              btn.textContent.includes('续费') || 
-              btn.textContent.includes('renew')
+            const confirmButton = buttons.find(btn => 
+              btn.textContent.includes('确认') || 
+              btn.textContent.includes('确定') ||
+              btn.textContent.includes('Confirm')
             );
             
-            return renewButton || null;
+            return confirmButton || null;
           });
           
-          if (renewButton) {
-            console.log('找到续费按钮，点击...');
-            await renewButton.click();
-            
-            // 等待续费对话框出现
-            try {
-              await page.waitForFunction(() => {
-                return document.body.textContent.includes('续费时长') || 
-                       document.body.textContent.includes('Renewal Period');
-              }, { timeout: 10000 });
-            } catch (error) {
-              console.log('等待续费对话框超时:', error.message);
-            }
-            
-            await randomDelay();
+          if (confirmButton) {
+            console.log('找到确认按钮，点击...');
+            await confirmButton.click();
+            await page.waitForTimeout(5000);
             
-            // 选择1个月的续费时长
-            console.log('选择1个月续费时长...');
-            await page.evaluate(() => {
-              // 查找并选择1个月选项
-              const monthInputs = Array.from(document.querySelectorAll('input[name="month"]'));
-              const oneMonthInput = monthInputs.find(input => input.value === '1');
-              if (oneMonthInput && !oneMonthInput.checked) {
-                oneMonthInput.click();
-              }
-            });
-            
-            await randomDelay();
+            console.log('续费操作已提交');
             
-            // 查找并点击确认按钮
-            console.log('查找确认按钮...');
-            const confirmButton = await page.evaluateHandle(() => {
-              // 查找包含"确认"或"确定"文本的按钮
-              const buttons = Array.from(document.querySelectorAll('button'));
-              const confirmButton = buttons.find(btn => 
-                btn.textContent.includes('确认') || 
-                btn.textContent.includes('确定') ||
-                btn.textContent.includes('Confirm')
-              );
-              
-              return confirmButton || null;
+            // 检查续费是否成功
+            const renewalSuccess = await page.evaluate(() => {
+              return document.body.textContent.includes('成功') || 
+                     document.body.textContent.includes('success');
             });
             
-            if (confirmButton) {
-              console.log('找到确认按钮，点击...');
-              await confirmButton.click();
-              await page.waitForTimeout(5000);
-              
-              console.log('续费操作已提交');
-              
-              // 检查续费是否成功
-              const renewalSuccess = await page.evaluate(() => {
-                return document.body.textContent.includes('成功') || 
-                       document.body.textContent.includes('success');
-              });
-              
-              if (renewalSuccess) {
-                console.log('续费成功！');
-                await sendTelegramMessage(`✅ 浏览器自动化: 服务器 ${FC_MACHINE_ID} 续费成功！原剩余: ${daysLeft} 天。`);
-              } else {
-                console.log('可能续费失败');
-                await sendTelegramMessage(`⚠️ 浏览器自动化: 服务器 ${FC_MACHINE_ID} 续费操作已提交，但结果不确定。请手动检查。原剩余: ${daysLeft} 天。`);
-              }
+            if (renewalSuccess) {
+              console.log('续费成功！');
+              await sendTelegramMessage(`✅ 浏览器自动化: 服务器 ${machineId} 续费成功！原剩余: ${daysLeft} 天。`);
             } else {
-              console.log('未找到确认按钮');
-              await sendTelegramMessage(`❓ 浏览器自动化: 服务器 ${FC_MACHINE_ID} 找不到续费确认按钮。请手动续费。剩余: ${daysLeft} 天。`);
+              console.log('可能续费失败');
+              await sendTelegramMessage(`⚠️ 浏览器自动化: 服务器 ${machineId} 续费操作已提交，但结果不确定。请手动检查。原剩余: ${daysLeft} 天。`);
             }
           } else {
-            console.log('未找到续费按钮');
-            await sendTelegramMessage(`❓ 浏览器自动化: 服务器 ${FC_MACHINE_ID} 找不到续费按钮。请手动续费。剩余: ${daysLeft} 天。`);
+            console.log('未找到确认按钮');
+            await sendTelegramMessage(`❓ 浏览器自动化: 服务器 ${machineId} 找不到续费确认按钮。请手动续费。剩余: ${daysLeft} 天。`);
           }
         } else {
-          console.log(`剩余天数为 ${daysLeft} 天，无需续费`);
-          await sendTelegramMessage(`ℹ️ 浏览器自动化: 服务器 ${FC_MACHINE_ID} 剩余 ${daysLeft} 天，无需续费。`);
+          console.log('未找到续费按钮');
+          await sendTelegramMessage(`❓ 浏览器自动化: 服务器 ${machineId} 找不到续费按钮。请手动续费。剩余: ${daysLeft} 天。`);
         }
       } else {
-        console.log(`未能找到服务器 ${FC_MACHINE_ID} 的剩余天数信息`);
-        await sendTelegramMessage(`⚠️ 浏览器自动化: 未能找到服务器 ${FC_MACHINE_ID} 的信息，无法续费。`);
+        console.log(`剩余天数为 ${daysLeft} 天，无需续费`);
+        await sendTelegramMessage(`ℹ️ 浏览器自动化: 服务器 ${machineId} 剩余 ${daysLeft} 天，无需续费。`);
+      }
+    } else {
+      console.log(`未能找到服务器 ${machineId} 的剩余天数信息`);
+      await sendTelegramMessage(`⚠️ 浏览器自动化: 未能找到服务器 ${machineId} 的信息，无法续费。`);
+    }
+};
+
+// 在独立的浏览器上下文中登录一个账户并检查它的所有服务器
+const runAccount = async (browser, account) => {
+  const context = await newContext(browser);
+  
+  try {
+    const page = await newPage(context);
+    
+    let isLoggedIn;
+    try {
+      isLoggedIn = await login(page, account.username, account.password);
+    } catch (error) {
+      if (error.code !== 'NO_LOGIN_FORM') {
+        throw error;
+      }
+      // 发送Telegram通知
+      await sendTelegramMessage('❌ 浏览器自动化失败: 无法访问登录页面或找不到登录表单');
+      return;
+    }
+    
+    if (isLoggedIn) {
+      console.log('登录成功！');
+      for (const machineId of account.machineIds) {
+        await checkMachine(page, machineId);
       }
     } else {
       console.log('登录失败');
@@ -428,11 +534,168 @@ const sendTelegramMessage = async (message) => {
       
       await sendTelegramMessage(`🔴 浏览器自动化: 登录Freecloud失败，无法续费。`);
     }
-  } catch (error) {
-    console.error('浏览器自动化过程中发生错误:', error);
-    await sendTelegramMessage(`❌ 浏览器自动化: 过程中发生错误: ${error.message}`);
+  } finally {
+    await context.close();
+  }
+};
+
+// 单独运行：所有账户共用一个浏览器，依次登录并检查/续费
+const runStandalone = async () => {
+  const browser = await launchBrowser();
+  
+  try {
+    for (const account of loadAccounts()) {
+      try {
+        await runAccount(browser, account);
+      } catch (error) {
+        console.error('浏览器自动化过程中发生错误:', error);
+        await sendTelegramMessage(`❌ 浏览器自动化: 过程中发生错误: ${error.message}`);
+      }
+    }
   } finally {
     await browser.close();
     console.log('浏览器已关闭');
   }
-})(); 
+};
+
+// ===================== JSON 后端模式 =====================
+// 读取服务器列表：以详情页链接所在的表格行为单位
+const listServers = async (page) => {
+  await gotoPage(page, `${BASE_URL}/server/lxc`, 'a[href*="/server/detail/"]');
+  return page.evaluate(() => {
+    const servers = [];
+    const seen = new Set();
+    for (const row of document.querySelectorAll('tr')) {
+      const link = row.querySelector('a[href*="/server/detail/"]');
+      if (!link) continue;
+      const match = link.getAttribute('href').match(/\/server\/detail\/([A-Za-z0-9_-]+)/);
+      if (!match || seen.has(match[1])) continue;
+      seen.add(match[1]);
+      const days = row.textContent.match(/(\d+)天后/);
+      servers.push({ id_sn: match[1], remaining_days: days ? parseInt(days[1]) : null });
+    }
+    return servers;
+  });
+};
+
+// 读取详情页上的剩余天数
+const detailDays = async (page, idSn) => {
+  await gotoPage(page, `${BASE_URL}/server/detail/${idSn}`);
+  const match = (await page.content()).match(/(\d+)天后/);
+  return match ? parseInt(match[1]) : null;
+};
+
+// 在详情页内以浏览器自身的 cookie 提交与 HTTP 方式相同的续费请求；
+// 续费月数取表单选项中不超过 month 的最大值，没有选项时续费 1 个月；
+// 所有选项都超过 month 时不提交（续费会扣余额，不能续更长的时间）
+const renewServer = async (page, idSn, month) => {
+  await gotoPage(page, `${BASE_URL}/server/detail/${idSn}`);
+  const wanted = parseInt(month) || 1;
+  const { chosen, shortest } = await page.evaluate((wanted) => {
+    const options = Array.from(document.querySelectorAll('select[name="month"] option, input[name="month"]'))
+      .map(el => parseInt(el.value))
+      .filter(value => value > 0);
+    if (!options.length) return { chosen: 1, shortest: null };
+    const allowed = options.filter(value => value <= wanted);
+    return { chosen: allowed.length ? Math.max(...allowed) : null, shortest: Math.min(...options) };
+  }, wanted);
+  if (chosen === null) {
+    return { ok: false, message: `续费表单最短 ${shortest} 个月，超过允许的 ${wanted} 个月（FC_RENEW_MONTHS），未提交续费。` };
+  }
+  await randomDelay();
+  return page.evaluate(async (url, month) => {
+    const response = await fetch(url, {
+      method: 'POST',
+      body: new URLSearchParams({ month, submit: '1', coupon_id: '0' }),
+      headers: { 'X-Requested-With': 'XMLHttpRequest' },
+      credentials: 'same-origin',
+    });
+    const text = await response.text();
+    try {
+      const result = JSON.parse(text);
+      return { ok: result.code === 0, message: result.msg || '' };
+    } catch (error) {
+      return { ok: /success|成功/i.test(text), message: text.substring(0, 200) };
+    }
+  }, `${BASE_URL}/server/detail/${idSn}/renew`, String(chosen));
+};
+
+// 每个账户一个浏览器上下文和页面，首次使用时创建
+const sessions = new Map();
+
+const accountPage = async (browser, account) => {
+  if (!sessions.has(account)) {
+    sessions.set(account, newContext(browser).then(async context => ({ context, page: await newPage(context) })));
+  }
+  return (await sessions.get(account)).page;
+};
+
+const closeAccount = async (account) => {
+  const session = sessions.get(account);
+  sessions.delete(account);
+  if (session) {
+    await (await session).context.close();
+  }
+};
+
+const handleCommand = async (browser, command) => {
+  const account = command.account || '';
+  switch (command.op) {
+    case 'login':
+      return { ok: await login(await accountPage(browser, account), command.username, command.password) };
+    case 'list':
+      return { ok: true, servers: await listServers(await accountPage(browser, account)) };
+    case 'detail':
+      return { ok: true, days_left: await detailDays(await accountPage(browser, account), command.id_sn) };
+    case 'renew':
+      return renewServer(await accountPage(browser, account), command.id_sn, command.month);
+    case 'close':
+      await closeAccount(account);
+      return { ok: true };
+    default:
+      throw new Error(`未知指令: ${command.op}`);
+  }
+};
+
+// 同一账户的指令依次执行，不同账户的指令并发执行；收到 shutdown 或 stdin 关闭时退出
+const runJsonServer = async () => {
+  const readline = require('readline');
+  const browser = await launchBrowser();
+  const pending = new Map();
+  try {
+    const lines = readline.createInterface({ input: process.stdin });
+    for await (const line of lines) {
+      if (!line.trim()) continue;
+      let command;
+      try {
+        command = JSON.parse(line);
+      } catch (error) {
+        process.stdout.write(JSON.stringify({ ok: false, error: error.message }) + '\n');
+        continue;
+      }
+      if (command.op === 'shutdown') {
+        await Promise.all(pending.values());
+        process.stdout.write(JSON.stringify({ id: command.id, ok: true }) + '\n');
+        break;
+      }
+      const account = command.account || '';
+      const task = (pending.get(account) || Promise.resolve()).then(async () => {
+        let reply;
+        try {
+          reply = await handleCommand(browser, command);
+        } catch (error) {
+          reply = { ok: false, error: error.message };
+        }
+        process.stdout.write(JSON.stringify({ id: command.id, ...reply }) + '\n');
+      });
+      pending.set(account, task);
+    }
+    await Promise.all(pending.values());
+  } finally {
+    await browser.close();
+    console.log('浏览器已关闭');
+  }
+};
+
+// 主函数
+(JSON_MODE ? runJsonServer : runStandalone)();
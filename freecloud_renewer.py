@@ -1,41 +1,171 @@
-import cloudscraper
+import io
 import os
-import requests
 import re
 import json
 import time
 import traceback
 import random
+import hashlib
+import codecs
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import threading
+import queue
+import atexit
+import heapq
+import collections
+import signal
+import importlib
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class _LazyModule:
+    """
+    首次访问属性时才导入的模块代理。
+    cloudscraper / requests 导入较慢，环境变量检查失败等用不到网络的路径不必承担这部分启动时间。
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+requests = _LazyModule("requests")
+cloudscraper = _LazyModule("cloudscraper")
 
 # ===================== Telegram 配置 (从环境变量读取) =====================
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+TELEGRAM_API_URL = os.getenv("FC_TELEGRAM_API", "https://api.telegram.org").rstrip("/")  # 可指向本地模拟服务器
+TELEGRAM_DIGEST = os.getenv("FC_TELEGRAM_DIGEST", "true").lower() == "true"  # 合并一次运行的通知为摘要消息
 
 # ===================== Freecloud 凭证 (从环境变量读取) =====================
 FC_USERNAME = os.getenv("FC_USERNAME")
 FC_PASSWORD = os.getenv("FC_PASSWORD")
-FC_MACHINE_ID = os.getenv("FC_MACHINE_ID")  # 这是您要续费的服务器的 ID (对应 id_sn)
+FC_MACHINE_ID = os.getenv("FC_MACHINE_ID")  # 这是您要续费的服务器的 ID (对应 id_sn)，多台服务器用逗号分隔
+
+# ===================== 多账户批量模式 (可选) =====================
+# FC_ACCOUNTS 为 JSON 列表，或用 FC_ACCOUNTS_FILE 指向同格式的 JSON 文件，例如：
+# [{"username": "a", "password": "x", "machine_ids": ["id1", "id2"]}, ...]
+FC_ACCOUNTS = os.getenv("FC_ACCOUNTS")
+FC_ACCOUNTS_FILE = os.getenv("FC_ACCOUNTS_FILE")
+FLEET_WORKERS = int(os.getenv("FC_FLEET_WORKERS", "4"))  # 同时处理的账户数上限
+ACCOUNT_CONCURRENCY = int(os.getenv("FC_ACCOUNT_CONCURRENCY", "2"))  # 单个账户内同时处理的服务器数上限
+FC_SHARD = os.getenv("FC_SHARD")  # 分片运行：i/N 表示只处理 N 个分片中的第 i 个（从 0 开始），账户按用户名一致性哈希分配
+SHARD_WORKERS = int(os.getenv("FC_SHARD_WORKERS", "0"))  # 大于1时在本机启动这么多个分片进程，结束后合并结果
+
+# ===================== 常驻模式 (可选) =====================
+DAEMON_MIN_INTERVAL_HOURS = float(os.getenv("FC_DAEMON_MIN_INTERVAL_HOURS", "1"))  # 临近阈值时的检查间隔
+DAEMON_MAX_INTERVAL_HOURS = float(os.getenv("FC_DAEMON_MAX_INTERVAL_HOURS", "24"))  # 远离阈值时的检查间隔上限
+DAEMON_INTERVAL_FRACTION = float(os.getenv("FC_DAEMON_INTERVAL_FRACTION", "0.5"))  # 距阈值剩余时间中用于等待的比例
 
 # ===================== 日志和调试 =====================
 DEBUG_MODE = os.getenv("DEBUG_MODE", "False").lower() == "true" # 可选：设置 DEBUG_MODE=True 开启更详细日志
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+LOG_LEVEL = LOG_LEVELS.get(os.getenv("FC_LOG_LEVEL", "DEBUG" if DEBUG_MODE else "INFO").upper(), 20)  # 低于该级别的日志不打印
+LOG_FORMAT = os.getenv("FC_LOG_FORMAT", "text").lower()  # text 为普通文本，json 为每行一条JSON记录
+LOG_BUFFER_SIZE = int(os.getenv("FC_LOG_BUFFER", "2000"))  # 内存中保留的最近日志条数（包括未打印的调试日志），0 表示不保留
+LOG_DUMP_KEEP = int(os.getenv("FC_LOG_DUMP_KEEP", "10"))  # 最多保留的失败日志文件数
 
-def log_message(message, is_debug=False):
-    """打印日志信息"""
-    if is_debug and not DEBUG_MODE:
+_log_context = threading.local()  # 批量模式下为每个线程记录当前账户前缀
+_log_buffer = collections.deque(maxlen=max(1, LOG_BUFFER_SIZE))  # (时间, 级别, 前缀, 账户, 消息, 参数)
+
+def _format_log(message, args):
+    """格式化日志消息：message 为函数时以 args 调用，否则按 % 占位符填充"""
+    try:
+        if callable(message):
+            return str(message(*args))
+        return message % args if args else str(message)
+    except Exception as e:
+        return f"{message!r} {args!r}（日志格式化失败: {e}）"
+
+def _format_exception(error):
+    """异常的完整堆栈，作为 log_message 的延迟格式化函数使用"""
+    return "".join(traceback.format_exception(type(error), error, error.__traceback__))
+
+def _log_record_dict(record):
+    created, level, prefix, account, message, args = record
+    return {"time": round(created, 3), "level": level, "account": account, "message": _format_log(message, args)}
+
+def log_message(message, *args, is_debug=False, level=None):
+    """
+    记录一条日志。level 为 DEBUG / INFO / WARNING / ERROR，未指定时由 is_debug 决定。
+    message 可以带 % 占位符并由 args 填充，也可以是以 args 调用后返回字符串的函数；
+    只有真正打印或写出时才会格式化，低于 FC_LOG_LEVEL 的调试日志只放进内存缓冲区，几乎没有开销。
+    """
+    level = level or ("DEBUG" if is_debug else "INFO")
+    record = (time.time(), level, getattr(_log_context, "prefix", ""), getattr(_log_context, "account", None),
+              message, args)
+    if LOG_BUFFER_SIZE > 0:
+        _log_buffer.append(record)
+    if LOG_LEVELS[level] < LOG_LEVEL:
         return
-    print(message)
+    if LOG_FORMAT == "json":
+        print(json.dumps(_log_record_dict(record), ensure_ascii=False))
+    else:
+        text = _format_log(message, args)
+        print(f"{record[2]}{text}" if record[2] else text)
+
+def dump_log_buffer(reason):
+    """
+    运行失败时把内存缓冲区中的最近日志（包括未打印的调试日志）以 gzip 压缩的JSON行写入 STATE_DIR/logs，
+    写出后清空缓冲区。返回文件路径，没有可写的日志时返回 None。
+    """
+    if LOG_BUFFER_SIZE <= 0 or not _log_buffer:
+        return None
+    import gzip
+    records = list(_log_buffer)
+    _log_buffer.clear()
+    log_dir = os.path.join(STATE_DIR, "logs")
+    path = os.path.join(log_dir, time.strftime("failure-%Y%m%d-%H%M%S") + f"-{os.getpid()}.jsonl.gz")
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"time": round(time.time(), 3), "reason": reason}, ensure_ascii=False) + "\n")
+            for record in records:
+                f.write(json.dumps(_log_record_dict(record), ensure_ascii=False) + "\n")
+        dumps = sorted(n for n in os.listdir(log_dir) if n.startswith("failure-"))
+        for name in dumps[:max(0, len(dumps) - LOG_DUMP_KEEP)]:
+            os.remove(os.path.join(log_dir, name))
+    except OSError as e:
+        log_message("写入失败日志失败: %s", e, level="WARNING")
+        return None
+    log_message("运行失败（%s），最近 %d 条日志（包括调试日志）已写入 %s", reason, len(records), path, level="WARNING")
+    return path
+
+def mask_value(value):
+    """遮盖敏感信息，只保留首尾两个字符"""
+    if not value:
+        return ""
+    return value[:2] + "*" * (len(value) - 4) + value[-2:] if len(value) > 4 else "****"
 
 # ===================== 基本配置检查 =====================
-def check_env_vars():
-    """检查所有关键环境变量是否已正确设置"""
-    required_vars = {
-        "TELEGRAM_BOT_TOKEN": BOT_TOKEN,
-        "TELEGRAM_CHAT_ID": CHAT_ID,
-        "FC_USERNAME": FC_USERNAME,
-        "FC_PASSWORD": FC_PASSWORD,
-        "FC_MACHINE_ID": FC_MACHINE_ID
-    }
-    missing_vars = [name for name, value in required_vars.items() if not value]
+def missing_env_vars(fleet=False):
+    """返回未设置的必需环境变量名称列表（批量模式下账户信息来自 FC_ACCOUNTS）"""
+    required_vars = {}
+    if CASSETTE_MODE != "replay":  # 回放时不发送通知
+        required_vars.update({
+            "TELEGRAM_BOT_TOKEN": BOT_TOKEN,
+            "TELEGRAM_CHAT_ID": CHAT_ID,
+        })
+    if not fleet:
+        required_vars.update({
+            "FC_USERNAME": FC_USERNAME,
+            "FC_PASSWORD": FC_PASSWORD,
+            "FC_MACHINE_ID": FC_MACHINE_ID
+        })
+    return [name for name, value in required_vars.items() if not value]
+
+def check_env_vars(fleet=False):
+    """检查所有关键环境变量是否已正确设置，缺少时尝试发送 Telegram 通知并抛出 ValueError"""
+    missing_vars = missing_env_vars(fleet)
     if missing_vars:
         error_msg = f"错误：以下环境变量未设置或为空: {', '.join(missing_vars)}\n" \
                     "请确保在运行环境正确设置了所有必需的环境变量。"
@@ -44,18 +174,170 @@ def check_env_vars():
         if BOT_TOKEN and CHAT_ID:
             try:
                 # 简化版发送，避免循环依赖 send_telegram_message
-                url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
+                url = f"{TELEGRAM_API_URL}/bot{BOT_TOKEN}/sendMessage"
                 payload = {"chat_id": CHAT_ID, "text": f"脚本启动失败: {error_msg}", "parse_mode": "Markdown"}
                 requests.post(url, data=payload, timeout=10)
             except Exception as e:
-                log_message(f"尝试发送启动失败通知到Telegram也失败了: {e}")
+                log_message(f"尝试发送启动失败通知到Telegram也失败了: {e}", level="WARNING")
         raise ValueError(error_msg)
     log_message("所有关键环境变量已加载。")
 
+def report_environment():
+    """
+    打印运行环境和配置的检查结果，不发起任何网络请求，返回是否可以运行。
+    包括 Python 版本、必需的环境变量（遮盖显示）、账户 / 节奏 / 录制配置的校验、状态目录是否可写以及可用的后端。
+    """
+    import platform
+    problems = []
+    log_message("==== 运行环境 ====")
+    log_message(f"Python {platform.python_version()}，{platform.platform()}")
+    log_message(f"工作目录: {os.getcwd()}")
+
+    log_message("==== 环境变量 ====")
+    try:
+        fleet_accounts = load_fleet_accounts()
+    except (OSError, ValueError) as e:
+        problems.append(f"账户列表: {e}")
+        fleet_accounts = []
+    if fleet_accounts:
+        log_message(f"批量模式: {len(fleet_accounts)} 个账户，{sum(len(a['machine_ids']) for a in fleet_accounts)} 台服务器")
+        names = ["TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID"]
+    else:
+        names = ["FC_USERNAME", "FC_PASSWORD", "FC_MACHINE_ID", "TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID"]
+    for name in names:
+        value = os.getenv(name)
+        log_message(f"{name}: {mask_value(value) + ' [已设置]' if value else '[未设置]'}")
+    missing = missing_env_vars(fleet=bool(fleet_accounts))
+    if missing:
+        problems.append(f"未设置: {', '.join(missing)}")
+
+    log_message("==== 配置 ====")
+    for name, validate in (("节奏方案", load_pacing_config), ("录制 / 回放", get_cassette if CASSETTE_MODE else None)):
+        if validate is None:
+            continue
+        try:
+            validate()
+            log_message(f"{name}: 正常")
+        except ValueError as e:
+            problems.append(f"{name}: {e}")
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        probe = os.path.join(STATE_DIR, f".write-test-{os.getpid()}")
+        with open(probe, "w", encoding="utf-8"):
+            pass
+        os.remove(probe)
+        log_message(f"状态目录: {os.path.abspath(STATE_DIR)} 可写")
+    except OSError as e:
+        problems.append(f"状态目录 {STATE_DIR} 不可写: {e}")
+    available = []
+    for name in BACKEND_ORDER:
+        if name not in BACKENDS:
+            problems.append(f"未知的后端: {name}")
+        elif BACKENDS[name].available():
+            available.append(name)
+        else:
+            log_message(f"后端 {name} 不可用（缺少依赖），运行时跳过")
+    if available:
+        log_message(f"可用后端: {' → '.join(available)}")
+    else:
+        problems.append("没有可用的后端")
+
+    if problems:
+        log_message(f"❌ 环境检查发现 {len(problems)} 个问题:\n" + "\n".join(f"- {p}" for p in problems), level="ERROR")
+        return False
+    log_message("✅ 环境检查通过。")
+    return True
+
 # ===================== 全局常量 =====================
-BASE_URL = "https://freecloud.ltd"
+BASE_URL = os.getenv("FC_BASE_URL", "https://freecloud.ltd").rstrip("/")  # 可指向本地模拟服务器
 CONSOLE_URL = f"{BASE_URL}/server/lxc"  # 直接访问服务器列表页面
 # 续费URL会动态构建，因为 MACHINE_ID 是变量
+DAYS_THRESHOLD = 3.0  # 剩余天数低于该值时续费
+RENEW_AHEAD_DAYS = float(os.getenv("FC_RENEW_AHEAD_DAYS", "0"))  # 已经登录时，剩余天数在阈值之上这么多天内的服务器一并提前续费；0 表示关闭
+RENEW_MONTHS = int(os.getenv("FC_RENEW_MONTHS", "1"))  # 每次续费的月数上限，实际取续费表单中不超过该值的最大选项
+RENEW_CONFIRM_TIMEOUT = float(os.getenv("FC_RENEW_CONFIRM_TIMEOUT", "60"))  # 续费后确认新到期时间的最长等待秒数
+RENEW_CONFIRM_INITIAL_DELAY = float(os.getenv("FC_RENEW_CONFIRM_INITIAL_DELAY", "1"))  # 第一次查询前的等待秒数，之后每次翻倍
+RENEW_CONFIRM_MAX_DELAY = float(os.getenv("FC_RENEW_CONFIRM_MAX_DELAY", "8"))  # 两次查询之间的最长等待秒数
+
+# ===================== 本地状态目录 =====================
+STATE_DIR = os.getenv("FC_STATE_DIR", ".freecloud_state")  # 会话缓存等运行状态保存位置
+CASSETTE_MODE = os.getenv("FC_CASSETTE_MODE", "").lower()  # record 录制本次运行的所有请求与响应，replay 用录制的响应代替网络
+CASSETTE_FILE = os.getenv("FC_CASSETTE", os.path.join(STATE_DIR, "cassette.jsonl.gz"))
+# 录制/回放时不读写会话缓存和历史记录：记录总是从登录开始的完整流程，回放不影响本地状态
+SESSION_CACHE_ENABLED = os.getenv("FC_SESSION_CACHE", "true").lower() == "true" and not CASSETTE_MODE
+SESSION_CACHE_TTL_HOURS = float(os.getenv("FC_SESSION_CACHE_TTL_HOURS", "24"))  # 缓存会话最长有效期
+TRACE_FILE = os.getenv("FC_TRACE_FILE", os.path.join(STATE_DIR, "trace.json"))  # 各阶段耗时的JSON追踪文件，设为空字符串则不写出
+TRACE_SUMMARY = os.getenv("FC_TRACE_SUMMARY", "true").lower() == "true"  # 运行结束时打印各阶段耗时汇总表
+HISTORY_ENABLED = os.getenv("FC_HISTORY", "true").lower() == "true" and not CASSETTE_MODE  # 记录剩余天数、续费和耗时历史，并据此跳过不必要的检查
+HISTORY_DB = os.path.join(STATE_DIR, "history.db")
+HISTORY_MARGIN_DAYS = float(os.getenv("FC_HISTORY_MARGIN_DAYS", "2"))  # 预测剩余天数至少比阈值多出这么多天才跳过
+HISTORY_MAX_SKIP_HOURS = float(os.getenv("FC_HISTORY_MAX_SKIP_HOURS", "72"))  # 距上次实际检查超过该时长必须重新检查
+HISTORY_TOLERANCE_DAYS = float(os.getenv("FC_HISTORY_TOLERANCE_DAYS", "1.5"))  # 实际值与预测值相差超过该天数视为预测失误
+METRICS_FILE = os.getenv("FC_METRICS_FILE", os.path.join(STATE_DIR, "metrics.prom")) if not CASSETTE_MODE else ""  # Prometheus 文本格式的指标文件，设为空字符串则不写出；录制 / 回放时不写出
+METRICS_PORT = int(os.getenv("FC_METRICS_PORT", "0"))  # 常驻模式下在该端口提供 /metrics 接口，0 表示不开启
+METRICS_ADDR = os.getenv("FC_METRICS_ADDR", "127.0.0.1")  # 指标接口监听的地址，默认只允许本机访问
+SHARD_RESULTS_DIR = os.getenv("FC_SHARD_RESULTS_DIR", os.path.join(STATE_DIR, "shards"))  # 各分片的结果文件和合并报告
+LOCK_TIMEOUT = float(os.getenv("FC_LOCK_TIMEOUT", "600"))  # 等待另一次运行释放账户 / 服务器锁的最长秒数
+RENEW_LEDGER_MINUTES = float(os.getenv("FC_RENEW_LEDGER_MINUTES", "60"))  # 这段时间内已提交的续费直接沿用结果，不重复提交；0 表示关闭
+RENEW_LEDGER_ENABLED = RENEW_LEDGER_MINUTES > 0 and not CASSETTE_MODE
+
+# ===================== 登录策略 =====================
+# 依次尝试的登录方式：cloudscraper 的不同浏览器配置，最后是标准 requests
+LOGIN_STRATEGIES = {
+    "chrome-windows": {"browser": "chrome", "platform": "windows", "mobile": False},
+    "firefox-windows": {"browser": "firefox", "platform": "windows", "mobile": False},
+    "chrome-darwin": {"browser": "chrome", "platform": "darwin", "mobile": False},
+    "firefox-darwin": {"browser": "firefox", "platform": "darwin", "mobile": False},
+    "requests": None,
+}
+LOGIN_HEDGE = int(os.getenv("FC_LOGIN_HEDGE", "1"))  # 大于1时同时尝试多种登录方式，先成功者胜出
+
+# ===================== 运行后端 =====================
+# 按开销从低到高依次尝试的后端：http 为 requests/cloudscraper，browser 为 node 驱动的无头浏览器
+BACKEND_ORDER = [b.strip() for b in os.getenv("FC_BACKENDS", "http,browser").split(",") if b.strip()]
+BACKEND_STICKY_HOURS = float(os.getenv("FC_BACKEND_STICKY_HOURS", "168"))  # 记录的成功后端在该时长内优先使用，过期后重新从最便宜的开始
+BROWSER_TIMEOUT = float(os.getenv("FC_BROWSER_TIMEOUT", "180"))  # 浏览器后端单个操作的最长等待秒数
+
+# ===================== 流式解析 =====================
+STREAM_CONSOLE = os.getenv("FC_STREAM_CONSOLE", "false").lower() == "true"  # 分块读取控制台页面，找到目标后立即停止下载
+STREAM_CHUNK_SIZE = int(os.getenv("FC_STREAM_CHUNK_SIZE", "16384"))
+STREAM_WINDOW = int(os.getenv("FC_STREAM_WINDOW", "8192"))  # 跨块匹配时保留的字符数，需大于一行服务器记录的长度
+
+# ===================== 账户传输层 =====================
+CONDITIONAL_GET = os.getenv("FC_CONDITIONAL_GET", "true").lower() == "true"  # 服务器列表页按 ETag / Last-Modified 发送条件请求
+
+# ===================== 调用策略 =====================
+RUN_DEADLINE = float(os.getenv("FC_RUN_DEADLINE", "900"))  # 整次运行（常驻模式下每轮检查）的总时限，单位秒，0 表示不限
+DEADLINE_RESERVE = float(os.getenv("FC_DEADLINE_RESERVE", "15"))  # 总时限中留给收尾（发送通知等）的秒数
+MIN_CALL_TIMEOUT = float(os.getenv("FC_MIN_CALL_TIMEOUT", "3"))  # 剩余时间不足以给出该超时则直接放弃，不再发起请求
+RETRY_ATTEMPTS = int(os.getenv("FC_RETRY_ATTEMPTS", "3"))  # 临时性失败时每个请求最多尝试的次数
+RETRY_BASE_DELAY = float(os.getenv("FC_RETRY_BASE_DELAY", "1"))  # 重试退避的基础秒数，按次数翻倍并加随机抖动
+RETRY_MAX_DELAY = float(os.getenv("FC_RETRY_MAX_DELAY", "15"))
+BREAKER_THRESHOLD = int(os.getenv("FC_BREAKER_THRESHOLD", "5"))  # 同一主机连续临时性失败达到该次数后熔断
+BREAKER_COOLDOWN = float(os.getenv("FC_BREAKER_COOLDOWN", "60"))  # 熔断持续秒数，之后放行一个试探请求
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+POST_RETRY_STATUSES = {429, 503}  # 服务端明确未处理的状态，POST 重试也不会重复提交
+
+# ===================== 请求节奏 =====================
+# human: 模拟人类操作节奏（默认）；fast: 不等待，用于本地测试
+# delays 为各环节前的随机等待区间（秒）；min_gap / rate / burst 为同一主机所有请求共享的间隔与令牌桶，
+# 由 CallPolicy 在每个对外请求（包括重试）发出前预约
+PACING_PROFILES = {
+    "human": {
+        "min_gap": 0.5,
+        "rate": 2.0,
+        "burst": 4,
+        "delays": {
+            "after_home": (3, 3),
+            "before_login": (2, 5),
+            "after_login": (2, 4),
+            "before_renew": (2, 4),
+        },
+    },
+    "fast": {"min_gap": 0, "rate": 0, "burst": 0, "delays": {}},
+}
+PACING_PROFILE = os.getenv("FC_PACING_PROFILE", "human")
+PACING_OVERRIDES = os.getenv("FC_PACING")  # JSON，覆盖所选方案中的部分字段，如 {"delays": {"before_login": [1, 2]}}
 
 # 常用浏览器 User-Agent 列表
 USER_AGENTS = [
@@ -67,7 +349,7 @@ USER_AGENTS = [
 ]
 
 def get_headers():
-    """获取随机的请求头"""
+    """获取随机的请求头，只在创建会话时调用一次，之后整个会话沿用"""
     user_agent = random.choice(USER_AGENTS)
     return {
         "User-Agent": user_agent,
@@ -85,411 +367,3115 @@ def get_headers():
         "Cache-Control": "max-age=0"
     }
 
-# ===================== Telegram 通知功能 =====================
-def send_telegram_message(message, is_error=False):
-    """通过Telegram机器人发送消息"""
-    if not BOT_TOKEN or not CHAT_ID:
-        log_message("Telegram BOT_TOKEN 或 CHAT_ID 未配置，跳过发送通知。")
-        return
+# ===================== 请求节奏控制 =====================
+def load_pacing_config():
+    """读取节奏方案，FC_PACING 中的字段覆盖所选方案的同名字段；回放时不经过网络，总是使用 fast"""
+    if CASSETTE_MODE == "replay":
+        return {**PACING_PROFILES["fast"], "delays": {}}
+    if PACING_PROFILE not in PACING_PROFILES:
+        raise ValueError(f"未知的 FC_PACING_PROFILE: {PACING_PROFILE}，可选: {', '.join(PACING_PROFILES)}")
+    base = PACING_PROFILES[PACING_PROFILE]
+    config = {**base, "delays": dict(base["delays"])}
+    if PACING_OVERRIDES:
+        try:
+            overrides = json.loads(PACING_OVERRIDES)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"FC_PACING 不是有效的JSON: {e}")
+        if not isinstance(overrides, dict):
+            raise ValueError(f"FC_PACING 应为JSON对象，如 {{\"min_gap\": 1}}，实际为: {PACING_OVERRIDES}")
+        if not isinstance(overrides.get("delays", {}), dict):
+            raise ValueError("FC_PACING 中的 delays 应为JSON对象，如 {\"before_login\": [1, 2]}")
+        config["delays"].update(overrides.pop("delays", {}))
+        config.update(overrides)
+    return config
 
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": CHAT_ID,
-        "text": message,
-        "parse_mode": "Markdown" # 允许简单的Markdown格式
-    }
-    try:
-        response = requests.post(url, data=payload, timeout=15) # 增加超时
-        response.raise_for_status() # 如果HTTP状态码是4xx或5xx，则抛出异常
-        log_message("Telegram通知已成功发送。")
-    except requests.exceptions.RequestException as e:
-        log_message(f"Telegram通知失败 (请求异常): {e}")
-    except Exception as e:
-        log_message(f"Telegram通知发送时发生未知错误: {e}")
+class HostPacer:
+    """
+    单个主机的请求节奏：令牌桶限制平均速率和突发数量，并保证相邻请求之间的最小间隔。
+    只在锁内计算预约时间，等待在调用线程中进行，不会阻塞其他账户的线程。
+    """
 
-# ===================== 数学验证码处理 =====================
-def get_math_captcha_solution(page_content):
+    def __init__(self, rate, burst, min_gap):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_gap = min_gap
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.last_slot = float("-inf")
+        self.lock = threading.Lock()
+
+    def reserve(self, earliest):
+        """预约一个不早于 earliest（monotonic 时间）的请求时刻，返回需要等待的秒数"""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(earliest, now, self.last_slot + self.min_gap)
+            if self.rate > 0:
+                self.tokens = min(self.burst, self.tokens + (slot - self.updated) * self.rate)
+                if self.tokens < 1:
+                    slot += (1 - self.tokens) / self.rate
+                    self.tokens = 1
+                self.tokens -= 1
+                self.updated = slot
+            self.last_slot = slot
+            return slot - now
+
+_pacing_config = None
+_host_pacers = {}
+_host_pacers_lock = threading.Lock()
+
+def get_pacing_config():
+    """首次使用时读取节奏方案"""
+    global _pacing_config
+    with _host_pacers_lock:
+        if _pacing_config is None:
+            _pacing_config = load_pacing_config()
+        return _pacing_config
+
+def get_host_pacer(host):
+    """获取（必要时创建）主机对应的 HostPacer"""
+    config = get_pacing_config()
+    with _host_pacers_lock:
+        pacer = _host_pacers.get(host)
+        if pacer is None:
+            pacer = HostPacer(config["rate"], config["burst"], config["min_gap"])
+            _host_pacers[host] = pacer
+        return pacer
+
+def pace(stage):
     """
-    从登录页面内容中提取并解决数学验证码
-    例如：从 "5 + 7 = ?" 提取并计算出 12
+    在进入某个环节前按节奏方案等待该环节的随机延迟，模拟人的操作间隔，返回等待的秒数。
+    主机级的间隔与令牌桶不在这里，由 CallPolicy 对每个请求单独预约。
     """
-    try:
-        # 使用更精确的正则表达式匹配类似 "5 + 7 = ?" 的验证码
-        match = re.search(r'placeholder="([0-9]+)\s*([+\-*/])\s*([0-9]+)\s*=\s*\?"', page_content)
-        
-        # 如果第一个正则表达式匹配失败，尝试其他可能的格式
-        if not match:
-            # 尝试另一种可能的格式
-            match = re.search(r'placeholder=["\']([0-9]+)\s*([+*/\-])\s*([0-9]+)\s*=\s*\?["\']', page_content)
-        
-        if not match:
-            log_message("⚠️ 未在页面中找到数学验证码，保存页面内容进行调试")
-            if DEBUG_MODE:
-                # 保存页面内容以便调试
-                with open("login_page_debug.txt", "w", encoding="utf-8") as f:
-                    # 截取验证码相关部分
-                    captcha_content = re.search(r'.{0,200}captcha.{0,200}', page_content)
-                    if captcha_content:
-                        f.write(f"验证码上下文: {captcha_content.group(0)}\n\n")
-                    f.write(page_content[:2000])  # 只保存前面部分
-            return None
-        
-        num1 = int(match.group(1))
-        operator = match.group(2)
-        num2 = int(match.group(3))
-        
-        log_message(f"找到数学验证码: {num1} {operator} {num2} = ?")
-        
-        # 计算结果
-        if operator == '+':
-            result = num1 + num2
-        elif operator == '-':
-            result = num1 - num2
-        elif operator == '*':
-            result = num1 * num2
-        elif operator == '/':
-            # 假设结果总是整数
-            result = num1 // num2
-        else:
-            log_message(f"⚠️ 未知的运算符: {operator}")
-            return None
-        
-        log_message(f"数学验证码计算结果: {result}")
-        return result
-    except Exception as e:
-        log_message(f"解析数学验证码时出错: {e}")
-        if DEBUG_MODE:
-            log_message(traceback.format_exc())
-        return None
+    low, high = get_pacing_config()["delays"].get(stage, (0, 0))
+    wait = random.uniform(low, high) if high > 0 else 0
+    if wait > 0:
+        log_message("节奏控制 [%s]：等待 %.2f 秒", stage, wait, is_debug=True)
+        with trace_span("pacing", stage=stage):
+            time.sleep(wait)
+    return wait
 
-# ===================== Freecloud 操作 =====================
-def login_session():
+# ===================== 运行追踪 =====================
+_TELEGRAM_TOKEN_RE = re.compile(r'/bot[^/]+/')
+
+class Tracer:
     """
-    模拟登录到 Freecloud，返回一个带有登录会话的 cloudscraper 实例。
+    记录各阶段的计时区间（span）以及区间内每个 HTTP 请求的状态码、字节数、首字节时间和总耗时。
+    区间按线程嵌套，批量模式下每条记录带有所属账户。
     """
-    log_message("尝试登录 Freecloud...")
-    
-    # 尝试不同的浏览器配置
-    browser_configs = [
-        {"browser": "chrome", "platform": "windows", "mobile": False},
-        {"browser": "firefox", "platform": "windows", "mobile": False},
-        {"browser": "chrome", "platform": "darwin", "mobile": False},
-        {"browser": "firefox", "platform": "darwin", "mobile": False}
-    ]
-    
-    # 尝试不同的配置直到成功
-    for browser_config in browser_configs:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.spans = []
+            self.orphan_requests = []  # 不在任何区间内的请求
+            self.next_id = 1
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        stack = self.local.__dict__.setdefault("stack", [])
+        with self.lock:
+            span_id = self.next_id
+            self.next_id += 1
+        record = {
+            "id": span_id,
+            "parent": stack[-1]["id"] if stack else None,
+            "name": name,
+            "account": getattr(_log_context, "account", None),
+            "thread": threading.current_thread().name,
+            "start": time.time(),
+            "attrs": attrs,
+            "requests": [],
+        }
+        started = time.perf_counter()
+        stack.append(record)
         try:
-            log_message(f"尝试使用浏览器配置: {browser_config}", is_debug=True)
-            scraper = cloudscraper.create_scraper(
-                browser=browser_config,
-                delay=5,  # 增加延迟
-                interpreter='js2py'  # 使用js2py解释器
-            )
-            
-            # 设置scraper的默认头信息
-            scraper.headers.update(get_headers())
-            
-            # 首先访问首页以获取必要的cookie
-            log_message("访问首页获取初始cookie...")
-            home_resp = scraper.get(BASE_URL, timeout=30)
-            if home_resp.status_code != 200:
-                log_message(f"首页访问失败，状态码: {home_resp.status_code}", is_debug=True)
-                continue
-                
-            log_message("成功访问首页，等待几秒后继续...")
-            time.sleep(3)  # 模拟人类行为的延迟
-            
-            # 访问登录页面获取数学验证码
-            log_message("访问登录页面获取数学验证码...")
-            login_page_resp = scraper.get(f"{BASE_URL}/login", timeout=30)
-            if login_page_resp.status_code != 200:
-                log_message(f"登录页面访问失败，状态码: {login_page_resp.status_code}", is_debug=True)
-                continue
-            
-            # 解析数学验证码
-            math_solution = get_math_captcha_solution(login_page_resp.text)
-            if math_solution is None:
-                log_message("❌ 无法解析数学验证码，登录可能会失败")
-                send_telegram_message("⚠️ 无法解析数学验证码，登录可能会失败", is_error=True)
-            
-            # 准备登录数据
-            login_data = {
-                "username": FC_USERNAME,
-                "password": FC_PASSWORD,
-                "math_captcha": str(math_solution) if math_solution is not None else "",
-                "mobile": "",
-                "captcha": "",
-                "verify_code": "",
-                "agree": "1",
-                "login_type": "PASS",
-                "submit": "1"
+            yield record
+        except BaseException as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            stack.pop()
+            record["duration"] = time.perf_counter() - started
+            with self.lock:
+                self.spans.append(record)
+            METRICS.observe_phase(name, record["duration"])
+
+    def record_request(self, method, url, status, size, ttfb, total, error=None):
+        """记录一次 HTTP 请求，归入当前线程最内层的区间，返回记录以便流式读取结束后补充字节数"""
+        entry = {
+            "method": method,
+            "url": _TELEGRAM_TOKEN_RE.sub("/bot***/", urlsplit(url).path) or "/",
+            "status": status,
+            "bytes": size,
+            "ttfb": ttfb,
+            "total": total,
+        }
+        if error:
+            entry["error"] = error
+        stack = getattr(self.local, "stack", None)
+        if stack:
+            stack[-1]["requests"].append(entry)
+        else:
+            with self.lock:
+                self.orphan_requests.append(entry)
+        return entry
+
+    def summary_rows(self):
+        """按阶段汇总：[(阶段, 次数, 总耗时, 最大耗时, 请求数, 字节数), ...]"""
+        rows = {}
+        with self.lock:
+            spans = list(self.spans)
+        for span in spans:
+            row = rows.setdefault(span["name"], [0, 0.0, 0.0, 0, 0])
+            row[0] += 1
+            row[1] += span["duration"]
+            row[2] = max(row[2], span["duration"])
+            row[3] += len(span["requests"])
+            row[4] += sum(r["bytes"] or 0 for r in span["requests"])
+        return sorted(((name, *row) for name, row in rows.items()), key=lambda r: -r[2])
+
+    def export(self, path=None, summary=True, reset=False):
+        """写出JSON追踪文件并打印汇总表"""
+        path = TRACE_FILE if path is None else path
+        with self.lock:
+            data = {
+                "started_at": self.started_at,
+                "duration": time.time() - self.started_at,
+                "spans": sorted(self.spans, key=lambda s: s["start"]),
+                "orphan_requests": list(self.orphan_requests),
             }
-            
-            log_message("准备登录数据完成，包含数学验证码解答")
-            
-            # 随机延迟，模拟人类行为
-            delay = random.uniform(2, 5)
-            log_message(f"模拟人类行为，延迟 {delay:.2f} 秒后提交登录...", is_debug=True)
-            time.sleep(delay)
-            
-            # 发送登录请求
-            log_message(f"发送登录请求到: {BASE_URL}/login", is_debug=True)
-            # 确保设置了正确的内容类型
-            login_headers = scraper.headers.copy()
-            login_headers.update({
-                "Content-Type": "application/x-www-form-urlencoded",
-                "Referer": f"{BASE_URL}/login"
-            })
-            
-            response = scraper.post(
-                f"{BASE_URL}/login", 
-                data=login_data, 
-                headers=login_headers, 
-                allow_redirects=True, 
-                timeout=30
-            )
-            
-            if response.status_code != 200:
-                log_message(f"登录请求失败，状态码: {response.status_code}", is_debug=True)
-                continue
-                
-            log_message(f"登录请求响应状态码: {response.status_code}", is_debug=True)
-            log_message(f"登录请求响应URL: {response.url}", is_debug=True)
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=1)
+                log_message("运行追踪已写入 %s", path, is_debug=True)
+            except OSError as e:
+                log_message(f"写入运行追踪失败: {e}", level="WARNING")
+        if summary and data["spans"]:
+            # 表头为全角字符，按显示宽度对齐
+            log_message(f"{'阶段':<16}{'次数':>4}{'总耗时(s)':>8}{'平均(ms)':>8}{'最大(ms)':>8}{'请求数':>4}{'字节':>8}")
+            for name, count, total, longest, requests_count, size in self.summary_rows():
+                log_message(f"{name:<18}{count:>6}{total:>11.3f}{total / count * 1000:>10.1f}"
+                            f"{longest * 1000:>10.1f}{requests_count:>7}{size:>10}")
+        if reset:
+            self.reset()
 
-            # 随机延迟，模拟人类行为
-            time.sleep(random.uniform(2, 4))
-            
-            # 访问控制台页面以验证登录状态
-            log_message("访问控制台页面以验证登录状态...")
-            console_headers = scraper.headers.copy()
-            console_headers.update({"Referer": f"{BASE_URL}/login"})
-            
-            console_resp = scraper.get(
-                CONSOLE_URL, 
-                headers=console_headers, 
-                timeout=30
-            )
-            
-            if console_resp.status_code != 200:
-                log_message(f"控制台页面访问失败，状态码: {console_resp.status_code}", is_debug=True)
-                continue
-                
-            log_message(f"控制台页面响应状态码: {console_resp.status_code}", is_debug=True)
-
-            if FC_USERNAME and FC_USERNAME.lower() in console_resp.text.lower():
-                 log_message("登录成功，在控制台页面找到用户名。")
-                 return scraper
-            elif "logout" in console_resp.text.lower() or "退出登录" in console_resp.text:
-                log_message("登录似乎成功（页面包含退出链接）。")
-                return scraper
-            else:
-                # 检查是否登录失败，可能是验证码错误
-                if "验证码" in console_resp.text or "重新登录" in console_resp.text:
-                    log_message("❌ 登录失败，可能是数学验证码计算错误")
-                    # 继续尝试下一个浏览器配置
-                    continue
-                    
-                log_message("警告：登录请求已发送，但无法100%确认登录成功（未在控制台页面找到明确标识）。脚本将继续尝试。")
-                log_message(f"控制台页面部分内容 (前500字符): {console_resp.text[:500]}", is_debug=True)
-                # 尽管无法确认，但还是返回会话
-                return scraper
-                
-        except requests.exceptions.HTTPError as he:
-            log_message(f"HTTP错误 (配置: {browser_config}): {he}")
-            # 继续尝试下一个配置
-        except requests.exceptions.RequestException as re:
-            log_message(f"请求错误 (配置: {browser_config}): {re}")
-            # 继续尝试下一个配置
-        except Exception as e:
-            log_message(f"未知错误 (配置: {browser_config}): {e}")
-            # 继续尝试下一个配置
-    
-    # 如果所有配置都失败，尝试直接使用requests
-    log_message("所有cloudscraper配置都失败，尝试使用标准requests...")
+TRACER = Tracer()
+trace_span = TRACER.span
+
+def _traced_request(send, method, url, *args, **kwargs):
+    """发起一次请求并记录到追踪中"""
+    started = time.perf_counter()
     try:
-        session = requests.Session()
-        session.headers.update(get_headers())
-        
-        # 访问首页获取cookie
-        session.get(BASE_URL, timeout=30)
-        time.sleep(2)
-        
-        # 访问登录页面
-        login_page = session.get(f"{BASE_URL}/login", timeout=30)
-        
-        # 解析数学验证码
-        math_solution = get_math_captcha_solution(login_page.text)
-        
-        # 准备登录数据
-        login_data = {
-            "username": FC_USERNAME,
-            "password": FC_PASSWORD,
-            "math_captcha": str(math_solution) if math_solution is not None else "",
-            "mobile": "",
-            "captcha": "",
-            "verify_code": "",
-            "agree": "1",
-            "login_type": "PASS",
-            "submit": "1"
-        }
-        
-        # 发送登录请求
-        session.post(
-            f"{BASE_URL}/login", 
-            data=login_data, 
-            headers={"Content-Type": "application/x-www-form-urlencoded", "Referer": f"{BASE_URL}/login"}, 
-            timeout=30
-        )
-        
-        # 验证登录状态
-        console_page = session.get(CONSOLE_URL, timeout=30)
-        if "logout" in console_page.text.lower() or "退出登录" in console_page.text:
-            log_message("使用标准requests登录成功")
-            return session
-            
-        log_message("使用标准requests登录可能失败")
+        response = send(method, url, *args, **kwargs)
     except Exception as e:
-        log_message(f"使用标准requests时出错: {e}")
-    
-    # 如果都失败了，抛出异常
-    raise Exception("所有登录尝试均失败")
+        TRACER.record_request(method, url, None, 0, None, time.perf_counter() - started, error=str(e))
+        raise
+    streamed = kwargs.get("stream", False)
+    response.fc_trace = TRACER.record_request(
+        method, url, response.status_code,
+        None if streamed else len(response.content),
+        response.elapsed.total_seconds(),
+        time.perf_counter() - started,
+    )
+    return response
+
+def instrument_session(session, policy=True):
+    """
+    包装会话的 request 方法：为每个请求记录状态码、字节数、首字节时间和总耗时，
+    policy 为 True 时还经由 RUN_POLICY 统一处理总时限、超时、重试和熔断。
+    cloudscraper 内部会嵌套调用 request，只处理最外层一次。
+    """
+    original = session.request
+    depth = threading.local()
+
+    def request(method, url, *args, **kwargs):
+        if getattr(depth, "value", 0):
+            return original(method, url, *args, **kwargs)
+        depth.value = 1
+        try:
+            if policy:
+                return RUN_POLICY.call(functools.partial(_traced_request, original), method, url, *args, **kwargs)
+            return _traced_request(original, method, url, *args, **kwargs)
+        finally:
+            depth.value = 0
+
+    session.request = request
+    return session
+
+def new_session(browser_config=None):
+    """创建会话：有浏览器配置时使用 cloudscraper，否则使用标准 requests；统一加上请求追踪（以及录制/回放）"""
+    session = create_scraper(browser_config) if browser_config else requests.Session()
+    if CASSETTE_MODE:
+        get_cassette().install(session)
+    return instrument_session(session)
 
-def get_server_info(session, machine_id_to_find):
+# ===================== 指标导出 =====================
+METRIC_DEFINITIONS = {
+    "freecloud_remaining_days": ("gauge", "服务器剩余天数（最近一次检查，按历史跳过时为推算值）"),
+    "freecloud_last_check_timestamp_seconds": ("gauge", "最近一次实际检查服务器的时间"),
+    "freecloud_next_check_timestamp_seconds": ("gauge", "常驻模式下一次检查服务器的时间"),
+    "freecloud_renew_total": ("counter", "续费结果计数，outcome 为 success / failed / ahead_failed / reused"),
+    "freecloud_login_attempts_total": ("counter", "各登录方式的尝试次数，outcome 为 success / unconfirmed / failed"),
+    "freecloud_phase_duration_seconds": ("histogram", "各阶段耗时"),
+    "freecloud_last_run_timestamp_seconds": ("gauge", "最近一次运行（常驻模式下为一轮检查）结束的时间"),
+    "freecloud_last_run_failed_machines": ("gauge", "最近一次运行中处理失败的服务器数"),
+    "freecloud_last_run_ok": ("gauge", "最近一次运行是否没有任何失败（包括配置错误和意外错误），1 为是"),
+}
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _metric_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+class Metrics:
     """
-    通过HTML源码，先定位到服务器编号，再提取"X天后"。
+    进程内的运行指标，按 Prometheus 文本格式导出。
+    单次运行结束时写出文本文件（供 node_exporter 的 textfile collector 采集），常驻模式下还可以从本地 HTTP 端口读取。
+    账户标签使用打码后的用户名，与日志一致。
+    计数和直方图在文本文件旁的 .totals.json 中跨运行累加（加文件锁，重叠的运行也不会丢失增量），
+    因此即使每次运行都是新进程，导出的计数也单调递增，rate() / increase() 可以正常使用。
     """
-    log_message(f"尝试从 {CONSOLE_URL} 获取服务器 {machine_id_to_find} 的信息...")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.labels = {}  # 加在所有指标上的标签，分片运行时为 {"shard": "i/N"}
+        self.values = {}  # 仪表：(指标名, 标签元组) -> 值
+        self.counters = {}  # 计数：(指标名, 标签元组) -> 尚未累加到总数文件的增量
+        self.histograms = {}  # 阶段 -> [各桶计数..., 总和, 次数]，同样是尚未累加的增量
+        self.totals = ({}, {})  # 已累加到总数文件的 (计数, 直方图)
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, tuple(labels.items()))] = value
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe_phase(self, phase, seconds):
+        with self.lock:
+            row = self.histograms.setdefault(phase, [0] * (len(PHASE_BUCKETS) + 2))
+            for i, bound in enumerate(PHASE_BUCKETS):
+                if seconds <= bound:
+                    row[i] += 1
+            row[-2] += seconds
+            row[-1] += 1
+
+    def machine_checked(self, username, machine_id, remaining_days, checked_at=None):
+        """记录一台服务器的剩余天数和检查时间；checked_at 为按历史跳过时那次实际检查的时间"""
+        if remaining_days is None:
+            return
+        labels = {"account": mask_value(username or ""), "machine": str(machine_id)}
+        self.set("freecloud_remaining_days", round(remaining_days, 3), **labels)
+        self.set("freecloud_last_check_timestamp_seconds", round(checked_at or time.time(), 3), **labels)
+
+    @staticmethod
+    def _add(totals, counters, histograms):
+        """把增量加到 (计数, 直方图) 总数上，返回新的总数"""
+        total_counters = dict(totals[0])
+        for key, value in counters.items():
+            total_counters[key] = total_counters.get(key, 0) + value
+        total_histograms = {phase: list(row) for phase, row in totals[1].items()}
+        for phase, row in histograms.items():
+            total = total_histograms.setdefault(phase, [0] * len(row))
+            total_histograms[phase] = [a + b for a, b in zip(total, row)]
+        return total_counters, total_histograms
+
+    @staticmethod
+    def _load_totals(path):
+        """读取总数文件，不存在或损坏时从零开始"""
+        try:
+            with open(f"{path}.totals.json", "r", encoding="utf-8") as f:
+                data = json.load(f)
+            counters = {(name, tuple(tuple(pair) for pair in labels)): value
+                        for name, labels, value in data.get("counters", [])}
+            histograms = {phase: row for phase, row in data.get("histograms", {}).items()
+                          if len(row) == len(PHASE_BUCKETS) + 2}  # 桶的划分变了就重新计数
+            return counters, histograms
+        except (OSError, ValueError, TypeError):
+            return {}, {}
+
+    def restore(self, path=None):
+        """运行开始时读取之前各次运行累计的总数，常驻模式下 HTTP 接口从一开始就是累计值"""
+        path = METRICS_FILE if path is None else path
+        if path:
+            totals = self._load_totals(path)
+            with self.lock:
+                self.totals = totals
+
+    def _merge_totals(self, path):
+        """在文件锁内把本进程的增量加到总数文件中；锁等待超时时保留增量，下次写出时再加"""
+        try:
+            with state_lock(f"metrics-{os.path.basename(path)}", "指标文件", timeout=10, announce=False):
+                with self.lock:
+                    counters, histograms = self.counters, self.histograms
+                    self.counters, self.histograms = {}, {}
+                totals = self._add(self._load_totals(path), counters, histograms)
+                with self.lock:
+                    self.totals = totals
+                tmp_path = f"{path}.totals.json.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"counters": [[name, labels, value] for (name, labels), value in totals[0].items()],
+                               "histograms": totals[1]}, f, ensure_ascii=False)
+                os.replace(tmp_path, f"{path}.totals.json")
+        except TimeoutError as e:
+            log_message(f"累计指标总数失败: {e}", level="WARNING")
+
+    def render(self):
+        """生成 Prometheus 文本格式"""
+        with self.lock:
+            values = dict(self.values)
+            counters, histograms = self._add(self.totals, self.counters, self.histograms)
+        values.update(counters)
+        lines = []
+        for name, (kind, help_text) in METRIC_DEFINITIONS.items():
+            if kind == "histogram":
+                if not histograms:
+                    continue
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for phase, row in sorted(histograms.items()):
+                    labels = {**self.labels, "phase": phase}
+                    for bound, count in zip(PHASE_BUCKETS, row):
+                        lines.append(f"{name}_bucket{_metric_labels({**labels, 'le': f'{bound:g}'})} {count}")
+                    lines.append(f"{name}_bucket{_metric_labels({**labels, 'le': '+Inf'})} {row[-1]}")
+                    lines.append(f"{name}_sum{_metric_labels(labels)} {row[-2]:.6f}")
+                    lines.append(f"{name}_count{_metric_labels(labels)} {row[-1]}")
+                continue
+            samples = sorted((labels, value) for (metric, labels), value in values.items() if metric == name)
+            if not samples:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_metric_labels({**self.labels, **dict(labels)})} {value}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=None):
+        """先累加总数，再原子地写出文本文件，采集方不会读到写了一半的文件"""
+        path = METRICS_FILE if path is None else path
+        if not path:
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._merge_totals(path)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+            log_message("指标已写入 %s", path, is_debug=True)
+        except OSError as e:
+            log_message(f"写入指标文件失败: {e}", level="WARNING")
+
+METRICS = Metrics()
+
+def record_login_attempt(strategy, result):
+    """记录一次登录尝试；result 为 login_with_strategy 的返回值，或直接给出的结果名"""
+    if not isinstance(result, str):
+        result = "failed" if not result else "success" if result[1] else "unconfirmed"
+    METRICS.inc("freecloud_login_attempts_total", strategy=strategy, outcome=result)
+
+def record_renew_outcome(username, machine_id, outcome):
+    METRICS.inc("freecloud_renew_total", account=mask_value(username or ""), machine=str(machine_id), outcome=outcome)
+
+def record_run_finished(failed_count, ok=None, path=None):
+    METRICS.set("freecloud_last_run_timestamp_seconds", round(time.time(), 3))
+    METRICS.set("freecloud_last_run_failed_machines", failed_count)
+    METRICS.set("freecloud_last_run_ok", int(not failed_count if ok is None else ok))
+    METRICS.write(path)
+
+def start_metrics_server(port=None, addr=None):
+    """在后台线程中提供 /metrics 接口，返回服务器对象；端口被占用等情况下只打印警告并返回 None"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if urlsplit(self.path).path not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = METRICS.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # 每次采集都打印日志太吵
+
+    port = METRICS_PORT if port is None else port
+    addr = METRICS_ADDR if addr is None else addr
     try:
-        response = session.get(CONSOLE_URL, headers=get_headers(), timeout=30)
-        response.raise_for_status()
-        html = response.text
-
-        # 1. 找到包含编号的区块（假设编号唯一）
-        idx = html.find(str(machine_id_to_find))
-        if idx != -1:
-            snippet = html[max(0, idx-500):idx+500]
-            match = re.search(r'(\d+)天后', snippet)
-            if match:
-                days_left = int(match.group(1))
-                log_message(f"服务器 {machine_id_to_find} 剩余 {days_left} 天")
-                return {"remaining_days": days_left, "id_sn": machine_id_to_find}
-            else:
-                log_message(f"未能在服务器 {machine_id_to_find} 附近找到\"天后\"信息")
-                return None
-        else:
-            log_message(f"页面中未找到服务器编号 {machine_id_to_find}")
-            return None
-    except requests.exceptions.RequestException as e:
-        log_message(f"获取服务器信息失败 (网络请求错误): {e}")
-        return None
-    except Exception as e:
-        log_message(f"获取服务器信息时发生未知错误: {e}\n{traceback.format_exc() if DEBUG_MODE else ''}")
+        server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    except OSError as e:
+        log_message(f"指标接口启动失败 ({addr}:{port}): {e}", level="WARNING")
         return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    log_message(f"指标接口: http://{addr}:{server.server_port}/metrics")
+    return server
 
-def renew_server_instance(session, server_id_sn):
-    renew_url = f"{BASE_URL}/server/detail/{server_id_sn}/renew"
-    log_message(f"尝试为服务器 {server_id_sn} 续费，请求 URL: {renew_url}")
-    current_renew_payload = {
-        "month": "1",
-        "submit": "1",
-        "coupon_id": "0" # 通常优惠券ID为0表示不使用或无效优惠券
-    }
-    try:
-        # 先访问详情页以获取必要的cookie和token
-        detail_url = f"{BASE_URL}/server/detail/{server_id_sn}"
-        log_message(f"先访问详情页: {detail_url}")
-        session.get(detail_url, headers=get_headers(), timeout=30)
-        
-        # 等待一下再续费
-        time.sleep(random.uniform(2, 4))
-        
-        renew_headers = get_headers()
-        renew_headers.update({
-            "Content-Type": "application/x-www-form-urlencoded", 
-            "Referer": detail_url,
-            "X-Requested-With": "XMLHttpRequest"
-        })
-        
-        response = session.post(renew_url, data=current_renew_payload, headers=renew_headers, timeout=45)
-        response.raise_for_status()
+# ===================== 录制与回放 =====================
+_SECRET_FIELD_RE = re.compile(r'pass', re.I)
+_COOKIE_VALUE_RE = re.compile(r'^([^=;]+)=[^;]*')
+_CASSETTE_SKIPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+def _redact_body(body):
+    """请求体中名称含 pass 的表单字段替换为 ***"""
+    if isinstance(body, bytes):
         try:
-            resp_json = response.json()
-            log_message(f"续费响应JSON: {resp_json}", is_debug=True)
-            if resp_json.get("code") == 0:
-                success_msg = resp_json.get("msg", "续费操作已提交，请稍后在网站确认状态。")
-                log_message(f"续费成功信息: {success_msg}")
-                return True, success_msg
-            else:
-                error_msg = resp_json.get("msg", "续费失败，未提供具体原因。")
-                log_message(f"续费失败 (API返回错误): {error_msg} (code: {resp_json.get('code')})")
-                return False, error_msg
-        except json.JSONDecodeError:
-            log_message("续费响应不是有效的JSON格式。检查原始响应文本。")
-            log_message(f"续费响应原文 (前500字符): {response.text[:500]}", is_debug=True)
-            if "success" in response.text.lower() or "成功" in response.text:
-                 msg = "续费请求已发送，响应非JSON但包含成功字样。"
-                 log_message(msg)
-                 return True, msg
-            return False, "续费失败，响应非JSON且未找到成功标识。"
-    except requests.exceptions.RequestException as e:
-        log_message(f"续费服务器 {server_id_sn} 失败 (网络请求错误): {e}")
-        return False, f"网络请求错误: {e}"
-    except Exception as e:
-        log_message(f"续费服务器 {server_id_sn} 时发生未知错误: {e}\n{traceback.format_exc() if DEBUG_MODE else ''}")
-        return False, f"未知错误: {e}"
+            body = body.decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+    if not body or "=" not in body:
+        return body
+    fields = parse_qsl(body, keep_blank_values=True)
+    return urlencode([(k, "***" if _SECRET_FIELD_RE.search(k) else v) for k, v in fields])
 
-def main():
+def load_cassette(path):
+    """读取录制文件，返回每次交换的字典列表；录制进程被中断导致文件不完整时保留已读出的部分"""
+    import gzip
+    entries = []
     try:
-        check_env_vars()
-        log_message("脚本开始执行...")
-        session = login_session()
-        if not session:
-            send_telegram_message("🔴 登录 Freecloud 失败，脚本终止。", is_error=True)
-            return
-        log_message(f"登录成功。开始检查服务器 {FC_MACHINE_ID} 的状态...")
-        server_info_data = get_server_info(session, FC_MACHINE_ID)
-        if not server_info_data:
-            msg = f"⚠️ 未能获取服务器 {FC_MACHINE_ID} 的信息，无法继续续费操作。"
-            log_message(msg)
-            send_telegram_message(msg, is_error=True)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entries.append(json.loads(line))
+    except FileNotFoundError:
+        raise ValueError(f"回放记录文件不存在: {path}")
+    except (EOFError, ValueError) as e:
+        if not entries:
+            raise ValueError(f"回放记录文件无法读取: {path} ({e})")
+        log_message(f"回放记录文件不完整，只使用前 {len(entries)} 条: {e}", level="WARNING")
+    return entries
+
+class Cassette:
+    """
+    录制 / 回放一次运行中的全部 HTTP 交换，文件为 gzip 压缩的JSON行，每行一次请求及其响应（或网络错误）。
+    在传输适配器一层工作，重定向的每一跳、重试的每一次都单独记录；回放时不建立任何连接。
+    交换按 (账户, 方法, 路径和查询) 分组并按顺序回放，与站点地址无关，线上录制的记录可以对着任意 FC_BASE_URL 回放；
+    批量模式下各账户并发执行也不会互相取错响应。
+    录制时不保存请求的 Cookie，密码字段替换为 ***，响应中 Set-Cookie 的值替换为占位符。
+    """
+
+    def __init__(self, path, mode):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"未知的 FC_CASSETTE_MODE: {mode}，可选: record, replay")
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.file = None  # 录制时首次写入才创建
+        self.queues = {}  # 回放：键 -> 未回放的交换
+        self.recorded = 0
+        self.played = 0
+        self.misses = 0
+        if mode == "replay":
+            for entry in load_cassette(path):
+                self.queues.setdefault(entry["key"], collections.deque()).append(entry)
+
+    @staticmethod
+    def key(method, url):
+        parts = urlsplit(url)
+        path = f"{parts.path or '/'}?{parts.query}" if parts.query else parts.path or "/"
+        return f"{getattr(_log_context, 'account', None) or '-'} {method.upper()} {path}"
+
+    def install(self, session):
+        """回放时用回放适配器替换会话的所有适配器，录制时包装已有适配器（保留 cloudscraper 的 TLS 设置）"""
+        if self.mode == "replay":
+            adapter = _ReplayAdapter(self)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
             return
-        remaining_days = server_info_data["remaining_days"]
-        server_id_sn = server_info_data["id_sn"]
-        days_threshold = 3.0
-        if remaining_days < days_threshold:
-            log_message(f"服务器 {server_id_sn} 剩余 {remaining_days:.2f} 天 (少于 {days_threshold} 天)，需要续费。")
-            send_telegram_message(f"⏳ 服务器 {server_id_sn} 剩余 {remaining_days:.2f} 天，尝试自动续费...", is_error=False)
-            renew_success, renew_message = renew_server_instance(session, server_id_sn)
-            if renew_success:
-                final_message = f"✅ 服务器 {server_id_sn} 续费成功！\n续费结果: {renew_message}\n原剩余: {remaining_days:.2f} 天。"
-                log_message(final_message)
-                send_telegram_message(final_message)
-                log_message("等待几秒后尝试重新获取服务器信息以确认续费...")
-                time.sleep(10)
-                updated_server_info = get_server_info(session, server_id_sn)
-                if updated_server_info:
-                    log_message(f"更新后服务器 {server_id_sn} 剩余天数: {updated_server_info['remaining_days']:.2f}")
-                    send_telegram_message(f"ℹ️ 更新后服务器 {server_id_sn} 剩余: {updated_server_info['remaining_days']:.2f} 天。")
-                else:
-                    log_message("未能获取续费后的服务器信息。")
+        for adapter in session.adapters.values():
+            if not getattr(adapter, "fc_recording", False):
+                adapter.send = functools.partial(self._record_send, adapter.send)
+                adapter.fc_recording = True
+
+    def _record_send(self, send, request, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = send(request, **kwargs)
+            response.content  # 流式请求录制时也完整读取，之后从内存中分块返回
+        except requests.exceptions.RequestException as e:
+            self.record(request, time.perf_counter() - started, error=e)
+            raise
+        self.record(request, time.perf_counter() - started, response=response)
+        return response
+
+    def record(self, request, elapsed, response=None, error=None):
+        entry = {
+            "key": self.key(request.method, request.url),
+            "url": request.url,
+            "body": _redact_body(request.body),
+            "elapsed": round(elapsed, 4),
+        }
+        if error is not None:
+            entry["error"] = {"type": type(error).__name__, "message": str(error)}
+        else:
+            headers = []
+            for name, value in getattr(response.raw, "headers", response.headers).items():
+                if name.lower() in _CASSETTE_SKIPPED_HEADERS:
+                    continue
+                if name.lower() == "set-cookie":
+                    value = _COOKIE_VALUE_RE.sub(r'\1=recorded', value)
+                headers.append([name, value])
+            entry["response"] = {"status": response.status_code, "reason": response.reason, "headers": headers}
+            try:
+                entry["response"]["text"] = response.content.decode("utf-8")
+            except UnicodeDecodeError:
+                import base64
+                entry["response"]["base64"] = base64.b64encode(response.content).decode("ascii")
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.file is None:
+                import gzip
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                # 页面内容中有账户信息，只允许当前用户读写
+                fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                self.file = gzip.open(os.fdopen(fd, "wb"), "wt", encoding="utf-8")
+                atexit.register(self.close)
+            self.file.write(line)
+            self.recorded += 1
+
+    def play(self, request):
+        """取出该请求的下一条记录并构造响应；记录中是网络错误时抛出同类异常"""
+        key = self.key(request.method, request.url)
+        with self.lock:
+            queue_ = self.queues.get(key)
+            entry = queue_.popleft() if queue_ else None
+            if entry is None:
+                self.misses += 1
             else:
-                final_message = f"❌ 服务器 {server_id_sn} 续费失败。\n失败原因: {renew_message}\n原剩余: {remaining_days:.2f} 天。"
-                log_message(final_message)
-                send_telegram_message(final_message, is_error=True)
+                self.played += 1
+        if entry is None:
+            error = requests.exceptions.RequestException(f"回放记录中没有更多的响应: {key}", request=request)
+            error.cassette_miss = True
+            raise error
+        if "error" in entry:
+            error_class = getattr(requests.exceptions, entry["error"]["type"], requests.exceptions.ConnectionError)
+            raise error_class(entry["error"]["message"], request=request)
+        recorded = entry["response"]
+        if "text" in recorded:
+            body = recorded["text"].encode("utf-8")
         else:
-            final_message = f"ℹ️ 服务器 {server_id_sn} 剩余 {remaining_days:.2f} 天 (多于或等于 {days_threshold} 天)，无需续费。"
-            log_message(final_message)
-            send_telegram_message(final_message)
+            import base64
+            body = base64.b64decode(recorded.get("base64", ""))
+        import http.client
+        message = http.client.HTTPMessage()
+        for name, value in recorded["headers"]:
+            message[name] = value
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response.reason = recorded["reason"]
+        response.headers = requests.structures.CaseInsensitiveDict(
+            (name, ", ".join(message.get_all(name))) for name in set(message.keys()))
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(body)
+        # requests 从 raw._original_response.msg 中提取 Set-Cookie
+        response.raw._original_response = type("RecordedResponse", (), {"msg": message})()
+        response.url = request.url
+        response.request = request
+        requests.cookies.extract_cookies_to_jar(response.cookies, request, response.raw)
+        return response
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+                log_message("已录制 %d 次请求到 %s", self.recorded, self.path, is_debug=True)
+
+class _ReplayAdapter:
+    """requests 传输适配器：从录制记录中取响应"""
+
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        return self.cassette.play(request)
+
+    def close(self):
+        pass
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+def get_cassette():
+    """获取本次运行的录制 / 回放记录，回放时第一次调用即读入整个文件"""
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(CASSETTE_FILE, CASSETTE_MODE)
+        return _cassette
+
+# ===================== 调用策略 =====================
+class CircuitBreaker:
+    """
+    单个主机的熔断器：连续临时性失败达到阈值后熔断，期间的请求直接失败；
+    冷却结束后放行一个试探请求，成功则恢复，失败则重新熔断。
+    """
+
+    def __init__(self, host, threshold, cooldown):
+        self.host = host
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """请求前检查，熔断中返回还需等待的秒数，可以发起请求时返回 None"""
+        with self.lock:
+            if self.opened_at is None:
+                return None
+            wait = self.opened_at + self.cooldown - time.monotonic()
+            if wait > 0 or self.probing:
+                return max(wait, 0.0)
+            self.probing = True
+            return None
+
+    def record(self, ok):
+        with self.lock:
+            self.probing = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    log_message(f"⚡ 主机 {self.host} 连续 {self.failures} 次请求失败，熔断 {self.cooldown:.0f} 秒", level="WARNING")
+                self.opened_at = time.monotonic()
+
+class CallPolicy:
+    """
+    所有对外请求的统一策略：
+    - 整次运行有总时限，每个请求的超时取调用方给出的值与剩余时间中的较小者；剩余时间不足时直接放弃；
+    - 连接错误、超时和 429/5xx 等临时性失败按带随机抖动的指数退避重试，POST 只在确定服务端未处理时重试；
+    - 每个主机一个熔断器，熔断期间的请求直接失败，注定失败的运行尽快结束而不是耗尽 CI 时限。
+    放弃时抛出 requests 的 Timeout / ConnectionError，沿用各调用方现有的网络错误处理。
+    """
+
+    def __init__(self):
+        self.deadline = None
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def start(self, seconds=None):
+        """开始计时一次运行（常驻模式下每轮检查调用一次）"""
+        seconds = RUN_DEADLINE if seconds is None else seconds
+        self.deadline = time.monotonic() + seconds if seconds > 0 else None
+
+    def remaining(self):
+        """距总时限还剩的秒数（已扣除收尾预留），不限时返回 None"""
+        if self.deadline is None:
+            return None
+        return self.deadline - DEADLINE_RESERVE - time.monotonic()
+
+    def call_timeout(self, requested):
+        remaining = self.remaining()
+        if remaining is None:
+            return requested
+        if remaining < MIN_CALL_TIMEOUT:
+            raise requests.exceptions.Timeout(f"运行总时限即将用完（剩余 {max(remaining, 0):.1f} 秒），放弃请求")
+        return remaining if requested is None else min(requested, remaining)
+
+    def breaker(self, host):
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(host, BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+                self.breakers[host] = breaker
+            return breaker
+
+    @staticmethod
+    def _error_retryable(method, error):
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True  # 连接未建立，请求一定没有发出
+        if method.upper() == "POST":
+            reason = getattr(error.args[0], "reason", None) if error.args else None
+            return type(reason).__name__ == "NewConnectionError"
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                  requests.exceptions.ChunkedEncodingError))
+
+    def _backoff(self, attempt, response=None):
+        if CASSETTE_MODE == "replay":
+            return 0.0  # 回放时重试只是取下一条记录
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+    def call(self, send, method, url, *args, **kwargs):
+        host, path = urlsplit(url).netloc, urlsplit(url).path or "/"
+        breaker = self.breaker(host)
+        statuses = POST_RETRY_STATUSES if method.upper() == "POST" else RETRY_STATUSES
+        attempt = 0
+        while True:
+            attempt += 1
+            wait = breaker.before_call()
+            if wait is not None:
+                raise requests.exceptions.ConnectionError(f"主机 {host} 熔断中，{wait:.0f} 秒后才会再试")
+            wait = get_host_pacer(host).reserve(time.monotonic())
+            if wait > 0:
+                # 同一主机的所有请求共享间隔与令牌桶，并发登录和多账户并发时也不会超出限速
+                with trace_span("pacing", host=host):
+                    time.sleep(wait)
+            kwargs["timeout"] = self.call_timeout(kwargs.get("timeout"))
+            response = None
+            try:
+                response = send(method, url, *args, **kwargs)
+            except requests.exceptions.RequestException as e:
+                transient = self._error_retryable("GET", e)
+                breaker.record(not transient)
+                if not self._error_retryable(method, e) or attempt >= RETRY_ATTEMPTS:
+                    raise
+                reason = type(e).__name__
+            except BaseException:
+                # 其他异常（如 cloudscraper 的验证挑战错误）也要结束试探，否则熔断器会一直停在试探中
+                breaker.record(False)
+                raise
+            else:
+                transient = response.status_code in RETRY_STATUSES
+                breaker.record(not transient)
+                if response.status_code not in statuses or attempt >= RETRY_ATTEMPTS:
+                    return response
+                reason = f"HTTP {response.status_code}"
+
+            delay = self._backoff(attempt, response)
+            remaining = self.remaining()
+            if remaining is not None and delay + MIN_CALL_TIMEOUT > remaining:
+                log_message("剩余时间不足以重试 %s %s（%s），放弃", method, path, reason, is_debug=True)
+                if response is not None:
+                    return response
+                raise requests.exceptions.Timeout(f"运行总时限即将用完，放弃重试（{reason}）")
+            if response is not None:
+                response.close()
+            log_message("%s %s 失败（%s），%.1f 秒后第 %d 次尝试", method, path, reason, delay, attempt + 1,
+                        is_debug=True)
+            time.sleep(delay)
+
+RUN_POLICY = CallPolicy()
+
+# ===================== Telegram 通知功能 =====================
+TELEGRAM_MAX_LENGTH = 4096  # Telegram 单条消息长度上限
+TELEGRAM_MIN_INTERVAL = 1.0  # 同一聊天大约每秒最多1条消息
+TELEGRAM_MAX_RETRIES = 4
+
+class TelegramNotifier:
+    """
+    后台发送 Telegram 消息：单独线程、复用一个 HTTP 连接、失败按指数退避重试并遵守 429 限速。
+    摘要模式下先收集本次运行的所有消息，flush 时每个分组（账户）合并成一条发送。
+    """
+
+    def __init__(self, bot_token, chat_id, digest=True):
+        self.url = f"{TELEGRAM_API_URL}/bot{bot_token}/sendMessage"
+        self.chat_id = chat_id
+        self.digest = digest
+        self.events = {}  # 分组 -> [(消息, 是否错误), ...]
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = None
+        self.http = None
+        self.last_sent = 0.0
+
+    def notify(self, message, is_error=False, group=None):
+        """记录或排队一条消息，立即返回"""
+        if self.digest:
+            with self.lock:
+                self.events.setdefault(group, []).append((message, is_error))
+        else:
+            self._enqueue(message)
+
+    def flush(self):
+        """把已收集的消息按分组合并成摘要并排队发送"""
+        with self.lock:
+            events, self.events = self.events, {}
+        for group, items in events.items():
+            errors = sum(1 for _, is_error in items if is_error)
+            title = f"📋 Freecloud 运行摘要{f' [{group}]' if group else ''}"
+            if errors:
+                title += f"（{errors} 条异常）"
+            for chunk in self._split("\n\n".join([title] + [message for message, _ in items])):
+                self._enqueue(chunk)
+
+    def close(self, timeout=60):
+        """发送剩余消息并等待后台线程结束"""
+        self.flush()
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _split(self, text):
+        """按行切分超长消息，保证每段不超过 Telegram 的长度上限"""
+        chunks, current = [], ""
+        for line in text.split("\n"):
+            if len(line) > TELEGRAM_MAX_LENGTH and current:
+                chunks.append(current)
+                current = ""
+            while len(line) > TELEGRAM_MAX_LENGTH:
+                chunks.append(line[:TELEGRAM_MAX_LENGTH])
+                line = line[TELEGRAM_MAX_LENGTH:]
+            if len(current) + len(line) + 1 > TELEGRAM_MAX_LENGTH:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n{line}" if current else line
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _enqueue(self, message):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._worker, name="telegram-notifier", daemon=True)
+                self.thread.start()
+        self.queue.put(message)
+
+    def _worker(self):
+        self.http = instrument_session(requests.Session(), policy=False)  # 通知有自己的重试，且不受运行总时限约束
+        try:
+            while True:
+                message = self.queue.get()
+                if message is None:
+                    return
+                with trace_span("notify", length=len(message)):
+                    self._send(message)
+        finally:
+            self.http.close()
+
+    @staticmethod
+    def _retry_after(response, attempt):
+        """
+        429 响应要求等待的秒数：优先取 Telegram JSON 中的 retry_after，其次 Retry-After 头，
+        都读不到时（如代理返回的 HTML 页面）按指数退避计算，总之重试而不是丢弃消息。
+        """
+        try:
+            value = response.json()["parameters"]["retry_after"]
+        except (ValueError, KeyError, TypeError):
+            value = response.headers.get("Retry-After")
+        try:
+            return max(0.0, float(value))
+        except (TypeError, ValueError):
+            return 2 ** attempt + random.uniform(0, 1)
+
+    def _send(self, message):
+        payload = {
+            "chat_id": self.chat_id,
+            "text": message,
+            "parse_mode": "Markdown"  # 允许简单的Markdown格式
+        }
+        for attempt in range(TELEGRAM_MAX_RETRIES):
+            wait_time = self.last_sent + TELEGRAM_MIN_INTERVAL - time.monotonic()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            try:
+                response = self.http.post(self.url, data=payload, timeout=15)
+                self.last_sent = time.monotonic()
+                if response.status_code == 429:
+                    retry_after = self._retry_after(response, attempt)
+                    log_message(f"Telegram 限速，{retry_after:.0f} 秒后重试")
+                    time.sleep(retry_after)
+                    continue
+                if response.status_code == 400 and "parse_mode" in payload:
+                    # 拆分后的消息可能破坏 Markdown 结构，改为纯文本重发
+                    payload.pop("parse_mode")
+                    continue
+                response.raise_for_status()
+                log_message("Telegram通知已成功发送。")
+                return
+            except requests.exceptions.RequestException as e:
+                log_message(f"Telegram通知失败 (请求异常，第 {attempt + 1} 次): {e}", level="WARNING")
+            except Exception as e:
+                log_message(f"Telegram通知发送时发生未知错误: {e}", level="WARNING")
+                return
+            time.sleep(2 ** attempt + random.uniform(0, 1))
+        log_message("Telegram通知多次重试后仍然失败，放弃发送。", level="ERROR")
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+def get_notifier():
+    """获取全局通知器，未配置 Telegram 或回放时返回 None"""
+    global _notifier
+    if not BOT_TOKEN or not CHAT_ID or CASSETTE_MODE == "replay":
+        return None
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = TelegramNotifier(BOT_TOKEN, CHAT_ID, digest=TELEGRAM_DIGEST)
+            atexit.register(_notifier.close)
+        return _notifier
+
+def flush_notifications(wait_for_delivery=False):
+    """发送已收集的摘要；wait_for_delivery 为 True 时等待全部发送完毕"""
+    notifier = _notifier
+    if notifier is None:
+        return
+    if wait_for_delivery:
+        notifier.close()
+    else:
+        notifier.flush()
+
+def send_telegram_message(message, is_error=False):
+    """通过Telegram机器人发送消息（后台发送，批量模式下按账户归入摘要）"""
+    notifier = get_notifier()
+    if notifier is None:
+        if CASSETTE_MODE == "replay":
+            log_message("回放模式不发送通知: %s", message, is_debug=True)
+        else:
+            log_message("Telegram BOT_TOKEN 或 CHAT_ID 未配置，跳过发送通知。")
+        return
+    notifier.notify(message, is_error=is_error, group=getattr(_log_context, "account", None))
+
+# ===================== 页面解析 =====================
+# 各模式都以固定文字开头，re 可以直接跳到候选位置；合成一个多分支的大正则反而要在每个字符上逐一尝试分支，实测更慢
+_CAPTCHA_RE = re.compile(r'placeholder=["\']([0-9]+)\s*([+\-*/])\s*([0-9]+)\s*=\s*\?["\']')
+_FORM_TAG_RE = re.compile(r'<(?:input|meta)\b[^>]*>')
+_TAG_ATTR_RE = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))')
+_LOGOUT_RE = re.compile(r'logout', re.I)
+_DETAIL_LINK_RE = re.compile(r'/server/detail/([A-Za-z0-9_-]+)')
+_ROW_CLOSE_RE = re.compile(r'</tr>', re.I)
+_DAYS_LEFT_RE = re.compile(r'(\d+)天后')
+_STATUS_RE = re.compile(r'(运行中|已停止|已关机|已暂停|已过期|已到期|创建中|running|stopped|suspended|expired)', re.I)
+_PAGE_LINK_RE = re.compile(r'page=(\d+)')
+_MONTH_SELECT_RE = re.compile(r'<select\b[^>]*name=["\']?month\b[^>]*>(.*?)</select>', re.I | re.S)
+_OPTION_VALUE_RE = re.compile(r'<option\b[^>]*value=["\']?(\d+)', re.I)
+
+@functools.lru_cache(maxsize=32)
+def _username_re(username):
+    return re.compile(re.escape(username), re.I)
+
+def _tag_attrs(tag):
+    """标签的属性字典，属性名转为小写"""
+    return {m.group(1).lower(): next(v for v in m.group(2, 3, 4) if v is not None) for m in _TAG_ATTR_RE.finditer(tag)}
+
+def _solve_captcha(num1, operator, num2):
+    if operator == "+":
+        return num1 + num2
+    if operator == "-":
+        return num1 - num2
+    if operator == "*":
+        return num1 * num2
+    # 假设结果总是整数
+    return num1 // num2 if num2 else None
+
+def _find_days_left(html, start=0, end=None):
+    """html[start:end] 中第一个"N天后"的 N，没有时返回 None；先找固定文字"天后"，再向前取数字"""
+    end = len(html) if end is None else end
+    index = html.find("天后", start, end)
+    while index != -1:
+        digits = index
+        while digits > start and html[digits - 1].isdigit():
+            digits -= 1
+        if digits < index:
+            return int(html[digits:index])
+        index = html.find("天后", index + 2, end)
+    return None
+
+class PageExtract:
+    """
+    一个响应的解析结果，各调用方共用，不再各自扫描整页。每一项在第一次访问时解析并缓存：
+    captcha：(表达式如 "5 + 7", 答案) 或 None；login_state：登录状态；
+    form_tokens：隐藏表单字段和 csrf-token 等 meta 标签；
+    servers：{id_sn: {"id_sn", "remaining_days", "status", "detail_url"}}，按表格行解析；
+    last_page：分页链接中的最大页码；days_left：页面上第一个"N天后"；
+    renew_months：续费表单中可选的月数（升序）。
+    """
+
+    def __init__(self, html, username=None):
+        self.html = html
+        self.username = username
+
+    @functools.cached_property
+    def captcha(self):
+        match = _CAPTCHA_RE.search(self.html)
+        if not match:
+            return None
+        num1, operator, num2 = int(match.group(1)), match.group(2), int(match.group(3))
+        return f"{num1} {operator} {num2}", _solve_captcha(num1, operator, num2)
+
+    @functools.cached_property
+    def login_state(self):
+        """"user" / "logout" 表示已登录（找到用户名 / 退出链接），"failed" 表示登录失败，None 表示无法确定"""
+        html, username = self.html, self.username
+        # 先按原样查找，找不到时才做不区分大小写的搜索
+        if username and (username in html or _username_re(username).search(html)):
+            return "user"
+        if "退出登录" in html or "logout" in html or _LOGOUT_RE.search(html):
+            return "logout"
+        if "验证码" in html or "重新登录" in html:
+            return "failed"
+        return None
+
+    @functools.cached_property
+    def _form_tags(self):
+        """页面上所有 <input> / <meta> 标签的 (是否 meta, 属性字典)，form_tokens 和 renew_months 共用这一次扫描"""
+        return [(tag.group(0).startswith("<meta"), _tag_attrs(tag.group(0))) for tag in _FORM_TAG_RE.finditer(self.html)]
+
+    @functools.cached_property
+    def form_tokens(self):
+        tokens = {}
+        for is_meta, attrs in self._form_tags:
+            if is_meta:
+                if "csrf" in attrs.get("name", "") and "content" in attrs:
+                    tokens[attrs["name"]] = attrs["content"]
+            elif attrs.get("type", "").lower() == "hidden" and attrs.get("name"):
+                tokens[attrs["name"]] = attrs.get("value", "")
+        return tokens
+
+    @functools.cached_property
+    def servers(self):
+        """
+        以详情页链接为锚点确定所在的 <tr> 行，行内第一个链接、天数和状态组成一条服务器记录。
+        不在表格行内的链接和没有闭合的行（流式读取的半截内容）会被忽略。
+        """
+        html = self.html
+        servers = {}
+        row_end = 0
+        for link in _DETAIL_LINK_RE.finditer(html):
+            if link.start() < row_end:
+                continue  # 同一行内的其他链接
+            row_start = max(html.rfind("<tr", row_end, link.start()), html.rfind("<TR", row_end, link.start()))
+            if row_start == -1:
+                continue
+            close = _ROW_CLOSE_RE.search(html, link.end())
+            if not close:
+                break
+            row_end = close.end()
+            id_sn = link.group(1)
+            if id_sn in servers:
+                continue
+            status = _STATUS_RE.search(html, row_start, row_end)
+            servers[id_sn] = {
+                "id_sn": id_sn,
+                "remaining_days": _find_days_left(html, row_start, row_end),
+                "status": status.group(1) if status else None,
+                "detail_url": f"{BASE_URL}/server/detail/{id_sn}",
+            }
+        return servers
+
+    @functools.cached_property
+    def last_page(self):
+        html = self.html
+        return max((int(m.group(1)) for m in _PAGE_LINK_RE.finditer(html)
+                    if m.start() > 0 and html[m.start() - 1] in "?&;"), default=1)
+
+    @functools.cached_property
+    def days_left(self):
+        return _find_days_left(self.html)
+
+    @functools.cached_property
+    def renew_months(self):
+        """下拉框或单选按钮形式的 month 字段中的所有数字选项，页面上没有时为空列表"""
+        months = set()
+        select = _MONTH_SELECT_RE.search(self.html)
+        if select:
+            months.update(int(v) for v in _OPTION_VALUE_RE.findall(select.group(1)))
+        for is_meta, attrs in self._form_tags:
+            if not is_meta and attrs.get("name") == "month" and attrs.get("value", "").isdigit():
+                months.add(int(attrs["value"]))
+        return sorted(m for m in months if m > 0)
+
+def extract_page(html, username=None):
+    """解析一个响应，返回 PageExtract；username 用于判断登录状态"""
+    return PageExtract(html, username)
+
+# ===================== 数学验证码处理 =====================
+def get_math_captcha_solution(page_content, page=None):
+    """
+    从登录页面内容中提取并解决数学验证码
+    例如：从 "5 + 7 = ?" 提取并计算出 12
+    page 为已解析的 PageExtract（可选），传入时不再重复扫描页面。
+    """
+    try:
+        if page is None:
+            page = extract_page(page_content)
+        
+        if page.captcha is None:
+            log_message("⚠️ 未在页面中找到数学验证码", level="WARNING")
+            log_message("登录页面内容 (前2000字符): %.2000s", page_content, is_debug=True)
+            return None
+        
+        expression, answer = page.captcha
+        log_message(f"找到数学验证码: {expression} = ?")
+        if answer is None:
+            log_message(f"⚠️ 无法计算数学验证码: {expression}", level="WARNING")
+            return None
+        
+        log_message(f"数学验证码计算结果: {answer}")
+        return answer
+    except Exception as e:
+        log_message(f"解析数学验证码时出错: {e}", level="ERROR")
+        log_message(_format_exception, e, is_debug=True)
+        return None
+
+# ===================== 会话缓存 =====================
+def create_scraper(browser_config):
+    """按浏览器配置创建 cloudscraper 实例"""
+    return cloudscraper.create_scraper(
+        browser=browser_config,
+        delay=5,  # 增加延迟
+        interpreter='js2py'  # 使用js2py解释器
+    )
+
+def console_login_state(html, username=None):
+    """
+    根据控制台页面内容判断登录状态：
+    "user" / "logout" 表示已登录（找到用户名 / 退出链接），"failed" 表示登录失败，None 表示无法确定。
+    """
+    return extract_page(html, username).login_state
+
+def check_console_login(session, username=None, headers=None, timeout=30):
+    """
+    请求控制台页面并判断登录状态，返回 (状态码, 登录状态, 页面开头500字符)。
+    开启 FC_STREAM_CONSOLE 时分块读取，找到登录标识后立即停止下载。
+    """
+    if not STREAM_CONSOLE:
+        # 条件请求：紧接着获取服务器列表时页面未变化，只需一个 304
+        try:
+            html = get_page(session, CONSOLE_URL, headers=headers, timeout=timeout)
+        except requests.exceptions.HTTPError as e:
+            return e.response.status_code, None, ""
+        return 200, console_login_state(html, username), html[:500]
+
+    resp = session.get(CONSOLE_URL, headers=headers, timeout=timeout, stream=True)
+    if resp.status_code != 200:
+        resp.close()
+        return resp.status_code, None, ""
+    seen = {"head": "", "failed": False}
+
+    def match(buffer):
+        if not seen["head"]:
+            seen["head"] = buffer[:500]
+        state = console_login_state(buffer, username)
+        if state == "failed":
+            # 失败标识可能只是页面上的普通文字，继续寻找登录标识
+            seen["failed"] = True
+            return None
+        return state
+
+    state, _ = stream_scan(resp, match)
+    if state is None and seen["failed"]:
+        state = "failed"
+    return resp.status_code, state, seen["head"]
+
+def account_key(username):
+    """账户在本地状态文件中的键，使用用户名的哈希，避免明文泄露账号"""
+    return hashlib.sha256(username.encode("utf-8")).hexdigest()[:16]
+
+def load_state(name):
+    """读取 STATE_DIR 下的 JSON 状态文件，不存在或损坏时返回空字典"""
+    try:
+        with open(os.path.join(STATE_DIR, name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def update_state(name, key, value):
+    """
+    原子地更新 JSON 状态文件中的一个键。
+    整个读-改-写过程持有跨进程的文件锁，分片进程或重叠的运行同时更新时不会互相覆盖。
+    """
+    path = os.path.join(STATE_DIR, name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with state_lock(f"state-{name}", f"状态文件 {name}", timeout=10, announce=False):
+            state = load_state(name)
+            state[key] = value
+            os.makedirs(STATE_DIR, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+    except (OSError, TimeoutError) as e:
+        log_message(f"写入状态文件 {name} 失败: {e}", level="WARNING")
+
+def _session_cache_path(username):
+    """每个账户一个缓存文件"""
+    return os.path.join(STATE_DIR, "sessions", f"{account_key(username)}.json")
+
+def save_session_cache(session, username, strategy):
+    """
+    将已登录会话的 cookie 和请求头写入磁盘缓存。
+    strategy 为登录成功时使用的 LOGIN_STRATEGIES 键名。
+    """
+    if not SESSION_CACHE_ENABLED or not username:
+        return
+    now = time.time()
+    cookies = [
+        {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path,
+         "expires": c.expires, "secure": c.secure}
+        for c in session.cookies
+    ]
+    expires_at = now + SESSION_CACHE_TTL_HOURS * 3600
+    cookie_expiries = [c["expires"] for c in cookies if c["expires"]]
+    if cookie_expiries:
+        # 所有 cookie 都过期后服务端会话也就失效了，不必保留更久
+        expires_at = min(expires_at, max(cookie_expiries))
+    entry = {
+        "saved_at": now,
+        "expires_at": expires_at,
+        "strategy": strategy,
+        "headers": dict(session.headers),
+        "cookies": cookies,
+    }
+    path = _session_cache_path(username)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        # cookie 等同于登录凭证，只允许当前用户读写
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        log_message("登录会话已写入本地缓存。", is_debug=True)
+    except OSError as e:
+        log_message(f"写入会话缓存失败: {e}", level="WARNING")
+
+def clear_session_cache(username):
+    """删除账户的会话缓存"""
+    try:
+        os.remove(_session_cache_path(username))
+    except OSError:
+        pass
+
+def load_cached_session(username):
+    """
+    读取缓存的会话，并用一次控制台页面请求校验是否仍处于登录状态。
+    缓存不存在、已过期或校验失败时返回 None。
+    """
+    if not SESSION_CACHE_ENABLED or not username:
+        return None
+    path = _session_cache_path(username)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if entry.get("expires_at", 0) <= time.time():
+        log_message("会话缓存已过期，需要重新登录。")
+        clear_session_cache(username)
+        return None
+
+    try:
+        strategy = entry.get("strategy")
+        transport = get_transport(username)
+        if entry.get("headers"):
+            transport.headers = entry["headers"]  # 沿用缓存会话的请求头，服务端看到的仍是同一个"浏览器"
+        session = transport.session(strategy)
+        for c in entry.get("cookies", []):
+            session.cookies.set(c["name"], c["value"], domain=c.get("domain"), path=c.get("path") or "/",
+                                expires=c.get("expires"), secure=c.get("secure", False))
+
+        log_message("使用缓存的会话校验登录状态...")
+        with trace_span("console_verify", strategy=strategy, cached=True):
+            status_code, state, _ = check_console_login(session, username)
+        if status_code == 200 and state in ("user", "logout"):
+            record_login_attempt("cached", "success")
+            log_message("缓存会话仍然有效，跳过登录流程。")
+            # cookie 可能在服务端被刷新，重新写回缓存
+            save_session_cache(session, username, strategy)
+            return session
+        log_message(f"缓存会话已失效 (状态码: {status_code})，需要重新登录。")
+    except Exception as e:
+        log_message(f"校验缓存会话时出错: {e}")
+    record_login_attempt("cached", "failed")
+    clear_session_cache(username)
+    return None
+
+# ===================== 账户传输层 =====================
+class AccountTransport:
+    """
+    账户级传输层：每种登录方式只保留一个会话，重新登录或缓存会话失效时复用它已建立的连接（只清空 cookie）；
+    账户的所有会话使用同一组请求头，会话中途不再更换；
+    服务器列表页按 ETag / Last-Modified 发送条件请求，页面未变化时沿用上次的内容。
+    """
+
+    def __init__(self):
+        self.headers = None  # 首次创建会话时确定，或取自会话缓存
+        self._sessions = {}  # 登录方式 -> 会话
+        self._pages = {}  # 完整URL -> (ETag, Last-Modified, 页面内容)
+        self._lock = threading.Lock()
+
+    def session(self, strategy):
+        """取得该登录方式的会话；已有时复用其连接池，清空上一次登录留下的 cookie"""
+        with self._lock:
+            if self.headers is None:
+                self.headers = get_headers()
+            session = self._sessions.get(strategy)
+            if session is None:
+                session = new_session(LOGIN_STRATEGIES.get(strategy))
+                session.transport = self
+                self._sessions[strategy] = session
+            else:
+                session.cookies.clear()
+                self._pages.clear()
+            session.headers.update(self.headers)
+            return session
+
+    def get_page(self, session, url, params=None, headers=None, timeout=30):
+        """
+        GET 页面并返回页面内容。同一页面上次的响应带有 ETag / Last-Modified 时发送条件请求，
+        服务端返回 304 时沿用上次的内容。非 2xx/304 响应抛出 HTTPError。
+        """
+        key = requests.Request("GET", url, params=params).prepare().url
+        cached = self._pages.get(key) if CONDITIONAL_GET else None
+        headers = dict(headers or {})
+        if cached:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        response = session.get(url, params=params, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached:
+            log_message("页面未变化 (304)，沿用上次的内容: %s", key, is_debug=True)
+            return cached[2]
+        response.raise_for_status()
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if CONDITIONAL_GET and (etag or last_modified) and response.url == key:  # 被重定向（如跳转到登录页）时不缓存
+            self._pages[key] = (etag, last_modified, response.text)
+        return response.text
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+def get_transport(username):
+    """获取账户的传输层，同一进程内（包括常驻模式的多轮检查）共用"""
+    key = account_key(username)
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = _transports[key] = AccountTransport()
+        return transport
+
+def get_page(session, url, params=None, headers=None, timeout=30):
+    """经由会话所属账户的传输层获取页面内容；会话不是由传输层创建时直接请求"""
+    transport = getattr(session, "transport", None)
+    if transport is not None:
+        return transport.get_page(session, url, params, headers, timeout)
+    response = session.get(url, params=params, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    return response.text
+
+# ===================== 历史记录 =====================
+_history_lock = threading.Lock()
+_history_conn = None
+
+_HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    account TEXT NOT NULL, machine_id TEXT NOT NULL, observed_at REAL NOT NULL,
+    remaining_days REAL NOT NULL, predicted_days REAL, mispredicted INTEGER NOT NULL DEFAULT 0, source TEXT
+);
+CREATE INDEX IF NOT EXISTS observations_machine ON observations (account, machine_id, observed_at);
+CREATE TABLE IF NOT EXISTS renew_attempts (
+    account TEXT NOT NULL, machine_id TEXT NOT NULL, attempted_at REAL NOT NULL, ok INTEGER NOT NULL,
+    message TEXT, days_before REAL, days_after REAL, confirm_seconds REAL
+);
+CREATE TABLE IF NOT EXISTS renew_ledger (
+    account TEXT NOT NULL, machine_id TEXT NOT NULL, submitted_at REAL NOT NULL, pid INTEGER NOT NULL,
+    status TEXT NOT NULL, message TEXT, days_before REAL, days_after REAL, finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS renew_ledger_machine ON renew_ledger (account, machine_id, submitted_at);
+CREATE TABLE IF NOT EXISTS timings (
+    run_started_at REAL NOT NULL, phase TEXT NOT NULL, count INTEGER NOT NULL,
+    total_seconds REAL NOT NULL, max_seconds REAL NOT NULL
+);
+"""
+
+def _history_execute(sql, params=(), enabled=None):
+    """
+    在历史数据库上执行一条语句并返回所有结果行；未开启或数据库不可用时返回 None。
+    enabled 默认取 HISTORY_ENABLED，续费台账按自己的开关传入。
+    """
+    global _history_conn
+    if not (HISTORY_ENABLED if enabled is None else enabled):
+        return None
+    import sqlite3  # 只在用到历史记录时导入
+    with _history_lock:
+        try:
+            if _history_conn is None:
+                os.makedirs(STATE_DIR, exist_ok=True)
+                _history_conn = sqlite3.connect(HISTORY_DB, timeout=10, check_same_thread=False)
+                _history_conn.executescript(_HISTORY_SCHEMA)
+            with _history_conn:
+                return _history_conn.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            log_message(f"访问历史记录数据库失败: {e}", level="WARNING")
+            return None
+
+def _latest_observation(username, machine_id):
+    rows = _history_execute(
+        "SELECT observed_at, remaining_days, mispredicted FROM observations "
+        "WHERE account = ? AND machine_id = ? ORDER BY observed_at DESC LIMIT 1",
+        (account_key(username or ""), str(machine_id)))
+    return rows[0] if rows else None
+
+def record_observation(username, machine_id, remaining_days, source="check"):
+    """
+    记录一次实际看到的剩余天数，并与按上一条记录推算的值比较。
+    相差超过 HISTORY_TOLERANCE_DAYS 时标记为预测失误，此后在下一次相符的实际检查前不再跳过。
+    续费后的确认（source="confirm"）天数本就会变化，不参与比较。
+    """
+    if remaining_days is None:
+        return
+    METRICS.machine_checked(username, machine_id, remaining_days)
+    now = time.time()
+    latest = _latest_observation(username, machine_id)
+    predicted = None
+    if latest and source != "confirm":
+        predicted = latest[1] - (now - latest[0]) / 86400
+    mispredicted = predicted is not None and abs(predicted - remaining_days) > HISTORY_TOLERANCE_DAYS
+    if mispredicted:
+        log_message(f"服务器 {machine_id} 实际剩余 {remaining_days} 天，与历史推算的 {predicted:.2f} 天不符，"
+                    f"下次将重新检查")
+    _history_execute(
+        "INSERT INTO observations (account, machine_id, observed_at, remaining_days, predicted_days, mispredicted, source) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (account_key(username or ""), str(machine_id), now, remaining_days, predicted, int(mispredicted), source))
+
+def record_renew_attempt(username, machine_id, ok, message, days_before, days_after=None, confirm_seconds=None):
+    """记录一次续费尝试及其结果"""
+    _history_execute(
+        "INSERT INTO renew_attempts (account, machine_id, attempted_at, ok, message, days_before, days_after, confirm_seconds) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (account_key(username or ""), str(machine_id), time.time(), int(bool(ok)), message,
+         days_before, days_after, confirm_seconds))
+
+def record_run_timings(run_started_at, summary_rows):
+    """把本次运行各阶段的耗时汇总（Tracer.summary_rows()）写入历史"""
+    for name, count, total, longest, _, _ in summary_rows:
+        _history_execute(
+            "INSERT INTO timings (run_started_at, phase, count, total_seconds, max_seconds) VALUES (?, ?, ?, ?, ?)",
+            (run_started_at, name, count, total, longest))
+
+def predict_remaining_days(username, machine_id):
+    """
+    按最近一次实际检查推算当前剩余天数，返回 (预测天数, 距上次检查的小时数)。
+    没有记录、上次检查发现预测失误或距上次检查超过 HISTORY_MAX_SKIP_HOURS 时返回 None。
+    """
+    latest = _latest_observation(username, machine_id)
+    if not latest:
+        return None
+    observed_at, remaining_days, mispredicted = latest
+    age_hours = (time.time() - observed_at) / 3600
+    if mispredicted or age_hours >= HISTORY_MAX_SKIP_HOURS:
+        return None
+    return remaining_days - age_hours / 24, age_hours
+
+def skip_by_history(username, machine_id, days_threshold=DAYS_THRESHOLD, announce=True):
+    """
+    预测剩余天数足够安全时跳过该服务器的所有网络操作，返回结果字典；需要实际检查时返回 None。
+    announce 为 False 时不打印日志和发送通知，由调用方确定真的跳过后再调用 announce_history_skip。
+    """
+    prediction = predict_remaining_days(username, machine_id)
+    if prediction is None:
+        return None
+    predicted, age_hours = prediction
+    if predicted < days_threshold + HISTORY_MARGIN_DAYS:
+        return None
+    result = {"machine_id": machine_id, "remaining_days": predicted, "renewed": False, "ok": True,
+              "message": "根据历史记录跳过", "skipped": True, "age_hours": age_hours}
+    if announce:
+        announce_history_skip(result)
+    return result
+
+def announce_history_skip(result):
+    msg = (f"ℹ️ 服务器 {result['machine_id']} 预计剩余 {result['remaining_days']:.2f} 天"
+           f"（根据 {result['age_hours']:.1f} 小时前的检查），本次跳过检查。")
+    log_message(msg)
+    send_telegram_message(msg)
+
+# ===================== 运行锁与续费台账 =====================
+_LOCK_NAME_RE = re.compile(r'[^A-Za-z0-9_-]')
+
+@contextlib.contextmanager
+def state_lock(name, description, timeout=None, announce=True):
+    """
+    STATE_DIR/locks/{name}.lock 上的排他文件锁（flock），对其他进程和本进程的其他线程都有效。
+    锁被占用时每隔一小段时间重试，最多等待 timeout 秒（默认 FC_LOCK_TIMEOUT，不超出运行总时限），超时抛出 TimeoutError。
+    announce 为 False 时等待不打印日志（只持有很短时间的锁）。
+    进程退出时操作系统自动释放，不会因为崩溃留下死锁。没有 fcntl 的平台（Windows）上不加锁。
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    timeout = LOCK_TIMEOUT if timeout is None else timeout
+    remaining = RUN_POLICY.remaining()
+    if remaining is not None:
+        timeout = max(0.0, min(timeout, remaining - MIN_CALL_TIMEOUT))
+    path = os.path.join(STATE_DIR, "locks", f"{_LOCK_NAME_RE.sub('_', name)}.lock")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        started = time.monotonic()
+        announced = False
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() - started >= timeout:
+                    raise TimeoutError(f"等待另一次运行处理完{description}超时（{timeout:.0f} 秒）")
+                if announce and not announced:
+                    log_message(f"另一次运行正在处理{description}，等待其完成...")
+                    announced = True
+                time.sleep(0.2 if announce else 0.02)
+        if announced:
+            log_message(f"另一次运行已处理完{description}（等待 {time.monotonic() - started:.1f} 秒）")
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode("ascii"))  # 便于排查是哪个进程持有锁
+        yield
+    finally:
+        os.close(fd)  # 关闭即释放锁
+
+def account_lock(username):
+    """账户锁：同一账户同一时间只有一个运行在登录和获取服务器列表"""
+    return state_lock(account_key(username), f"账户 {mask_value(username)}")
+
+def machine_lock(username, machine_id):
+    """服务器锁：同一台服务器同一时间只有一个运行在提交和确认续费"""
+    return state_lock(f"{account_key(username or '')}-{machine_id}", f"服务器 {machine_id}")
+
+def ledger_begin(username, machine_id, days_before):
+    """在台账中登记一次即将提交的续费（pending），返回登记时间，用于之后更新结果"""
+    submitted_at = time.time()
+    _history_execute(
+        "INSERT INTO renew_ledger (account, machine_id, submitted_at, pid, status, days_before) "
+        "VALUES (?, ?, ?, ?, 'pending', ?)",
+        (account_key(username or ""), str(machine_id), submitted_at, os.getpid(), days_before),
+        enabled=RENEW_LEDGER_ENABLED)
+    return submitted_at
+
+def ledger_finish(username, machine_id, submitted_at, ok, message, days_after=None, status=None):
+    """更新台账中一次续费的结果；status 默认按 ok 取 ok / failed"""
+    _history_execute(
+        "UPDATE renew_ledger SET status = ?, message = ?, days_after = ?, finished_at = ? "
+        "WHERE account = ? AND machine_id = ? AND submitted_at = ?",
+        (status or ("ok" if ok else "failed"), message, days_after, time.time(),
+         account_key(username or ""), str(machine_id), submitted_at),
+        enabled=RENEW_LEDGER_ENABLED)
+
+def recent_renewal(username, machine_id):
+    """
+    查找 FC_RENEW_LEDGER_MINUTES 内该服务器最近一次成功或结果未知（pending，提交者中途退出）的续费，
+    返回字典（submitted_at / status / message / days_before / days_after），没有时返回 None。
+    """
+    rows = _history_execute(
+        "SELECT submitted_at, status, message, days_before, days_after FROM renew_ledger "
+        "WHERE account = ? AND machine_id = ? AND submitted_at >= ? AND status IN ('ok', 'pending') "
+        "ORDER BY submitted_at DESC LIMIT 1",
+        (account_key(username or ""), str(machine_id), time.time() - RENEW_LEDGER_MINUTES * 60),
+        enabled=RENEW_LEDGER_ENABLED)
+    if not rows:
+        return None
+    return dict(zip(("submitted_at", "status", "message", "days_before", "days_after"), rows[0]))
+
+def ahead_rejected(username, machine_id, remaining_days=None):
+    """
+    该服务器上一次提前续费是否被网站拒绝、且之后还没有续费过（台账中最近一次已完成的续费是 rejected_ahead，
+    剩余天数也没有超过当时的值）。是的话在它低于阈值之前不再提前续费，免得每次运行都提交一次注定失败的请求。
+    """
+    rows = _history_execute(
+        "SELECT status, days_before FROM renew_ledger "
+        "WHERE account = ? AND machine_id = ? AND status IN ('ok', 'rejected_ahead') "
+        "ORDER BY submitted_at DESC LIMIT 1",
+        (account_key(username or ""), str(machine_id)),
+        enabled=RENEW_LEDGER_ENABLED)
+    if not rows or rows[0][0] != "rejected_ahead":
+        return False
+    days_before = rows[0][1]
+    return remaining_days is None or days_before is None or remaining_days <= days_before
+
+# ===================== Freecloud 操作 =====================
+def login_session(username=None, password=None):
+    """
+    模拟登录到 Freecloud，返回一个带有登录会话的 cloudscraper 实例。
+    未传入账户信息时使用环境变量 FC_USERNAME / FC_PASSWORD。
+    优先复用本地缓存的会话，校验失败时才走完整的登录流程。
+    """
+    username = username or FC_USERNAME
+    password = password or FC_PASSWORD
+    session = load_cached_session(username)
+    if session is not None:
+        return session
+    session, strategy, confirmed = _fresh_login(username, password)
+    if confirmed:
+        save_session_cache(session, username, strategy)
+    return session
+
+class LoginCancelled(Exception):
+    """并发登录时其他方式已先成功，当前尝试被取消"""
+
+def _check_cancelled(cancel_event, session):
+    if cancel_event is not None and cancel_event.is_set():
+        session.close()
+        raise LoginCancelled()
+
+def remember_login_strategy(username, strategy):
+    """记录账户上次登录成功的方式，下次优先尝试"""
+    update_state("login_strategy.json", account_key(username), {"strategy": strategy, "updated_at": time.time()})
+
+def ordered_login_strategies(username):
+    """按尝试顺序返回登录方式，上次成功的方式排在最前"""
+    order = list(LOGIN_STRATEGIES)
+    last = load_state("login_strategy.json").get(account_key(username), {}).get("strategy")
+    if last in order:
+        order.remove(last)
+        order.insert(0, last)
+    return order
+
+def login_with_strategy(strategy, username, password, cancel_event=None):
+    """
+    使用一种登录方式完成一次完整登录。
+    成功返回 (会话, 是否已确认登录成功)，失败返回 None。cancel_event 被设置时尽快放弃。
+    """
+    browser_config = LOGIN_STRATEGIES[strategy]
+    try:
+        if browser_config:
+            log_message("尝试使用浏览器配置: %s", browser_config, is_debug=True)
+        else:
+            log_message("尝试使用标准requests登录...")
+        session = get_transport(username).session(strategy)
+        
+        # 首先访问首页以获取必要的cookie
+        log_message("访问首页获取初始cookie...")
+        with trace_span("home_page", strategy=strategy):
+            home_resp = session.get(BASE_URL, timeout=30)
+        _check_cancelled(cancel_event, session)
+        if home_resp.status_code != 200:
+            log_message("首页访问失败，状态码: %s", home_resp.status_code, is_debug=True)
+            return None
+            
+        log_message("成功访问首页，等待几秒后继续...")
+        pace("after_home")  # 模拟人类行为的延迟
+        
+        # 访问登录页面获取数学验证码
+        log_message("访问登录页面获取数学验证码...")
+        with trace_span("login_page", strategy=strategy):
+            login_page_resp = session.get(f"{BASE_URL}/login", timeout=30)
+        _check_cancelled(cancel_event, session)
+        if login_page_resp.status_code != 200:
+            log_message("登录页面访问失败，状态码: %s", login_page_resp.status_code, is_debug=True)
+            return None
+        
+        # 解析数学验证码
+        with trace_span("captcha_solve", strategy=strategy):
+            login_page = extract_page(login_page_resp.text)
+            math_solution = get_math_captcha_solution(login_page_resp.text, login_page)
+        if math_solution is None:
+            log_message("❌ 无法解析数学验证码，登录可能会失败", level="WARNING")
+            send_telegram_message("⚠️ 无法解析数学验证码，登录可能会失败", is_error=True)
+        
+        # 准备登录数据
+        login_data = {
+            "username": username,
+            "password": password,
+            "math_captcha": str(math_solution) if math_solution is not None else "",
+            "mobile": "",
+            "captcha": "",
+            "verify_code": "",
+            "agree": "1",
+            "login_type": "PASS",
+            "submit": "1"
+        }
+        # 带上登录表单中的隐藏字段（如 CSRF token）
+        for name, value in login_page.form_tokens.items():
+            login_data.setdefault(name, value)
+        
+        log_message("准备登录数据完成，包含数学验证码解答")
+        
+        # 随机延迟，模拟人类行为
+        pace("before_login")
+        _check_cancelled(cancel_event, session)
+        
+        # 发送登录请求
+        log_message("发送登录请求到: %s/login", BASE_URL, is_debug=True)
+        # 确保设置了正确的内容类型
+        login_headers = session.headers.copy()
+        login_headers.update({
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Referer": f"{BASE_URL}/login"
+        })
+        
+        with trace_span("login_post", strategy=strategy):
+            response = session.post(
+                f"{BASE_URL}/login", 
+                data=login_data, 
+                headers=login_headers, 
+                allow_redirects=True, 
+                timeout=30
+            )
+        _check_cancelled(cancel_event, session)
+        
+        if response.status_code != 200:
+            log_message("登录请求失败，状态码: %s", response.status_code, is_debug=True)
+            return None
+            
+        log_message("登录请求响应状态码: %s", response.status_code, is_debug=True)
+        log_message("登录请求响应URL: %s", response.url, is_debug=True)
+
+        # 随机延迟，模拟人类行为
+        pace("after_login")
+        
+        # 访问控制台页面以验证登录状态
+        log_message("访问控制台页面以验证登录状态...")
+        console_headers = session.headers.copy()
+        console_headers.update({"Referer": f"{BASE_URL}/login"})
+        
+        with trace_span("console_verify", strategy=strategy):
+            console_status, login_state, console_head = check_console_login(
+                session,
+                username,
+                headers=console_headers,
+                timeout=30
+            )
+        _check_cancelled(cancel_event, session)
+        
+        if console_status != 200:
+            log_message("控制台页面访问失败，状态码: %s", console_status, is_debug=True)
+            return None
+            
+        log_message("控制台页面响应状态码: %s", console_status, is_debug=True)
+
+        if login_state == "user":
+            log_message("登录成功，在控制台页面找到用户名。")
+            return session, True
+        elif login_state == "logout":
+            log_message("登录似乎成功（页面包含退出链接）。")
+            return session, True
+        elif login_state == "failed":
+            # 登录失败，可能是验证码错误，换下一种方式
+            log_message("❌ 登录失败，可能是数学验证码计算错误", level="WARNING")
+            return None
+            
+        log_message("警告：登录请求已发送，但无法100%确认登录成功（未在控制台页面找到明确标识）。脚本将继续尝试。")
+        log_message("控制台页面部分内容 (前500字符): %s", console_head, is_debug=True)
+        # 尽管无法确认，但还是返回会话（不写入缓存）
+        return session, False
+            
+    except LoginCancelled:
+        log_message("其他登录方式已成功，放弃当前尝试。", is_debug=True)
+    except requests.exceptions.HTTPError as he:
+        log_message(f"HTTP错误 (登录方式: {strategy}): {he}", level="WARNING")
+    except requests.exceptions.RequestException as re:
+        log_message(f"请求错误 (登录方式: {strategy}): {re}", level="WARNING")
+    except Exception as e:
+        log_message(f"未知错误 (登录方式: {strategy}): {e}", level="WARNING")
+    return None
+
+def _hedged_login(order, username, password):
+    """
+    同时进行至多 LOGIN_HEDGE 个登录尝试，第一个确认成功的会话胜出并取消其余尝试。
+    没有确认成功的尝试时，退而使用未能确认但已返回的会话。
+    """
+    prefix = getattr(_log_context, "prefix", "")
+    cancel_event = threading.Event()
+    pending = iter(order)
+    futures = {}
+    fallback = None
+    pool = ThreadPoolExecutor(max_workers=LOGIN_HEDGE)
+
+    def launch():
+        strategy = next(pending, None)
+        if strategy is not None:
+            future = pool.submit(_run_with_log_prefix, f"{prefix}[{strategy}] ", login_with_strategy,
+                                 strategy, username, password, cancel_event,
+                                 account=getattr(_log_context, "account", None))
+            futures[future] = strategy
+
+    try:
+        for _ in range(LOGIN_HEDGE):
+            launch()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                strategy = futures.pop(future)
+                result = future.result()
+                record_login_attempt(strategy, result)
+                if result and result[1]:
+                    cancel_event.set()
+                    log_message(f"登录方式 {strategy} 率先成功，取消其余 {len(futures)} 个尝试。")
+                    return result[0], strategy, True
+                if result and fallback is None:
+                    fallback = (result[0], strategy, False)
+                launch()
+    finally:
+        cancel_event.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    if fallback:
+        return fallback
+    raise Exception("所有登录尝试均失败")
+
+def _fresh_login(username, password):
+    """
+    完整登录流程。返回 (会话, 登录方式, 是否已确认登录成功)。
+    上次成功的方式优先；FC_LOGIN_HEDGE 大于1时并发尝试多种方式。
+    """
+    log_message("尝试登录 Freecloud...")
+    order = ordered_login_strategies(username)
+    if LOGIN_HEDGE > 1:
+        session, strategy, confirmed = _hedged_login(order, username, password)
+    else:
+        for strategy in order:
+            result = login_with_strategy(strategy, username, password)
+            record_login_attempt(strategy, result)
+            if result:
+                session, confirmed = result
+                break
+        else:
+            # 如果都失败了，抛出异常
+            raise Exception("所有登录尝试均失败")
+    if confirmed:
+        remember_login_strategy(username, strategy)
+    return session, strategy, confirmed
+
+# ===================== 服务器列表解析 =====================
+INVENTORY_MAX_PAGES = 20  # 分页最多跟随的页数
+
+def parse_server_inventory(html, machine_ids=None, page=None):
+    """
+    一次遍历服务器列表页，返回 {id_sn: {"id_sn", "remaining_days", "status", "detail_url"}}。
+    以表格行为单位，通过行内的详情页链接确定服务器编号，不会被页面其他位置出现的编号干扰。
+    对 machine_ids 中未能按行解析到的服务器，退回到旧的"编号附近找天后"方式。
+    page 为已解析的 PageExtract（可选）。
+    """
+    if page is None:
+        page = extract_page(html)
+    inventory = dict(page.servers)
+
+    for machine_id in machine_ids or []:
+        machine_id = str(machine_id)
+        if machine_id in inventory:
+            continue
+        idx = html.find(machine_id)
+        if idx == -1:
+            continue
+        days = _DAYS_LEFT_RE.search(html, max(0, idx - 500), idx + 500)
+        if days:
+            log_message("服务器 %s 不在列表行中，使用编号附近的\"天后\"信息", machine_id, is_debug=True)
+            inventory[machine_id] = {
+                "id_sn": machine_id,
+                "remaining_days": int(days.group(1)),
+                "status": None,
+                "detail_url": f"{BASE_URL}/server/detail/{machine_id}",
+            }
+    return inventory
+
+def fetch_server_inventory(session, machine_ids=None):
+    """
+    获取服务器列表并建立索引，如有分页则依次获取后续页面。
+    网络请求失败时返回 None。
+    """
+    log_message(f"从 {CONSOLE_URL} 获取服务器列表...")
+    try:
+        with trace_span("server_lookup", page=1):
+            html = get_page(session, CONSOLE_URL)
+            first_page = extract_page(html)
+            inventory = parse_server_inventory(html, machine_ids, first_page)
+
+        # 分页链接可能只列出附近几页，每一页都可能带出更大的页码
+        last_page = first_page.last_page
+        page = 2
+        while page <= min(last_page, INVENTORY_MAX_PAGES):
+            log_message("获取服务器列表第 %d 页...", page, is_debug=True)
+            with trace_span("server_lookup", page=page):
+                page_html = get_page(session, CONSOLE_URL, params={"page": page})
+                page_extract = extract_page(page_html)
+                for id_sn, entry in parse_server_inventory(page_html, machine_ids, page_extract).items():
+                    inventory.setdefault(id_sn, entry)
+            last_page = max(last_page, page_extract.last_page)
+            page += 1
+        if last_page > INVENTORY_MAX_PAGES:
+            log_message(f"服务器列表至少有 {last_page} 页，只获取了前 {INVENTORY_MAX_PAGES} 页，"
+                        f"之后页面上的服务器不会被检查", level="WARNING")
+
+        log_message("服务器列表共解析到 %d 台服务器", len(inventory), is_debug=True)
+        return inventory
+    except requests.exceptions.RequestException as e:
+        log_message(f"获取服务器列表失败 (网络请求错误): {e}", level="WARNING")
+        return None
+    except Exception as e:
+        log_message(f"获取服务器列表时发生未知错误: {e}", level="ERROR")
+        log_message(_format_exception, e, is_debug=True)
+        return None
+
+def stream_scan(response, matcher, chunk_size=None, window=None):
+    """
+    分块读取响应，把"上一块末尾 window 个字符 + 新块"交给 matcher 增量匹配。
+    matcher 返回非 None 时立即停止下载并关闭连接。返回 (匹配结果, 已读取字节数)。
+    内存占用与页面大小无关，只取决于 chunk_size + window。
+    """
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    window = window or STREAM_WINDOW
+    # 未声明 charset 时 requests 会按 ISO-8859-1 处理 text/html，中文页面需要按 UTF-8 解码
+    content_type = response.headers.get("Content-Type", "")
+    encoding = response.encoding if "charset" in content_type.lower() else "utf-8"
+    decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    tail = ""
+    read_bytes = 0
+    started = time.perf_counter()
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            read_bytes += len(chunk)
+            buffer = tail + decoder.decode(chunk)
+            result = matcher(buffer)
+            if result is not None:
+                return result, read_bytes
+            tail = buffer[-window:]
+        return None, read_bytes
+    finally:
+        response.close()
+        trace = getattr(response, "fc_trace", None)
+        if trace is not None:
+            # 流式请求的字节数和总耗时只有读完（或提前停止）后才知道
+            trace["bytes"] = read_bytes
+            trace["total"] += time.perf_counter() - started
+
+def stream_server_info(session, machine_id):
+    """
+    流式读取服务器列表第一页，找到目标服务器所在的行后立即停止下载。
+    未找到时返回 None。
+    """
+    link = f"/server/detail/{machine_id}"
+
+    def match(buffer):
+        if link not in buffer:
+            return None
+        return extract_page(buffer).servers.get(machine_id)
+
+    with trace_span("server_lookup", streamed=True):
+        response = session.get(CONSOLE_URL, timeout=30, stream=True)
+        response.raise_for_status()
+        entry, read_bytes = stream_scan(response, match)
+    log_message("流式读取服务器列表 %d 字节，%s服务器 %s", read_bytes, "已找到" if entry else "未找到", machine_id,
+                is_debug=True)
+    return entry
+
+def get_server_info(session, machine_id_to_find, inventory=None):
+    """
+    从服务器列表索引中查找服务器剩余天数。
+    传入已获取的 inventory 时不再发起请求，多台服务器可共用一次列表获取。
+    开启 FC_STREAM_CONSOLE 时先流式查找，找不到再完整获取列表。
+    """
+    machine_id_to_find = str(machine_id_to_find)
+    if inventory is None and STREAM_CONSOLE:
+        try:
+            entry = stream_server_info(session, machine_id_to_find)
+        except requests.exceptions.RequestException as e:
+            log_message(f"流式获取服务器信息失败 (网络请求错误): {e}", level="WARNING")
+            return None
+        if entry:
+            inventory = {machine_id_to_find: entry}
+    if inventory is None:
+        log_message(f"尝试从 {CONSOLE_URL} 获取服务器 {machine_id_to_find} 的信息...")
+        inventory = fetch_server_inventory(session, [machine_id_to_find])
+        if inventory is None:
+            return None
+
+    entry = inventory.get(machine_id_to_find)
+    if not entry:
+        log_message(f"页面中未找到服务器编号 {machine_id_to_find}")
+        return None
+    if entry["remaining_days"] is None:
+        log_message(f"未能在服务器 {machine_id_to_find} 附近找到\"天后\"信息")
+        return None
+    log_message(f"服务器 {machine_id_to_find} 剩余 {entry['remaining_days']} 天")
+    return {"remaining_days": entry["remaining_days"], "id_sn": machine_id_to_find,
+            "status": entry["status"], "detail_url": entry["detail_url"]}
+
+def choose_renew_months(options, wanted=None):
+    """
+    在续费表单允许的月数中选不超过 wanted（默认 FC_RENEW_MONTHS）的最大值；页面没有给出选项时续费 1 个月。
+    所有选项都超过 wanted 时返回 None：续费会扣余额，不能自作主张续更长的时间。
+    """
+    wanted = RENEW_MONTHS if wanted is None else wanted
+    if not options:
+        return 1
+    allowed = [m for m in options if m <= wanted]
+    return max(allowed) if allowed else None
+
+def renew_server_instance(session, server_id_sn, months=None):
+    renew_url = f"{BASE_URL}/server/detail/{server_id_sn}/renew"
+    log_message(f"尝试为服务器 {server_id_sn} 续费，请求 URL: {renew_url}")
+    current_renew_payload = {
+        "month": "1",
+        "submit": "1",
+        "coupon_id": "0" # 通常优惠券ID为0表示不使用或无效优惠券
+    }
+    try:
+        # 先访问详情页以获取必要的cookie和token，以及可选的续费月数
+        detail_url = f"{BASE_URL}/server/detail/{server_id_sn}"
+        log_message(f"先访问详情页: {detail_url}")
+        with trace_span("detail_page", server=server_id_sn):
+            detail_resp = session.get(detail_url, timeout=30)
+        if detail_resp.ok:
+            options = extract_page(detail_resp.text).renew_months
+            chosen = choose_renew_months(options, months)
+            if chosen is None:
+                msg = (f"续费表单最短 {min(options)} 个月，超过允许的 {RENEW_MONTHS if months is None else months} 个月"
+                       f"（FC_RENEW_MONTHS），未提交续费。")
+                log_message(msg, level="WARNING")
+                return False, msg
+            current_renew_payload["month"] = str(chosen)
+            if options:
+                log_message("续费表单可选月数: %s，本次续费 %s 个月", options, current_renew_payload["month"],
+                            is_debug=True)
+        
+        # 等待一下再续费
+        pace("before_renew")
+        
+        # 只补充续费请求特有的头，其余沿用会话固定的请求头
+        renew_headers = {
+            "Content-Type": "application/x-www-form-urlencoded", 
+            "Referer": detail_url,
+            "X-Requested-With": "XMLHttpRequest"
+        }
+        
+        with trace_span("renew_post", server=server_id_sn):
+            response = session.post(renew_url, data=current_renew_payload, headers=renew_headers, timeout=45)
+            response.raise_for_status()
+        try:
+            resp_json = response.json()
+            log_message("续费响应JSON: %s", resp_json, is_debug=True)
+            if resp_json.get("code") == 0:
+                success_msg = resp_json.get("msg", "续费操作已提交，请稍后在网站确认状态。")
+                log_message(f"续费成功信息: {success_msg}")
+                return True, success_msg
+            else:
+                error_msg = resp_json.get("msg", "续费失败，未提供具体原因。")
+                log_message(f"续费失败 (API返回错误): {error_msg} (code: {resp_json.get('code')})", level="ERROR")
+                return False, error_msg
+        except json.JSONDecodeError:
+            log_message("续费响应不是有效的JSON格式。检查原始响应文本。")
+            log_message("续费响应原文 (前500字符): %.500s", response.text, is_debug=True)
+            if "success" in response.text.lower() or "成功" in response.text:
+                 msg = "续费请求已发送，响应非JSON但包含成功字样。"
+                 log_message(msg)
+                 return True, msg
+            return False, "续费失败，响应非JSON且未找到成功标识。"
+    except requests.exceptions.RequestException as e:
+        log_message(f"续费服务器 {server_id_sn} 失败 (网络请求错误): {e}", level="ERROR")
+        return False, f"网络请求错误: {e}"
+    except Exception as e:
+        log_message(f"续费服务器 {server_id_sn} 时发生未知错误: {e}", level="ERROR")
+        log_message(_format_exception, e, is_debug=True)
+        return False, f"未知错误: {e}"
+
+def _detail_days(session, server_id_sn, timeout):
+    """读取详情页上的剩余天数，页面中没有时返回 None"""
+    response = session.get(f"{BASE_URL}/server/detail/{server_id_sn}", timeout=timeout)
+    response.raise_for_status()
+    return extract_page(response.text).days_left
+
+def confirm_renewal(session, server_id_sn, previous_days, timeout=None, probe=None):
+    """
+    续费后轮询较轻的详情页，直到剩余天数超过续费前的值。
+    两次查询间隔从 RENEW_CONFIRM_INITIAL_DELAY 开始按指数退避，最长 RENEW_CONFIRM_MAX_DELAY，总时长不超过 timeout。
+    详情页上找不到天数的那次查询改用服务器列表，同样按退避间隔重试。
+    probe(超时秒数) 可替换读取详情页天数的方式（如浏览器后端），此时 session 可为 None。
+    返回 (新的剩余天数或 None, 确认耗时秒数)。
+    """
+    timeout = RENEW_CONFIRM_TIMEOUT if timeout is None else timeout
+    if probe is None:
+        probe = functools.partial(_detail_days, session, server_id_sn)
+    remaining = RUN_POLICY.remaining()
+    if remaining is not None:
+        timeout = max(0.0, min(timeout, remaining - MIN_CALL_TIMEOUT))  # 不超出运行总时限
+    started = time.monotonic()
+    deadline = started + timeout
+    delay = RENEW_CONFIRM_INITIAL_DELAY
+    attempt = 0
+    while True:
+        if CASSETTE_MODE != "replay":  # 回放时按录制的顺序直接取下一次查询的结果
+            time.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+        attempt += 1
+        days = None
+        try:
+            with trace_span("confirm_poll", server=server_id_sn, attempt=attempt):
+                days_left = probe(max(1.0, min(30.0, deadline - time.monotonic())))
+        except (requests.exceptions.RequestException, BackendError) as e:
+            log_message("第 %d 次确认续费结果失败 (网络请求错误): %s", attempt, e, is_debug=True)
+            if getattr(e, "cassette_miss", False):
+                return None, time.monotonic() - started  # 录制时的查询已全部回放完
+        else:
+            if days_left is not None:
+                days = days_left
+            elif session is not None:
+                log_message("详情页中没有剩余天数，改为从服务器列表确认...", is_debug=True)
+                info = get_server_info(session, server_id_sn)
+                days = info["remaining_days"] if info else None
+        elapsed = time.monotonic() - started
+        if days is not None and days > previous_days:
+            log_message("第 %d 次查询确认续费生效，耗时 %.1f 秒", attempt, elapsed, is_debug=True)
+            return days, elapsed
+        if time.monotonic() >= deadline:
+            log_message(f"{timeout:.0f} 秒内（共 {attempt} 次查询）未确认到新的到期时间")
+            return None, elapsed
+        delay = min(delay * 2, RENEW_CONFIRM_MAX_DELAY)
+
+# ===================== 运行后端 =====================
+class BackendError(Exception):
+    """后端操作失败（浏览器进程异常退出、超时或返回错误）"""
+
+class HttpBackend:
+    """通过 requests / cloudscraper 会话直接请求页面，开销最低"""
+
+    name = "http"
+
+    @staticmethod
+    def available():
+        # 只查找是否已安装，不导入（导入 cloudscraper 较慢）
+        import importlib.util
+        return all(importlib.util.find_spec(name) is not None for name in ("requests", "cloudscraper"))
+
+    def __init__(self, session=None):
+        self.session = session
+
+    def login(self, username, password):
+        self.session = login_session(username, password)
+
+    def list_servers(self, machine_ids=None):
+        return fetch_server_inventory(self.session, machine_ids)
+
+    def server_info(self, machine_id, inventory=None):
+        return get_server_info(self.session, machine_id, inventory)
+
+    def renew(self, server_id_sn, months=None):
+        return renew_server_instance(self.session, server_id_sn, months)
+
+    def confirm(self, server_id_sn, previous_days):
+        return confirm_renewal(self.session, server_id_sn, previous_days)
+
+    def close(self):
+        # 传输层创建的会话留给同一账户的下一次登录复用连接
+        if self.session is not None and getattr(self.session, "transport", None) is None:
+            self.session.close()
+
+class BrowserHost:
+    """
+    node freecloud_puppeteer.js --json 进程，按行交换 JSON 指令与结果。
+    所有账户共用一个浏览器，每个账户在其中有独立的上下文；不同账户的指令在浏览器中并发执行。
+    进程在第一次使用时启动，脚本退出时关闭。
+    """
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "freecloud_puppeteer.js")
+
+    def __init__(self):
+        self._process = None
+        self._pending = {}  # 请求编号 -> 等待结果的队列
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    @property
+    def running(self):
+        return self._process is not None
+
+    def _start(self):
+        import subprocess
+        log_message("启动浏览器后端...", is_debug=True)
+        self._process = subprocess.Popen(
+            ["node", self.script, "--json"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=None if LOG_LEVEL <= LOG_LEVELS["DEBUG"] else subprocess.DEVNULL, text=True, encoding="utf-8",
+            env={**os.environ, "FC_BASE_URL": BASE_URL},
+        )
+        threading.Thread(target=self._read_replies, args=(self._process,), daemon=True).start()
+
+    def _read_replies(self, process):
+        for line in process.stdout:
+            try:
+                reply = json.loads(line)
+            except json.JSONDecodeError:
+                log_message("浏览器后端输出无法解析: %.200s", line, is_debug=True)
+                continue
+            with self._lock:
+                slot = self._pending.pop(reply.get("id"), None)
+            if slot is not None:
+                slot.put(reply)
+        with self._lock:  # 进程已退出，唤醒所有等待中的请求
+            if self._process is process:
+                self._process = None
+            pending, self._pending = self._pending, {}
+        for slot in pending.values():
+            slot.put(None)
+
+    def call(self, op, timeout, **params):
+        slot = queue.Queue(maxsize=1)
+        with self._lock:
+            if self._process is None:
+                self._start()
+            self._next_id += 1
+            request_id = self._next_id
+            self._pending[request_id] = slot
+            try:
+                self._process.stdin.write(json.dumps({"id": request_id, "op": op, **params}) + "\n")
+                self._process.stdin.flush()
+            except OSError as e:
+                self._pending.pop(request_id, None)
+                raise BackendError(f"浏览器后端已退出: {e}")
+        try:
+            reply = slot.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise BackendError(f"浏览器后端 {op} 操作超时 ({timeout:.0f} 秒)")
+        if reply is None:
+            raise BackendError("浏览器后端进程已退出")
+        return reply
+
+    def shutdown(self):
+        process = self._process
+        if process is None:
+            return
+        try:
+            self.call("shutdown", 10)
+        except BackendError:
+            pass
+        try:
+            process.wait(timeout=10)
+        except Exception:
+            process.kill()
+
+_browser_host = None
+_browser_host_lock = threading.Lock()
+
+def get_browser_host():
+    """获取全局共用的浏览器进程"""
+    global _browser_host
+    with _browser_host_lock:
+        if _browser_host is None:
+            _browser_host = BrowserHost()
+            atexit.register(_browser_host.shutdown)
+        return _browser_host
+
+class BrowserBackend:
+    """通过共用的无头浏览器完成操作，每个账户使用独立的浏览器上下文"""
+
+    name = "browser"
+
+    @staticmethod
+    def available():
+        if CASSETTE_MODE:
+            return False  # 录制 / 回放只覆盖 HTTP 请求
+        import shutil
+        return shutil.which("node") is not None and os.path.exists(BrowserHost.script)
+
+    def __init__(self):
+        self.account = None
+
+    def _call(self, op, timeout=None, **params):
+        timeout = BROWSER_TIMEOUT if timeout is None else timeout
+        remaining = RUN_POLICY.remaining()
+        if remaining is not None:
+            if remaining <= 0:
+                raise BackendError(f"运行总时限已用完，放弃浏览器后端 {op} 操作")
+            # 不超出运行总时限，但至少给出 MIN_CALL_TIMEOUT，queue.get 不接受负数超时
+            timeout = max(MIN_CALL_TIMEOUT, min(timeout, remaining))
+        with trace_span(f"browser_{op}"):
+            reply = get_browser_host().call(op, timeout, account=self.account, **params)
+        if reply.get("error"):
+            raise BackendError(f"浏览器后端 {op} 操作失败: {reply['error']}")
+        return reply
+
+    def login(self, username, password):
+        self.account = account_key(username)
+        try:
+            ok = self._call("login", username=username, password=password).get("ok")
+        except BackendError:
+            record_login_attempt("browser", "failed")
+            raise
+        record_login_attempt("browser", "success" if ok else "failed")
+        if not ok:
+            raise BackendError("浏览器后端登录失败")
+
+    def list_servers(self, machine_ids=None):
+        try:
+            servers = self._call("list")["servers"]
+        except BackendError as e:
+            log_message(f"浏览器后端获取服务器列表失败: {e}", level="WARNING")
+            return None
+        return {s["id_sn"]: {"id_sn": s["id_sn"], "remaining_days": s["remaining_days"], "status": None,
+                             "detail_url": f"{BASE_URL}/server/detail/{s['id_sn']}"}
+                for s in servers}
+
+    def server_info(self, machine_id, inventory=None):
+        if inventory is None:
+            inventory = self.list_servers([machine_id])
+            if inventory is None:
+                return None
+        return get_server_info(None, machine_id, inventory)
+
+    def renew(self, server_id_sn, months=None):
+        log_message(f"通过浏览器后端为服务器 {server_id_sn} 续费...")
+        try:
+            # 由浏览器端在续费表单的选项中选择不超过该值的最大月数
+            reply = self._call("renew", id_sn=server_id_sn, month=str(RENEW_MONTHS if months is None else months))
+        except BackendError as e:
+            return False, str(e)
+        return bool(reply.get("ok")), reply.get("message", "")
+
+    def confirm(self, server_id_sn, previous_days):
+        def probe(timeout):
+            return self._call("detail", timeout=timeout, id_sn=server_id_sn).get("days_left")
+        return confirm_renewal(None, server_id_sn, previous_days, probe=probe)
+
+    def close(self):
+        if self.account is None or not get_browser_host().running:
+            return
+        try:
+            self._call("close", timeout=10)  # 只关闭该账户的浏览器上下文，浏览器进程留给其他账户
+        except BackendError:
+            pass
+        self.account = None
+
+BACKENDS = {"http": HttpBackend, "browser": BrowserBackend}
+
+def remember_backend(username, name):
+    """记录账户上次成功的后端，下次从它开始尝试"""
+    update_state("backend_tier.json", account_key(username), {"tier": name, "updated_at": time.time()})
+
+def ordered_backends(username):
+    """
+    按尝试顺序返回可用的后端名称。
+    上次成功的后端在 FC_BACKEND_STICKY_HOURS 内直接作为起点，跳过比它更便宜但此前失败过的后端。
+    """
+    order = [b for b in BACKEND_ORDER if b in BACKENDS and BACKENDS[b].available()]
+    last = load_state("backend_tier.json").get(account_key(username), {})
+    if last.get("tier") in order and time.time() - last.get("updated_at", 0) < BACKEND_STICKY_HOURS * 3600:
+        order = order[order.index(last["tier"]):]
+    return order
+
+def connect_backend(username, password, machine_ids):
+    """
+    从最便宜的后端开始登录并获取服务器列表，失败时才升级到下一个后端。
+    返回 (后端, 服务器列表索引)；所有后端都失败时抛出异常。
+    """
+    errors = []
+    for name in ordered_backends(username):
+        backend = BACKENDS[name]()
+        try:
+            with trace_span("backend_connect", backend=name):
+                backend.login(username, password)
+                inventory = backend.list_servers(machine_ids)
+            if inventory is None:
+                raise BackendError("未能获取服务器列表")
+            if not any(str(m) in inventory for m in machine_ids):
+                raise BackendError("服务器列表中没有目标服务器")
+        except Exception as e:
+            log_message(f"后端 {name} 不可用: {e}")
+            errors.append(f"{name}: {e}")
+            backend.close()
+            continue
+        if errors:
+            log_message(f"已升级到后端 {name}")
+        remember_backend(username, name)
+        return backend, inventory
+    raise Exception("所有后端均失败" + (f" ({'; '.join(errors)})" if errors else "：没有可用的后端"))
+
+# ===================== 续费计划 =====================
+def renewal_reason(remaining_days, days_threshold=DAYS_THRESHOLD, ahead_days=None):
+    """
+    判断服务器是否要在本次登录中续费："due" 表示已低于阈值必须续费，
+    "ahead" 表示在阈值之上 ahead_days（默认 FC_RENEW_AHEAD_DAYS）天内、趁已登录提前续费，None 表示不需要。
+    """
+    ahead_days = RENEW_AHEAD_DAYS if ahead_days is None else ahead_days
+    if remaining_days is None:
+        return None
+    if remaining_days < days_threshold:
+        return "due"
+    if remaining_days < days_threshold + ahead_days:
+        return "ahead"
+    return None
+
+def plan_renewals(machine_ids, inventory, days_threshold=DAYS_THRESHOLD, username=None):
+    """
+    根据服务器列表中的剩余天数为一个账户制定续费计划，返回 {machine_id: "due" / "ahead" / None}。
+    所有要续费的服务器在同一个已登录会话中一次处理完，尽量不为单台服务器再登录一次。
+    上次提前续费被拒绝的服务器（见 ahead_rejected）不再计入提前续费。
+    """
+    plan = {}
+    for m in machine_ids:
+        days = (inventory.get(m) or {}).get("remaining_days")
+        reason = renewal_reason(days, days_threshold)
+        plan[m] = None if reason == "ahead" and ahead_rejected(username, m, days) else reason
+    due = [m for m, reason in plan.items() if reason == "due"]
+    ahead = [m for m, reason in plan.items() if reason == "ahead"]
+    if due or ahead:
+        log_message(f"续费计划：{len(due)} 台已低于阈值{'（' + ', '.join(due) + '）' if due else ''}，"
+                    f"{len(ahead)} 台提前续费{'（' + ', '.join(ahead) + '）' if ahead else ''}，"
+                    f"{len(plan) - len(due) - len(ahead)} 台无需续费。")
+    return plan
+
+def _submit_renewal(backend, username, machine_id, server_id_sn, remaining_days, result, reason="due"):
+    """
+    提交续费并确认新的到期时间，提交前在台账中登记、结束后写入结果。
+    调用方须持有该服务器的锁。确认结果写入 result，返回 (是否成功, 消息)。
+    提前续费（reason 为 "ahead"）被拒绝时在台账中记为 rejected_ahead，见 ahead_rejected。
+    """
+    submitted_at = ledger_begin(username, machine_id, remaining_days)
+    send_telegram_message(f"⏳ 服务器 {server_id_sn} 剩余 {remaining_days:.2f} 天，尝试自动续费...", is_error=False)
+    try:
+        renew_success, renew_message = backend.renew(server_id_sn)
+    except Exception as e:
+        ledger_finish(username, machine_id, submitted_at, False, str(e))
+        raise
+    if renew_success:
+        final_message = f"✅ 服务器 {server_id_sn} 续费成功！\n续费结果: {renew_message}\n原剩余: {remaining_days:.2f} 天。"
+        log_message(final_message)
+        send_telegram_message(final_message)
+        log_message("查询详情页以确认续费...")
+        with trace_span("renew_confirm", server=server_id_sn):
+            confirmed_days, confirm_seconds = backend.confirm(server_id_sn, remaining_days)
+        result["confirm_seconds"] = confirm_seconds
+        if confirmed_days is not None:
+            result["confirmed_days"] = confirmed_days
+            record_observation(username, machine_id, confirmed_days, source="confirm")
+            log_message(f"更新后服务器 {server_id_sn} 剩余天数: {confirmed_days:.2f}（确认耗时 {confirm_seconds:.1f} 秒）")
+            send_telegram_message(f"ℹ️ 更新后服务器 {server_id_sn} 剩余: {confirmed_days:.2f} 天"
+                                  f"（确认耗时 {confirm_seconds:.1f} 秒）。")
+        else:
+            log_message(f"{confirm_seconds:.1f} 秒内未能确认续费后的服务器信息。")
+    ledger_finish(username, machine_id, submitted_at, renew_success, renew_message, result.get("confirmed_days"),
+                  status="rejected_ahead" if not renew_success and reason == "ahead" else None)
+    return renew_success, renew_message
+
+def _settle_pending_renewal(backend, username, machine_id, previous):
+    """
+    台账中有一次结果未知的续费（提交者在提交后中途退出）：重新读取剩余天数，
+    已经增加说明那次续费生效了，补记结果并返回它；否则返回 None，由调用方重新提交。
+    """
+    log_message(f"台账中服务器 {machine_id} 有一次结果未知的续费，重新读取剩余天数确认...")
+    info = backend.server_info(machine_id)
+    current = info["remaining_days"] if info else None
+    if current is None or previous["days_before"] is None or current <= previous["days_before"]:
+        log_message(f"服务器 {machine_id} 的剩余天数没有增加，那次续费未生效。")
+        ledger_finish(username, machine_id, previous["submitted_at"], False, "中途退出，续费未生效")
+        return None
+    ledger_finish(username, machine_id, previous["submitted_at"], True, "中途退出，重新读取确认已生效", current)
+    return {**previous, "status": "ok", "days_after": current}
+
+def _reuse_renewal(result, previous):
+    """沿用台账中另一次运行刚完成的续费，不再重复提交"""
+    minutes = (time.time() - previous["submitted_at"]) / 60
+    days_after = previous["days_after"]
+    msg = (f"ℹ️ 服务器 {result['machine_id']} 已在 {minutes:.0f} 分钟前由另一次运行续费"
+           f"{f'（续费后剩余 {days_after:.2f} 天）' if days_after is not None else ''}，本次不再重复提交。")
+    log_message(msg)
+    send_telegram_message(msg)
+    if days_after is not None:
+        result["remaining_days"] = days_after
+    result.update({"ok": True, "message": "沿用另一次运行的续费结果", "reused": True})
+    return result
+
+def check_and_renew_machine(backend, machine_id, days_threshold=DAYS_THRESHOLD, inventory=None, username=None):
+    """
+    检查单台服务器的剩余天数，低于阈值时续费并发送通知。
+    backend 为已登录的运行后端；inventory 为已获取的服务器列表索引（可选）；username 用于在历史记录中区分账户。
+    返回结果字典：machine_id / remaining_days / renewed / ok / message。
+    """
+    result = {"machine_id": machine_id, "remaining_days": None, "renewed": False, "ok": False, "message": ""}
+    server_info_data = backend.server_info(machine_id, inventory)
+    if not server_info_data:
+        msg = f"⚠️ 未能获取服务器 {machine_id} 的信息，无法继续续费操作。"
+        log_message(msg)
+        send_telegram_message(msg, is_error=True)
+        result["message"] = msg
+        return result
+    remaining_days = server_info_data["remaining_days"]
+    server_id_sn = server_info_data["id_sn"]
+    result["remaining_days"] = remaining_days
+    record_observation(username, machine_id, remaining_days)
+    reason = renewal_reason(remaining_days, days_threshold)
+    if reason == "ahead" and ahead_rejected(username, machine_id, remaining_days):
+        log_message(f"服务器 {server_id_sn} 上次提前续费被网站拒绝，低于 {days_threshold} 天之前不再提前续费。")
+        reason = None
+    if reason:
+        if reason == "due":
+            log_message(f"服务器 {server_id_sn} 剩余 {remaining_days:.2f} 天 (少于 {days_threshold} 天)，需要续费。")
+        else:
+            log_message(f"服务器 {server_id_sn} 剩余 {remaining_days:.2f} 天，将在 {RENEW_AHEAD_DAYS:g} 天内低于阈值，"
+                        f"趁本次登录提前续费。")
+        try:
+            with machine_lock(username, machine_id):
+                previous = recent_renewal(username, machine_id)
+                if previous and previous["status"] == "pending":
+                    previous = _settle_pending_renewal(backend, username, machine_id, previous)
+                if previous:
+                    record_renew_outcome(username, machine_id, "reused")
+                    return _reuse_renewal(result, previous)
+                renew_success, renew_message = _submit_renewal(backend, username, machine_id, server_id_sn,
+                                                               remaining_days, result, reason)
+        except TimeoutError as e:
+            renew_success, renew_message = False, str(e)
+        if not renew_success and reason == "ahead":
+            # 还没到阈值，网站可能不允许这么早续费；不算失败，之后低于阈值时再续费
+            final_message = (f"ℹ️ 服务器 {server_id_sn} 提前续费未成功: {renew_message}\n"
+                             f"剩余 {remaining_days:.2f} 天，低于 {days_threshold} 天时会再次尝试。")
+            log_message(final_message, level="WARNING")
+            send_telegram_message(final_message)
+        elif not renew_success:
+            final_message = f"❌ 服务器 {server_id_sn} 续费失败。\n失败原因: {renew_message}\n原剩余: {remaining_days:.2f} 天。"
+            log_message(final_message, level="ERROR")
+            send_telegram_message(final_message, is_error=True)
+        record_renew_attempt(username, machine_id, renew_success, renew_message, remaining_days,
+                             result.get("confirmed_days"), result.get("confirm_seconds"))
+        record_renew_outcome(username, machine_id,
+                             "success" if renew_success else "ahead_failed" if reason == "ahead" else "failed")
+        result.update({"renewed": renew_success, "ok": renew_success or reason == "ahead", "message": renew_message})
+    else:
+        final_message = f"ℹ️ 服务器 {server_id_sn} 剩余 {remaining_days:.2f} 天 (多于或等于 {days_threshold} 天)，无需续费。"
+        log_message(final_message)
+        send_telegram_message(final_message)
+        result.update({"ok": True, "message": "无需续费"})
+    return result
+
+def report_server_status(machine_id, inventory, username=None):
+    """
+    只查看不续费：打印服务器列表中的剩余天数、状态以及续费时会如何处理，并写入历史记录。
+    不发送通知。返回与 check_and_renew_machine 相同格式的结果字典。
+    """
+    info = (inventory or {}).get(machine_id) or {}
+    remaining_days = info.get("remaining_days")
+    if remaining_days is None:
+        msg = f"⚠️ 服务器列表中没有服务器 {machine_id} 的剩余天数。"
+        log_message(msg, level="WARNING")
+        return {"machine_id": machine_id, "remaining_days": None, "renewed": False, "ok": False, "message": msg}
+    record_observation(username, machine_id, remaining_days)
+    action = {"due": "需要续费", "ahead": "将提前续费", None: "无需续费"}[renewal_reason(remaining_days)]
+    log_message(f"服务器 {machine_id}: 剩余 {remaining_days:.2f} 天，状态 {info.get('status') or '未知'}，{action}")
+    return {"machine_id": machine_id, "remaining_days": remaining_days, "renewed": False, "ok": True, "message": action}
+
+# ===================== 多账户批量模式 =====================
+def load_fleet_accounts():
+    """
+    读取 FC_ACCOUNTS / FC_ACCOUNTS_FILE 中的账户列表。
+    未配置时返回空列表（即单账户模式）。machine_ids 可以是列表或逗号分隔的字符串。
+    """
+    raw = FC_ACCOUNTS
+    if not raw and FC_ACCOUNTS_FILE:
+        with open(FC_ACCOUNTS_FILE, "r", encoding="utf-8") as f:
+            raw = f.read()
+    if not raw:
+        return []
+    try:
+        entries = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"FC_ACCOUNTS 不是有效的JSON: {e}")
+    if not isinstance(entries, list):
+        raise ValueError("FC_ACCOUNTS 必须是账户列表")
+
+    accounts = []
+    for i, entry in enumerate(entries):
+        machine_ids = entry.get("machine_ids") or entry.get("machine_id") or []
+        if isinstance(machine_ids, str):
+            machine_ids = [m.strip() for m in machine_ids.split(",") if m.strip()]
+        if not entry.get("username") or not entry.get("password") or not machine_ids:
+            raise ValueError(f"FC_ACCOUNTS 第 {i + 1} 项缺少 username / password / machine_ids")
+        accounts.append({
+            "username": entry["username"],
+            "password": entry["password"],
+            "machine_ids": [str(m) for m in machine_ids],
+        })
+    return accounts
+
+def _run_with_log_prefix(prefix, func, *args, account=None):
+    """在工作线程中设置日志前缀（及通知分组所属账户）后执行函数"""
+    _log_context.prefix = prefix
+    _log_context.account = account
+    try:
+        return func(*args)
+    finally:
+        _log_context.prefix = ""
+        _log_context.account = None
+
+def run_account(account, machine_ids=None, sessions=None, renew=True):
+    """
+    处理单个账户：登录一次、获取一次服务器列表，按续费计划在同一会话下检查/续费该账户的所有服务器。
+    只有所有服务器都能按历史记录跳过时才不登录；一旦需要登录，其余服务器也一并检查。
+    同一账户内的服务器并发数受 ACCOUNT_CONCURRENCY 限制。
+    machine_ids 只处理其中的服务器（默认全部）；传入 sessions 字典时复用并保存已登录的后端（常驻模式）。
+    renew 为 False 时只查看：总是登录获取最新的服务器列表，报告剩余天数，不续费也不发送通知。
+    """
+    username = account["username"]
+    masked = mask_value(username)
+    label = f"[{masked}] "
+    machine_ids = machine_ids or account["machine_ids"]
+    _log_context.prefix = label
+    _log_context.account = masked
+    all_machine_ids = machine_ids
+    skipped = {}
+    try:
+        for machine_id in all_machine_ids if renew else []:
+            # 提前续费的服务器也不能跳过，除非它上次提前续费已被拒绝
+            ahead_days = RENEW_AHEAD_DAYS if RENEW_AHEAD_DAYS and not ahead_rejected(username, machine_id) else 0
+            result = skip_by_history(username, machine_id, DAYS_THRESHOLD + ahead_days, announce=False)
+            if result:
+                skipped[machine_id] = result
+        if renew and len(skipped) == len(all_machine_ids):
+            for machine_id in all_machine_ids:
+                announce_history_skip(skipped[machine_id])
+                METRICS.machine_checked(username, machine_id, skipped[machine_id]["remaining_days"],
+                                        checked_at=time.time() - skipped[machine_id]["age_hours"] * 3600)
+            return [skipped[m] for m in all_machine_ids]
+        if skipped:
+            # 反正要登录，按历史可以跳过的服务器就在同一份服务器列表里，检查它们不需要额外请求
+            log_message("本次需要登录，按历史可跳过的 %d 台服务器也一并检查。", len(skipped), is_debug=True)
+            skipped = {}
+        backend = sessions.get(username) if sessions is not None else None
+        inventory = backend.list_servers(machine_ids) if backend else None
+        if backend and not any(m in (inventory or {}) for m in machine_ids):
+            # 保持的会话可能已在服务端失效，重新登录
+            log_message("已保持的会话未能获取服务器列表，重新登录...")
+            clear_session_cache(username)
+            backend.close()
+            backend = None
+        if backend is None:
+            # 同时运行的另一次运行正在登录时等它完成，之后直接沿用它写入的会话缓存，不再登录一次
+            with account_lock(username):
+                backend, inventory = connect_backend(username, account["password"], machine_ids)
+        if sessions is not None:
+            sessions[username] = backend
+        plan_renewals(machine_ids, inventory, username=username)
+        if not renew:
+            results = [report_server_status(m, inventory, username) for m in machine_ids]
+            if sessions is None:
+                backend.close()
+            return results
+    except Exception as e:
+        msg = f"🔴 账户 {masked} 登录失败: {e}"
+        log_message(msg, level="ERROR")
+        if renew:
+            send_telegram_message(msg, is_error=True)
+        return [skipped.get(m) or {"machine_id": m, "remaining_days": None, "renewed": False, "ok": False,
+                                   "message": str(e)}
+                for m in all_machine_ids]
+    finally:
+        _log_context.prefix = ""
+        _log_context.account = None
+
+    workers = max(1, min(ACCOUNT_CONCURRENCY, len(machine_ids)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {m: pool.submit(_run_with_log_prefix, label, check_and_renew_machine,
+                                  backend, m, DAYS_THRESHOLD, inventory, username, account=masked)
+                   for m in machine_ids}
+        results = []
+        for machine_id in all_machine_ids:
+            if machine_id in skipped:
+                results.append(skipped[machine_id])
+                continue
+            try:
+                results.append(futures[machine_id].result())
+            except Exception as e:
+                log_message(f"{label}处理服务器 {machine_id} 时发生未知错误: {e}", level="ERROR")
+                results.append({"machine_id": machine_id, "remaining_days": None, "renewed": False,
+                                "ok": False, "message": str(e)})
+    if sessions is None:
+        backend.close()
+    return results
+
+def run_fleet(accounts, renew=True, notify_summary=True):
+    """
+    并发处理多个账户，总耗时取决于最慢的账户而不是所有账户之和。
+    renew 为 False 时只查看不续费（见 run_account）。返回 {用户名: [服务器结果, ...]}。
+    notify_summary 为 False 时不发送汇总通知（分片运行时由合并步骤统一发送）。
+    """
+    log_message(f"批量模式：共 {len(accounts)} 个账户，"
+                f"{sum(len(a['machine_ids']) for a in accounts)} 台服务器，"
+                f"账户并发 {FLEET_WORKERS}，单账户并发 {ACCOUNT_CONCURRENCY}")
+    started = time.time()
+    fleet_results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(FLEET_WORKERS, len(accounts)))) as pool:
+        futures = {pool.submit(run_account, account, renew=renew): account["username"] for account in accounts}
+        for future, username in futures.items():
+            try:
+                fleet_results[username] = future.result()
+            except Exception as e:
+                log_message(f"账户 {mask_value(username)} 处理失败: {e}", level="ERROR")
+                fleet_results[username] = []
+
+    total = sum(len(r) for r in fleet_results.values())
+    failed = sum(1 for r in fleet_results.values() for item in r if not item["ok"])
+    renewed = sum(1 for r in fleet_results.values() for item in r if item["renewed"])
+    skipped = sum(1 for r in fleet_results.values() for item in r if item.get("skipped"))
+    summary = (f"批量模式完成，用时 {time.time() - started:.1f} 秒：{total} 台服务器，"
+               f"续费 {renewed} 台，失败 {failed} 台，按历史跳过 {skipped} 台。")
+    log_message(summary)
+    if renew and notify_summary:
+        send_telegram_message(f"📊 {summary}", is_error=failed > 0)
+    return fleet_results
+
+# ===================== 分片运行 =====================
+SHARD_VNODES = 64  # 一致性哈希环上每个分片的虚拟节点数，越多各分片分到的账户越均匀
+
+def parse_shard(spec):
+    """解析 "i/N"（i 从 0 开始）为 (i, N)；空值返回 None"""
+    if not spec:
+        return None
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', str(spec))
+    if not match or not 0 <= int(match.group(1)) < int(match.group(2)):
+        raise ValueError(f"分片应写作 i/N 且 0 <= i < N，例如 0/4，而不是 {spec!r}")
+    return int(match.group(1)), int(match.group(2))
+
+def _ring_point(text):
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+
+@functools.lru_cache(maxsize=None)
+def _shard_ring(count):
+    return sorted((_ring_point(f"shard-{s}-{v}"), s) for s in range(count) for v in range(SHARD_VNODES))
+
+def shard_of(username, count):
+    """
+    按用户名在一致性哈希环上分配分片。同一账户总是落在同一分片（会话缓存、历史记录都留在同一个工作者），
+    分片数变化时只有约 1/N 的账户换分片。
+    """
+    import bisect
+    ring = _shard_ring(count)
+    index = bisect.bisect_left(ring, (_ring_point(username),))
+    return ring[index % len(ring)][1]
+
+def shard_accounts(accounts, shard):
+    index, count = shard
+    return [a for a in accounts if shard_of(a["username"], count) == index]
+
+def shard_path(path, shard):
+    """分片运行时在文件名后加上分片编号，本机的多个分片进程不会互相覆盖"""
+    if not path or shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+def shard_results_path(shard):
+    return os.path.join(SHARD_RESULTS_DIR, f"shard-{shard[0]}-of-{shard[1]}.json")
+
+def write_shard_results(shard, command, fleet_results, started_at, error=None):
+    """写出本分片的结果文件，供合并步骤汇总。只写打码后的用户名，不写密码"""
+    data = {
+        "shard": shard[0],
+        "shards": shard[1],
+        "command": command,
+        "started_at": started_at,
+        "finished_at": time.time(),
+        "error": error,
+        "accounts": [{"account": mask_value(username), "key": account_key(username), "results": results}
+                     for username, results in fleet_results.items()],
+    }
+    path = shard_results_path(shard)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(SHARD_RESULTS_DIR, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1, default=str)
+        os.replace(tmp_path, path)
+        log_message(f"分片 {shard[0]}/{shard[1]} 的结果已写入 {path}")
+    except OSError as e:
+        log_message(f"写入分片结果失败: {e}", level="ERROR")
+
+def merge_shard_results(paths=None):
+    """
+    合并各分片的结果文件（默认读取 SHARD_RESULTS_DIR 下的全部），打印并通知汇总，写出 report.json。
+    缺少分片或某个分片整体出错时返回 1，否则返回 0。
+    """
+    import glob
+    paths = list(paths or glob.glob(os.path.join(SHARD_RESULTS_DIR, "shard-*-of-*.json")))
+    shards = {}
+    problems = []
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            shards[(data["shard"], data["shards"])] = data
+        except FileNotFoundError:
+            continue  # 下面按缺少的分片报告
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            problems.append(f"无法读取分片结果 {path}: {e}")
+    counts = {count for _, count in shards}
+    if len(counts) > 1:
+        problems.append(f"分片结果来自不同的分片数 {sorted(counts)}，可能混入了旧的结果文件")
+    count = max(counts, default=0)
+    if not count and not problems:
+        problems.append(f"{SHARD_RESULTS_DIR} 中没有分片结果")
+    for index in range(count):
+        data = shards.get((index, count))
+        if data is None:
+            problems.append(f"分片 {index}/{count} 没有结果")
+        elif data.get("error"):
+            problems.append(f"分片 {index}/{count} 出错: {data['error']}")
+
+    accounts = []
+    for (index, shard_count), data in sorted(shards.items()):
+        results = [r for a in data["accounts"] for r in a["results"]]
+        log_message(f"分片 {index}/{shard_count}: {len(data['accounts'])} 个账户，{len(results)} 台服务器，"
+                    f"失败 {sum(1 for r in results if not r['ok'])} 台，"
+                    f"用时 {data['finished_at'] - data['started_at']:.1f} 秒")
+        accounts.extend(data["accounts"])
+    results = [r for a in accounts for r in a["results"]]
+    failed = [f"{a['account']}/{r['machine_id']}" for a in accounts for r in a["results"] if not r["ok"]]
+    summary = (f"{count} 个分片合并完成：{len(accounts)} 个账户，{len(results)} 台服务器，"
+               f"续费 {sum(1 for r in results if r['renewed'])} 台，失败 {len(failed)} 台，"
+               f"按历史跳过 {sum(1 for r in results if r.get('skipped'))} 台。")
+    if failed:
+        summary += f"\n失败的服务器: {', '.join(failed)}"
+    for problem in problems:
+        summary += f"\n⚠️ {problem}"
+        log_message(problem, level="ERROR")
+    log_message(summary)
+    if any(data.get("command") != "status" for data in shards.values()):
+        send_telegram_message(f"📊 {summary}", is_error=bool(failed or problems))
+        flush_notifications(wait_for_delivery=True)
+
+    report_path = os.path.join(SHARD_RESULTS_DIR, "report.json")
+    try:
+        os.makedirs(SHARD_RESULTS_DIR, exist_ok=True)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump({"shards": count, "problems": problems, "accounts": accounts}, f,
+                      ensure_ascii=False, indent=1, default=str)
+        log_message(f"合并后的结果已写入 {report_path}")
+    except OSError as e:
+        log_message(f"写入合并结果失败: {e}", level="WARNING")
+    return 1 if problems else 0
+
+def run_shard_workers(command, workers):
+    """
+    在本机启动 workers 个子进程，各自只处理自己的分片，结束后合并结果。
+    每个子进程有自己的运行总时限，一个卡住的账户只拖慢它所在的分片。返回合并步骤的退出码。
+    """
+    import sys
+    import subprocess
+    for index in range(workers):
+        # 清理上一次运行的结果，避免子进程没有写出结果时合并到旧的
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(shard_results_path((index, workers)))
+    log_message(f"启动 {workers} 个分片进程...")
+    processes = []
+    for index in range(workers):
+        env = dict(os.environ, FC_SHARD=f"{index}/{workers}", FC_SHARD_WORKERS="0")
+        processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), command], env=env))
+    # 子进程自己会在运行总时限内结束，这里多留一些时间给收尾
+    timeout = RUN_DEADLINE + 60 if RUN_DEADLINE > 0 else None
+    started = time.monotonic()
+    for index, process in enumerate(processes):
+        try:
+            remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - started))
+            returncode = process.wait(remaining)
+        except subprocess.TimeoutExpired:
+            log_message(f"分片 {index}/{workers} 超时未结束，终止该进程。", level="ERROR")
+            process.kill()
+            returncode = process.wait()
+        if returncode:
+            log_message(f"分片 {index}/{workers} 的进程退出码为 {returncode}", level="WARNING")
+    return merge_shard_results([shard_results_path((index, workers)) for index in range(workers)])
+
+# ===================== 常驻模式 =====================
+def next_check_delay(remaining_days, days_threshold=DAYS_THRESHOLD):
+    """
+    根据最近一次观察到的剩余天数计算下一次检查的等待秒数：
+    离阈值越远检查越少，接近阈值或获取失败时按最短间隔检查。
+    """
+    min_delay = DAEMON_MIN_INTERVAL_HOURS * 3600
+    max_delay = DAEMON_MAX_INTERVAL_HOURS * 3600
+    if remaining_days is None:
+        return min_delay
+    slack = (remaining_days - days_threshold) * 86400 * DAEMON_INTERVAL_FRACTION
+    return max(min_delay, min(max_delay, slack))
+
+def run_daemon(accounts):
+    """
+    常驻运行：保持每个账户的登录会话，按每台服务器的剩余天数安排下一次检查。
+    收到 SIGTERM / SIGINT 后在当前检查结束时退出。
+    """
+    stop_event = threading.Event()
+
+    def handle_signal(signum, _frame):
+        log_message(f"收到信号 {signum}，准备退出常驻模式...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    accounts_by_name = {a["username"]: a for a in accounts}
+    sessions = {}
+    schedule = [(time.time(), a["username"], m) for a in accounts for m in a["machine_ids"]]
+    heapq.heapify(schedule)
+    log_message(f"常驻模式启动：{len(accounts)} 个账户，{len(schedule)} 台服务器。")
+    metrics_server = start_metrics_server() if METRICS_PORT else None
+
+    while not stop_event.is_set():
+        wait_seconds = schedule[0][0] - time.time()
+        if wait_seconds > 0:
+            log_message(f"下一次检查在 {wait_seconds / 3600:.2f} 小时后。")
+            stop_event.wait(wait_seconds)
+            continue
+
+        # 取出所有到期的服务器，同一账户的服务器合并到一次会话中检查
+        due = {}
+        while schedule and schedule[0][0] <= time.time():
+            _, username, machine_id = heapq.heappop(schedule)
+            due.setdefault(username, []).append(machine_id)
+
+        RUN_POLICY.start()  # 每轮检查单独计算总时限
+        failed = []
+
+        with ThreadPoolExecutor(max_workers=max(1, min(FLEET_WORKERS, len(due)))) as pool:
+            futures = {pool.submit(run_account, accounts_by_name[u], ids, sessions): (u, ids)
+                       for u, ids in due.items()}
+            for future, (username, machine_ids) in futures.items():
+                try:
+                    results = {r["machine_id"]: r for r in future.result()}
+                except Exception as e:
+                    log_message(f"账户 {mask_value(username)} 处理失败: {e}", level="ERROR")
+                    results = {}
+                for machine_id in machine_ids:
+                    result = results.get(machine_id, {})
+                    if not result.get("ok"):
+                        failed.append(machine_id)
+                    if result.get("confirmed_days") is not None:
+                        delay = next_check_delay(result["confirmed_days"])
+                    elif result.get("renewed"):
+                        # 续费后未能确认新的到期时间，尽快复查
+                        delay = DAEMON_MIN_INTERVAL_HOURS * 3600
+                    else:
+                        delay = next_check_delay(result.get("remaining_days"))
+                    heapq.heappush(schedule, (time.time() + delay, username, machine_id))
+                    METRICS.set("freecloud_next_check_timestamp_seconds", round(time.time() + delay, 3),
+                                account=mask_value(username), machine=str(machine_id))
+        flush_notifications()
+        if failed:
+            dump_log_buffer(f"{len(failed)} 台服务器处理失败: {', '.join(failed)}")
+        record_run_timings(TRACER.started_at, TRACER.summary_rows())
+        record_run_finished(len(failed))
+        TRACER.export(summary=TRACE_SUMMARY, reset=True)  # 每轮检查写出一次追踪，避免常驻时无限增长
+
+    if metrics_server:
+        metrics_server.shutdown()
+    for backend in sessions.values():
+        backend.close()
+    log_message("常驻模式已退出。")
+
+def main(command="renew", check=False, shard=None, workers=None, paths=None):
+    """
+    命令行入口，各子命令共用同一个进程、同一组已导入的模块和同一次登录：
+    check 只检查运行环境和配置；status 登录并报告剩余天数，不续费；renew 检查并续费；daemon 常驻运行；
+    merge 合并各分片的结果（paths 为结果文件，默认读取 FC_SHARD_RESULTS_DIR）。
+    check 为 True 时先在同一进程中做一次环境检查，不通过则不运行。
+    shard 为 "i/N" 时只处理该分片的账户并写出分片结果（默认取 FC_SHARD）；
+    workers 大于1时在本机启动这么多个分片进程并合并结果（默认取 FC_SHARD_WORKERS）。
+    返回进程退出码：check / status / merge 有问题时为 1，分片运行因配置错误或意外错误整体失败时也为 1；
+    其余 renew / daemon 的失败通过通知和日志报告，返回 0。
+    """
+    global TRACE_FILE, METRICS_FILE
+    if command == "merge":
+        return merge_shard_results(paths)
+    if command == "check" or check:
+        if not report_environment():
+            return 1
+        if command == "check":
+            return 0
+    try:
+        # 先于其他配置解析，之后任何配置错误都能写入本分片的结果
+        current_shard = parse_shard(FC_SHARD if shard is None else shard)
+    except ValueError as ve:
+        log_message(f"脚本因配置错误终止: {ve}", level="ERROR")
+        return 1
+    workers = SHARD_WORKERS if workers is None else workers
+    if workers > 1 and not current_shard and command in ("renew", "status"):
+        code = run_shard_workers(command, workers)
+        return code if command == "status" else 0
+    if current_shard:
+        # 本机的多个分片进程不共用追踪和指标文件；指标加上分片标签，textfile collector 合并各文件时不会重复
+        TRACE_FILE, METRICS_FILE = shard_path(TRACE_FILE, current_shard), shard_path(METRICS_FILE, current_shard)
+        METRICS.labels["shard"] = f"{current_shard[0]}/{current_shard[1]}"
+    METRICS.restore()
+    RUN_POLICY.start()
+    started_at = time.time()
+    failure = None  # 运行失败的原因，结束时据此写出内存中的调试日志
+    fatal = None  # 配置错误或意外错误，分片运行时写入分片结果
+    failed = []
+    fleet_results = {}
+    try:
+        fleet_accounts = load_fleet_accounts()
+        check_env_vars(fleet=bool(fleet_accounts))
+        load_pacing_config()  # 提前校验节奏配置
+        if CASSETTE_MODE:
+            cassette = get_cassette()
+            log_message(f"{'回放' if cassette.mode == 'replay' else '录制'}模式: {cassette.path}")
+        log_message("脚本开始执行...")
+        single_account = {"username": FC_USERNAME, "password": FC_PASSWORD,
+                          "machine_ids": [m.strip() for m in (FC_MACHINE_ID or "").split(",") if m.strip()]}
+        accounts = fleet_accounts or [single_account]
+        if current_shard:
+            accounts = shard_accounts(accounts, current_shard)
+            log_message(f"分片 {current_shard[0]}/{current_shard[1]}：本分片负责 {len(accounts)} 个账户。")
+        if command == "daemon":
+            if accounts:
+                run_daemon(accounts)
+            return 0
+        renew = command != "status"
+        if fleet_accounts or current_shard:
+            fleet_results = run_fleet(accounts, renew=renew, notify_summary=current_shard is None)
+            results = [r for account_results in fleet_results.values() for r in account_results]
+        else:
+            results = run_account(single_account, renew=renew)
+        failed = [r["machine_id"] for r in results if not r["ok"]]
+        if failed:
+            failure = f"{len(failed)} 台服务器处理失败: {', '.join(failed)}"
     except ValueError as ve:
-        log_message(f"脚本因配置错误终止: {ve}")
+        log_message(f"脚本因配置错误终止: {ve}", level="ERROR")
+        fatal = f"配置错误: {ve}"
+        if command == "status":
+            failure = f"配置错误: {ve}"
     except Exception as e:
         error_details = traceback.format_exc()
         full_error_message = f"🆘 脚本执行过程中发生意外总错误: {e}\n\n```\n{error_details}\n```"
-        log_message(full_error_message)
+        log_message(full_error_message, level="ERROR")
         send_telegram_message(full_error_message, is_error=True)
+        failure = fatal = f"意外错误: {e}"
     finally:
+        flush_notifications(wait_for_delivery=True)
+        if _cassette is not None:
+            _cassette.close()
+        if failure:
+            dump_log_buffer(failure)
+        record_run_timings(TRACER.started_at, TRACER.summary_rows())
+        if command != "daemon":
+            record_run_finished(len(failed), ok=failure is None and fatal is None)  # 常驻模式在每轮检查后已经写出
+            if current_shard:
+                write_shard_results(current_shard, command, fleet_results, started_at, error=fatal)
+        TRACER.export(summary=TRACE_SUMMARY)
         log_message("脚本执行完毕。")
+    if current_shard and fatal:
+        return 1  # 分片整体失败时让 CI 任务显示失败，合并步骤也会把该分片报告为出错
+    return 1 if failure and command == "status" else 0
 
 if __name__ == "__main__":
-    main() 
+    import sys
+    import argparse
+    parser = argparse.ArgumentParser(description="Freecloud 自动续费")
+    parser.add_argument("--daemon", action="store_true", help="等同于 daemon 子命令（兼容旧的用法）")
+    subparsers = parser.add_subparsers(dest="command", metavar="{check,status,renew,daemon,merge}")
+    subparsers.add_parser("check", help="检查运行环境和配置，不联网")
+    for name, help_text in (("status", "登录并列出服务器剩余天数，不续费"),
+                            ("renew", "检查并续费（默认）"),
+                            ("daemon", "常驻运行，按剩余天数自动安排检查")):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument("--check", action="store_true", help="先在同一进程中做一次环境检查，不通过则不运行")
+        subparser.add_argument("--shard", metavar="i/N", help="只处理 N 个分片中的第 i 个（从 0 开始），默认取 FC_SHARD")
+        if name != "daemon":
+            subparser.add_argument("--workers", type=int, metavar="N",
+                                   help="在本机启动 N 个分片进程并合并结果，默认取 FC_SHARD_WORKERS")
+    merge_parser = subparsers.add_parser("merge", help="合并各分片的结果为一份报告")
+    merge_parser.add_argument("paths", nargs="*", help="分片结果文件，默认读取 FC_SHARD_RESULTS_DIR 下的全部")
+    args = parser.parse_args()
+    command = args.command or "renew"
+    if command == "renew" and (args.daemon or os.getenv("FC_DAEMON", "false").lower() == "true"):
+        command = "daemon"
+    sys.exit(main(command, check=getattr(args, "check", False), shard=getattr(args, "shard", None),
+                  workers=getattr(args, "workers", None), paths=getattr(args, "paths", None)))
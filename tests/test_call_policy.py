@@ -0,0 +1,59 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+import freecloud_renewer as fr
+
+
+class ChallengeError(Exception):
+    """模拟 cloudscraper 的 CloudflareChallengeError：不是 requests 的异常"""
+
+
+class _Response:
+    status_code = 200
+    headers = {}
+
+
+class CircuitBreakerProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = fr.CallPolicy()
+        self.policy.start(0)
+        self.breaker = fr.CircuitBreaker("example.test", threshold=1, cooldown=0)
+        self.policy.breakers["example.test"] = self.breaker
+        for name, value in (("RETRY_ATTEMPTS", 1), ("_pacing_config", fr.PACING_PROFILES["fast"])):
+            patcher = mock.patch.object(fr, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def call(self, send):
+        return self.policy.call(send, "GET", "https://example.test/")
+
+    def test_probe_raising_other_exception_releases_breaker(self):
+        def connection_error(*args, **kwargs):
+            raise requests.exceptions.ConnectionError("boom")
+
+        def challenge(*args, **kwargs):
+            raise ChallengeError("challenge")
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.call(connection_error)
+        self.assertIsNotNone(self.breaker.opened_at)
+
+        # 冷却结束后的试探请求抛出非 requests 异常
+        with self.assertRaises(ChallengeError):
+            self.call(challenge)
+        self.assertFalse(self.breaker.probing)
+
+        # 下一个请求仍然可以作为试探发出，成功后熔断器关闭
+        self.assertIsInstance(self.call(lambda *args, **kwargs: _Response()), _Response)
+        self.assertIsNone(self.breaker.opened_at)
+        self.assertFalse(self.breaker.probing)
+
+
+if __name__ == "__main__":
+    unittest.main()
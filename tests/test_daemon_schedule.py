@@ -0,0 +1,85 @@
+import os
+import sys
+import threading
+import types
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import freecloud_renewer as fr
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def hours(self):
+        return round((self.now - 1000.0) / 3600, 3)
+
+
+class DaemonScheduleTest(unittest.TestCase):
+    """常驻模式按到期时间从堆中取出服务器，同一时刻到期的同一账户服务器合并检查"""
+
+    def setUp(self):
+        self.clock = _Clock()
+        self.calls = []
+        self.stop = None
+        clock = self.clock
+
+        class Event:
+            """等待时直接拨快时钟，不真正睡眠"""
+
+            def __init__(self):
+                self.flag = False
+
+            def is_set(self):
+                return self.flag
+
+            def set(self):
+                self.flag = True
+
+            def wait(self, seconds):
+                clock.now += seconds
+
+        def capture_signal(signum, handler):
+            self.stop = handler
+
+        fake_threading = types.SimpleNamespace(**{**vars(threading), "Event": Event})
+        patches = [
+            mock.patch.object(fr, "threading", fake_threading),
+            mock.patch.object(fr.signal, "signal", capture_signal),
+            mock.patch.object(fr.time, "time", lambda: self.clock.now),
+            mock.patch.object(fr, "run_account", self.run_account),
+            # 下一次检查的间隔（小时）直接取剩余天数，便于推算顺序
+            mock.patch.object(fr, "next_check_delay", lambda days: days * 3600),
+            mock.patch.object(fr, "METRICS_PORT", 0),
+            mock.patch.object(fr, "flush_notifications", lambda *args, **kwargs: None),
+            mock.patch.object(fr, "record_run_timings", lambda *args: None),
+            mock.patch.object(fr, "record_run_finished", lambda *args, **kwargs: None),
+            mock.patch.object(fr.TRACER, "export", lambda *args, **kwargs: None),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_account(self, account, machine_ids, sessions):
+        self.calls.append((self.clock.hours(), account["username"], sorted(machine_ids)))
+        if len(self.calls) >= self.max_calls:
+            self.stop(15, None)
+        return [{"machine_id": m, "ok": True, "remaining_days": next(self.days[m])} for m in machine_ids]
+
+    def test_checks_run_in_due_order(self):
+        self.days = {"m1": iter([1, 5]), "m2": iter([3, 9]), "m3": iter([2, 1, 9])}
+        self.max_calls = 6
+        fr.run_daemon([{"username": "a", "machine_ids": ["m1", "m2"]},
+                       {"username": "b", "machine_ids": ["m3"]}])
+        self.assertEqual(sorted(self.calls[:2]), [(0, "a", ["m1", "m2"]), (0, "b", ["m3"])])
+        self.assertEqual(self.calls[2], (1, "a", ["m1"]))
+        self.assertEqual(self.calls[3], (2, "b", ["m3"]))
+        # m2 和第二次检查后的 m3 在第 3 小时同时到期，两个账户在同一轮中检查
+        self.assertEqual(sorted(self.calls[4:]), [(3, "a", ["m2"]), (3, "b", ["m3"])])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import freecloud_renewer as fr
+
+HOUR = 3600
+
+
+class HistorySkipTest(unittest.TestCase):
+    def setUp(self):
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        self.now = 1_700_000_000.0
+        for name, value in (("STATE_DIR", state_dir.name), ("HISTORY_DB", os.path.join(state_dir.name, "history.db")),
+                            ("HISTORY_ENABLED", True), ("_history_conn", None),
+                            ("HISTORY_MARGIN_DAYS", 2), ("HISTORY_MAX_SKIP_HOURS", 72),
+                            ("HISTORY_TOLERANCE_DAYS", 1.5)):
+            patcher = mock.patch.object(fr, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: fr._history_conn and fr._history_conn.close())
+        patcher = mock.patch.object(fr.time, "time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def observe(self, days, source="check"):
+        fr.record_observation("user", "m1", days, source=source)
+
+    def skip(self):
+        return fr.skip_by_history("user", "m1", days_threshold=3, announce=False)
+
+    def test_no_history_means_check(self):
+        self.assertIsNone(fr.predict_remaining_days("user", "m1"))
+        self.assertIsNone(self.skip())
+
+    def test_prediction_counts_down_from_last_check(self):
+        self.observe(10)
+        self.now += 12 * HOUR
+        predicted, age_hours = fr.predict_remaining_days("user", "m1")
+        self.assertAlmostEqual(predicted, 9.5)
+        self.assertAlmostEqual(age_hours, 12)
+        result = self.skip()
+        self.assertTrue(result["skipped"])
+        self.assertAlmostEqual(result["remaining_days"], 9.5)
+
+    def test_not_skipped_within_margin_of_threshold(self):
+        self.observe(5)
+        self.now += 12 * HOUR
+        # 推算剩余 4.75 天，不足阈值 3 + 余量 2 天
+        self.assertIsNone(self.skip())
+
+    def test_stale_history_is_not_trusted(self):
+        self.observe(30)
+        self.now += 72 * HOUR
+        self.assertIsNone(fr.predict_remaining_days("user", "m1"))
+
+    def test_misprediction_forces_a_real_check(self):
+        self.observe(20)
+        self.now += HOUR
+        self.observe(12)  # 与推算的约 19.96 天相差过大
+        self.assertIsNone(self.skip())
+        self.now += HOUR
+        self.observe(12)  # 下一次实际检查与推算相符，恢复跳过
+        self.assertIsNotNone(self.skip())
+
+    def test_confirmation_after_renewal_is_not_a_misprediction(self):
+        self.observe(2)
+        self.now += HOUR
+        self.observe(32, source="confirm")
+        self.assertIsNotNone(self.skip())
+
+
+if __name__ == "__main__":
+    unittest.main()
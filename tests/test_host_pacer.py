@@ -0,0 +1,63 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import freecloud_renewer as fr
+
+
+class HostPacerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch.object(fr.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_token_bucket_allows_burst_then_spaces_requests(self):
+        pacer = fr.HostPacer(rate=1.0, burst=2, min_gap=0)
+        waits = [pacer.reserve(0) for _ in range(4)]
+        self.assertEqual(waits, [0, 0, 1.0, 2.0])
+
+    def test_min_gap_between_reservations(self):
+        pacer = fr.HostPacer(rate=0, burst=0, min_gap=0.5)
+        self.assertEqual([pacer.reserve(0) for _ in range(3)], [0, 0.5, 1.0])
+        # 预约的时刻都已过去，不再需要等待
+        self.now += 5
+        self.assertEqual(pacer.reserve(0), 0)
+
+    def test_earliest_is_respected(self):
+        pacer = fr.HostPacer(rate=1.0, burst=1, min_gap=0)
+        self.assertEqual(pacer.reserve(self.now + 3), 3)
+        # 令牌已被上一个预约用掉，下一个请求排在它之后 1/rate 秒
+        self.assertEqual(pacer.reserve(0), 4)
+
+    def test_tokens_refill_over_time(self):
+        pacer = fr.HostPacer(rate=2.0, burst=2, min_gap=0)
+        for _ in range(2):
+            pacer.reserve(0)
+        self.now += 1
+        self.assertEqual([pacer.reserve(0), pacer.reserve(0)], [0, 0])
+
+
+class LoadPacingConfigTest(unittest.TestCase):
+    def load(self, overrides):
+        with mock.patch.object(fr, "PACING_PROFILE", "human"), mock.patch.object(fr, "PACING_OVERRIDES", overrides):
+            return fr.load_pacing_config()
+
+    def test_overrides_merge_into_profile(self):
+        config = self.load('{"min_gap": 1, "delays": {"before_login": [0, 1]}}')
+        self.assertEqual(config["min_gap"], 1)
+        self.assertEqual(config["delays"]["before_login"], [0, 1])
+        self.assertEqual(config["delays"]["after_home"], fr.PACING_PROFILES["human"]["delays"]["after_home"])
+        self.assertEqual(fr.PACING_PROFILES["human"]["min_gap"], 0.5)
+
+    def test_non_object_overrides_are_rejected(self):
+        for overrides in ("[1, 2]", "3", '{"delays": [1, 2]}'):
+            with self.assertRaisesRegex(ValueError, "FC_PACING"):
+                self.load(overrides)
+
+
+if __name__ == "__main__":
+    unittest.main()
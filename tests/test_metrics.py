@@ -0,0 +1,72 @@
+import os
+import re
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import freecloud_renewer as fr
+
+
+def _sample(text, metric):
+    match = re.search(rf'^{re.escape(metric)} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else None
+
+
+class MetricsTotalsTest(unittest.TestCase):
+    """每次运行都是新进程（新的 Metrics），计数通过 .totals.json 跨运行累加"""
+
+    def setUp(self):
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        self.path = os.path.join(state_dir.name, "metrics.prom")
+        patcher = mock.patch.object(fr, "STATE_DIR", state_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_once(self, logins, phase_seconds=()):
+        metrics = fr.Metrics()
+        metrics.restore(self.path)
+        for _ in range(logins):
+            metrics.inc("freecloud_login_attempts_total", strategy="http", outcome="success")
+        for seconds in phase_seconds:
+            metrics.observe_phase("login", seconds)
+        return metrics
+
+    def read(self):
+        with open(self.path, encoding="utf-8") as f:
+            return f.read()
+
+    def test_counters_accumulate_across_runs(self):
+        self.run_once(2).write(self.path)
+        self.run_once(3).write(self.path)
+        text = self.read()
+        self.assertEqual(_sample(text, 'freecloud_login_attempts_total{strategy="http",outcome="success"}'), 5)
+
+    def test_overlapping_runs_do_not_lose_increments(self):
+        # 两次运行都在对方写出之前读取了总数
+        first, second = self.run_once(2), self.run_once(4)
+        first.write(self.path)
+        second.write(self.path)
+        text = self.read()
+        self.assertEqual(_sample(text, 'freecloud_login_attempts_total{strategy="http",outcome="success"}'), 6)
+
+    def test_histograms_accumulate_and_render_pending_increments(self):
+        self.run_once(0, [0.1, 3]).write(self.path)
+        metrics = self.run_once(0, [50])
+        text = metrics.render()  # 尚未写出的增量也计入
+        self.assertEqual(_sample(text, 'freecloud_phase_duration_seconds_count{phase="login"}'), 3)
+        self.assertAlmostEqual(_sample(text, 'freecloud_phase_duration_seconds_sum{phase="login"}'), 53.1)
+
+    def test_corrupt_totals_start_from_zero(self):
+        with open(f"{self.path}.totals.json", "w", encoding="utf-8") as f:
+            f.write("{not json")
+        self.run_once(1).write(self.path)
+        text = self.read()
+        self.assertEqual(_sample(text, 'freecloud_login_attempts_total{strategy="http",outcome="success"}'), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
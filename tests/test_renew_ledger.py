@@ -0,0 +1,95 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import freecloud_renewer as fr
+
+
+class _Backend:
+    def __init__(self, days):
+        self.days = days
+        self.renewals = 0
+
+    def server_info(self, machine_id, inventory=None):
+        return {"remaining_days": self.days, "id_sn": machine_id}
+
+    def renew(self, server_id_sn):
+        self.renewals += 1
+        self.days += 30
+        return True, "续费成功"
+
+    def confirm(self, server_id_sn, previous_days):
+        return self.days, 0.0
+
+
+class RenewLedgerTest(unittest.TestCase):
+    def setUp(self):
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        self.now = 1_700_000_000.0
+        for name, value in (("STATE_DIR", state_dir.name), ("HISTORY_DB", os.path.join(state_dir.name, "history.db")),
+                            ("HISTORY_ENABLED", False), ("RENEW_LEDGER_ENABLED", True), ("RENEW_LEDGER_MINUTES", 60),
+                            ("_history_conn", None), ("send_telegram_message", lambda *args, **kwargs: None)):
+            patcher = mock.patch.object(fr, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: fr._history_conn and fr._history_conn.close())
+        patcher = mock.patch.object(fr.time, "time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def check(self, backend):
+        return fr.check_and_renew_machine(backend, "m1", days_threshold=3, username="user")
+
+    def test_pending_then_finished(self):
+        submitted_at = fr.ledger_begin("user", "m1", 2)
+        self.assertEqual(fr.recent_renewal("user", "m1")["status"], "pending")
+        fr.ledger_finish("user", "m1", submitted_at, True, "续费成功", 32)
+        previous = fr.recent_renewal("user", "m1")
+        self.assertEqual((previous["status"], previous["days_before"], previous["days_after"]), ("ok", 2, 32))
+
+    def test_failed_and_old_renewals_are_not_reused(self):
+        fr.ledger_finish("user", "m1", fr.ledger_begin("user", "m1", 2), False, "余额不足")
+        self.assertIsNone(fr.recent_renewal("user", "m1"))
+        fr.ledger_finish("user", "m1", fr.ledger_begin("user", "m1", 2), True, "续费成功", 32)
+        self.now += 61 * 60
+        self.assertIsNone(fr.recent_renewal("user", "m1"))
+
+    def test_recent_success_is_reused_not_resubmitted(self):
+        fr.ledger_finish("user", "m1", fr.ledger_begin("user", "m1", 2), True, "续费成功", 32)
+        backend = _Backend(2)
+        result = self.check(backend)
+        self.assertTrue(result["reused"])
+        self.assertEqual(result["remaining_days"], 32)
+        self.assertEqual(backend.renewals, 0)
+
+    def test_pending_renewal_that_took_effect_is_settled(self):
+        # 另一次运行提交后中途退出：检查时列表还是旧值，重新读取时剩余天数已经增加
+        fr.ledger_begin("user", "m1", 2)
+        self.now += 60
+        backend = _Backend(2)
+        readings = iter([2, 32])
+        backend.server_info = lambda machine_id, inventory=None: {"remaining_days": next(readings), "id_sn": machine_id}
+        result = self.check(backend)
+        self.assertTrue(result["reused"])
+        self.assertEqual(backend.renewals, 0)
+        previous = fr.recent_renewal("user", "m1")
+        self.assertEqual((previous["status"], previous["days_after"]), ("ok", 32))
+
+    def test_pending_renewal_that_did_not_take_effect_is_resubmitted(self):
+        fr.ledger_begin("user", "m1", 2)
+        self.now += 60
+        backend = _Backend(2)
+        result = self.check(backend)
+        self.assertTrue(result["renewed"])
+        self.assertEqual(backend.renewals, 1)
+        rows = fr._history_execute("SELECT status FROM renew_ledger ORDER BY submitted_at, rowid", enabled=True)
+        self.assertEqual([r[0] for r in rows], ["failed", "ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
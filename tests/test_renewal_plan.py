@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import freecloud_renewer as fr
+
+
+class ChooseRenewMonthsTest(unittest.TestCase):
+    def test_largest_option_within_cap(self):
+        options = [1, 3, 6, 12]
+        self.assertEqual(fr.choose_renew_months(options, 1), 1)
+        self.assertEqual(fr.choose_renew_months(options, 5), 3)
+        self.assertEqual(fr.choose_renew_months(options, 12), 12)
+
+    def test_never_exceeds_cap(self):
+        self.assertIsNone(fr.choose_renew_months([3, 6], 1))
+
+    def test_page_without_options_renews_one_month(self):
+        self.assertEqual(fr.choose_renew_months([], 6), 1)
+
+
+class RenewalReasonTest(unittest.TestCase):
+    def test_due_ahead_and_not_needed(self):
+        reason = lambda days: fr.renewal_reason(days, days_threshold=3, ahead_days=2)
+        self.assertEqual(reason(2.9), "due")
+        self.assertEqual(reason(3), "ahead")
+        self.assertEqual(reason(4.9), "ahead")
+        self.assertIsNone(reason(5))
+        self.assertIsNone(reason(None))
+
+    def test_ahead_is_off_by_default(self):
+        with mock.patch.object(fr, "RENEW_AHEAD_DAYS", 0):
+            self.assertIsNone(fr.renewal_reason(3.5, days_threshold=3))
+
+    def test_plan_renewals(self):
+        inventory = {"m1": {"remaining_days": 1}, "m2": {"remaining_days": 4}, "m3": {"remaining_days": 20}}
+        with mock.patch.object(fr, "RENEW_AHEAD_DAYS", 2):
+            plan = fr.plan_renewals(["m1", "m2", "m3", "m4"], inventory, days_threshold=3)
+        self.assertEqual(plan, {"m1": "due", "m2": "ahead", "m3": None, "m4": None})
+
+
+class _Backend:
+    """续费总被网站拒绝的后端"""
+
+    def __init__(self, days):
+        self.days = days
+        self.renewals = 0
+
+    def server_info(self, machine_id, inventory=None):
+        return {"remaining_days": self.days, "id_sn": machine_id}
+
+    def renew(self, server_id_sn):
+        self.renewals += 1
+        return False, "暂不支持提前续费"
+
+
+class RejectedAheadRenewalTest(unittest.TestCase):
+    def setUp(self):
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        for name, value in (("STATE_DIR", state_dir.name), ("HISTORY_DB", os.path.join(state_dir.name, "history.db")),
+                            ("HISTORY_ENABLED", False), ("RENEW_LEDGER_ENABLED", True), ("_history_conn", None),
+                            ("RENEW_AHEAD_DAYS", 5), ("send_telegram_message", lambda *args, **kwargs: None)):
+            patcher = mock.patch.object(fr, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: fr._history_conn and fr._history_conn.close())
+
+    def check(self, backend):
+        return fr.check_and_renew_machine(backend, "m1", days_threshold=3, username="user")
+
+    def test_rejected_ahead_renewal_is_not_retried_until_due(self):
+        backend = _Backend(6)
+        result = self.check(backend)
+        self.assertTrue(result["ok"])
+        self.assertEqual(backend.renewals, 1)
+        self.assertTrue(fr.ahead_rejected("user", "m1", 6))
+
+        backend.days = 5
+        self.assertEqual(self.check(backend)["message"], "无需续费")
+        self.assertEqual(backend.renewals, 1)
+        self.assertEqual(fr.plan_renewals(["m1"], {"m1": {"remaining_days": 5}}, 3, username="user"), {"m1": None})
+
+        # 低于阈值后照常续费
+        backend.days = 2
+        self.assertFalse(self.check(backend)["ok"])
+        self.assertEqual(backend.renewals, 2)
+
+    def test_rejection_expires_once_days_go_up(self):
+        self.check(_Backend(6))
+        # 在别处续费后剩余天数增加，进入新的提前续费窗口
+        self.assertFalse(fr.ahead_rejected("user", "m1", 7.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
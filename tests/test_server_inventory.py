@@ -0,0 +1,68 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import freecloud_renewer as fr
+
+
+def _row(id_sn, days, status="运行中"):
+    return (f'<tr><td>{id_sn}</td><td>{status}</td><td>到期: {days}天后</td>'
+            f'<td><a href="/server/detail/{id_sn}">管理</a></td></tr>')
+
+
+def _listing(rows, pages):
+    pager = "".join(f'<a href="/server/lxc?page={p}">{p}</a>' for p in pages)
+    return f'<table>{"".join(rows)}</table><div class="pager">{pager}</div>'
+
+
+class ParseServerInventoryTest(unittest.TestCase):
+    def test_rows_are_parsed_by_detail_link(self):
+        html = _listing([_row("a1", 5), _row("b2", 12, "已停止")], [])
+        inventory = fr.parse_server_inventory(html)
+        self.assertEqual(inventory["a1"]["remaining_days"], 5)
+        self.assertEqual(inventory["b2"]["status"], "已停止")
+        self.assertEqual(inventory["b2"]["detail_url"], f"{fr.BASE_URL}/server/detail/b2")
+
+    def test_machine_outside_rows_falls_back_to_nearby_days(self):
+        html = _listing([_row("a1", 5)], []) + "<p>说明</p>" * 100 + '<div>c3 将在 9天后 到期</div>'
+        self.assertNotIn("c3", fr.parse_server_inventory(html))
+        self.assertEqual(fr.parse_server_inventory(html, ["c3"])["c3"]["remaining_days"], 9)
+
+
+class FetchServerInventoryPaginationTest(unittest.TestCase):
+    def setUp(self):
+        self.requested = []
+        patcher = mock.patch.object(fr, "get_page", self.get_page)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_page(self, session, url, params=None, **kwargs):
+        page = (params or {}).get("page", 1)
+        self.requested.append(page)
+        return self.pages[page]
+
+    def test_follows_page_links_found_on_later_pages(self):
+        # 分页只列出相邻的页码，第 3 页要从第 2 页上才能看到
+        self.pages = {
+            1: _listing([_row("a1", 5)], [1, 2]),
+            2: _listing([_row("b2", 6)], [1, 2, 3]),
+            3: _listing([_row("c3", 7)], [2, 3]),
+        }
+        inventory = fr.fetch_server_inventory(object())
+        self.assertEqual(self.requested, [1, 2, 3])
+        self.assertEqual(sorted(inventory), ["a1", "b2", "c3"])
+
+    def test_stops_at_page_cap_and_warns(self):
+        self.pages = {p: _listing([_row(f"m{p}", p)], range(1, 6)) for p in range(1, 6)}
+        with mock.patch.object(fr, "INVENTORY_MAX_PAGES", 2), mock.patch.object(fr, "log_message") as log:
+            inventory = fr.fetch_server_inventory(object())
+        self.assertEqual(self.requested, [1, 2])
+        self.assertEqual(sorted(inventory), ["m1", "m2"])
+        self.assertTrue(any(call.kwargs.get("level") == "WARNING" for call in log.call_args_list))
+
+
+if __name__ == "__main__":
+    unittest.main()
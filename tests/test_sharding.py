@@ -0,0 +1,58 @@
+import collections
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import freecloud_renewer as fr
+
+USERNAMES = [f"user{i:04d}@example.com" for i in range(2000)]
+
+
+class ShardOfTest(unittest.TestCase):
+    def test_assignment_is_stable(self):
+        # 分配只取决于用户名和分片数，不随进程变化（不能用内置 hash()），固定几个值防止哈希方式被改动
+        expected = {"alice": 2, "bob": 2, "carol@example.com": 1, "用户甲": 0, "dave": 1}
+        self.assertEqual({u: fr.shard_of(u, 4) for u in expected}, expected)
+        fr._shard_ring.cache_clear()
+        self.assertEqual({u: fr.shard_of(u, 4) for u in expected}, expected)
+
+    def test_single_shard_takes_everything(self):
+        self.assertEqual({fr.shard_of(u, 1) for u in USERNAMES[:50]}, {0})
+
+    def test_shards_are_roughly_balanced(self):
+        counts = collections.Counter(fr.shard_of(u, 4) for u in USERNAMES)
+        self.assertEqual(set(counts), {0, 1, 2, 3})
+        for count in counts.values():
+            self.assertTrue(250 <= count <= 750, counts)
+
+    def test_adding_a_shard_only_moves_accounts_to_it(self):
+        before = {u: fr.shard_of(u, 4) for u in USERNAMES}
+        after = {u: fr.shard_of(u, 5) for u in USERNAMES}
+        moved = [u for u in USERNAMES if before[u] != after[u]]
+        self.assertEqual({after[u] for u in moved}, {4})
+        # 约 1/5 的账户换到新分片，而不是几乎全部重新分配
+        self.assertLess(len(moved), len(USERNAMES) * 0.3)
+
+    def test_shard_accounts_partitions_the_fleet(self):
+        accounts = [{"username": u} for u in USERNAMES[:200]]
+        shards = [fr.shard_accounts(accounts, (i, 3)) for i in range(3)]
+        names = [a["username"] for shard in shards for a in shard]
+        self.assertEqual(sorted(names), sorted(USERNAMES[:200]))
+
+
+class ParseShardTest(unittest.TestCase):
+    def test_valid_specs(self):
+        self.assertEqual(fr.parse_shard("0/4"), (0, 4))
+        self.assertEqual(fr.parse_shard(" 3 / 4 "), (3, 4))
+        self.assertIsNone(fr.parse_shard(""))
+
+    def test_invalid_specs(self):
+        for spec in ("4/4", "1", "a/b", "-1/2", "1/0"):
+            with self.assertRaises(ValueError):
+                fr.parse_shard(spec)
+
+
+if __name__ == "__main__":
+    unittest.main()
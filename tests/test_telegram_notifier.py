@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+import freecloud_renewer as fr
+
+
+def _response(status, body, headers=None):
+    response = requests.models.Response()
+    response.status_code = status
+    response._content = body.encode("utf-8")
+    response.headers.update(headers or {})
+    return response
+
+
+class _Http:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.posts = 0
+
+    def post(self, *args, **kwargs):
+        self.posts += 1
+        return self.responses.pop(0)
+
+
+class TelegramRateLimitTest(unittest.TestCase):
+    def setUp(self):
+        self.notifier = fr.TelegramNotifier("token", "chat", digest=False)
+        patcher = mock.patch.object(fr.time, "sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_html_429_is_retried_not_dropped(self):
+        self.notifier.http = _Http([
+            _response(429, "<html>Too Many Requests</html>", {"Retry-After": "7"}),
+            _response(200, '{"ok": true}'),
+        ])
+        self.notifier._send("失败报告")
+        self.assertEqual(self.notifier.http.posts, 2)
+        self.sleep.assert_any_call(7.0)
+
+    def test_retry_after_falls_back_to_backoff(self):
+        self.assertEqual(fr.TelegramNotifier._retry_after(
+            _response(429, '{"parameters": {"retry_after": 3}}'), 0), 3.0)
+        delay = fr.TelegramNotifier._retry_after(_response(429, "<html></html>"), 2)
+        self.assertTrue(4 <= delay <= 5)
+
+
+if __name__ == "__main__":
+    unittest.main()